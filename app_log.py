@@ -0,0 +1,86 @@
+"""
+日志模块 - 分级日志，默认级别 INFO，调试输出关闭时不做任何格式化
+
+用法:
+    from app_log import log
+    log.debug("add_border: width=%s, color=%s", width, color)  # 参数只在启用 DEBUG 时才格式化
+    if log.isEnabledFor(app_log.DEBUG): ...                    # 参数本身计算开销大时先判断
+
+开启调试输出 (输出格式与原来的 print 相同，如 "[DEBUG] ..."):
+    环境变量 TUPIAN_LOG_LEVEL=DEBUG，或 settings.json 中 "log_level": "DEBUG"
+"""
+
+import os
+import sys
+import logging
+from logging import DEBUG, WARNING, ERROR
+
+ENV_VAR = 'TUPIAN_LOG_LEVEL'
+DEFAULT_LEVEL = 'INFO'
+
+_PREFIXES = {DEBUG: '[DEBUG] ', WARNING: '[WARN] ', ERROR: '[ERROR] ', logging.CRITICAL: '[ERROR] '}
+
+log = logging.getLogger('tupian')
+
+_settings_level = DEFAULT_LEVEL  # settings.json 中的级别 (保存设置时原样写回)
+
+
+class _Formatter(logging.Formatter):
+    def format(self, record):
+        return _PREFIXES.get(record.levelno, '') + super().format(record)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """每次输出时取当前的 sys.stdout (与 print 一致，redirect_stdout 同样生效)"""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+    def emit(self, record):
+        if sys.stdout is not None:  # 无控制台的打包程序中 stdout 为 None
+            super().emit(record)
+
+
+def set_level(level):
+    """设置日志级别 (级别名如 'DEBUG' 或 logging 常量)，返回是否有效"""
+    if isinstance(level, str):
+        level = logging.getLevelName(level.strip().upper())
+    if not isinstance(level, int):
+        return False
+    log.setLevel(level)
+    return True
+
+
+def configure_from_settings(level):
+    """应用 settings.json 中的 log_level (设置了环境变量时以环境变量为准)"""
+    global _settings_level
+    if not level:
+        return
+    _settings_level = level
+    if not os.environ.get(ENV_VAR):
+        set_level(level)
+
+
+def settings_level():
+    """写回 settings.json 的级别 (不包括环境变量的临时设置)"""
+    return _settings_level
+
+
+def _configure():
+    if log.handlers:
+        return
+    handler = _StdoutHandler()
+    handler.setFormatter(_Formatter('%(message)s'))
+    log.addHandler(handler)
+    log.propagate = False
+    env_level = os.environ.get(ENV_VAR)
+    if not (env_level and set_level(env_level)):
+        set_level(DEFAULT_LEVEL)
+
+
+_configure()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+命令行批量处理 (无界面) - 一次性处理或持续监视输入目录
+
+任务参数默认读取输出目录中的 .batch_job.json (界面中批量导出或开始监视时自动保存)。
+
+用法:
+    python batch_cli.py -i 输入目录 -o 输出目录
+    python batch_cli.py -i 输入目录 -o 输出目录 --watch
+    python batch_cli.py -i 输入目录 -o 输出目录 --spec job.json --captions 配文.xlsx
+    python batch_cli.py -i 输入目录 -o 输出目录 --diagnostics 10   # 每 10 项做一次 CPU 分析
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import input_scanner
+import batch_manifest
+import hot_folder
+import text_sources
+import image_encoder
+import stage_timer
+from diagnostics import diagnostics
+import app_log
+from batch_renderer import BatchRenderer
+from keyword_service import keyword_service
+from auth_manager import auth
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='图片套版 - 命令行批量处理')
+    parser.add_argument('-i', '--input', required=True, help='输入目录')
+    parser.add_argument('-o', '--output', required=True, help='输出目录')
+    parser.add_argument('--spec', help=f'任务参数文件 (默认: 输出目录/{hot_folder.JOB_SPEC_FILENAME})')
+    parser.add_argument('--captions', help='配文文件 (Excel / CSV / JSONL)')
+    parser.add_argument('--profile', choices=sorted(image_encoder.ENCODER_PROFILES),
+                        help='编码档位 (默认使用任务参数中的设置)')
+    parser.add_argument('--format', dest='output_format', choices=list(image_encoder.OUTPUT_FORMATS),
+                        help='输出格式 (source=与原图相同, png8=调色板 PNG, auto=画质达标的最小格式)')
+    parser.add_argument('--timing', action='store_true',
+                        help=f'统计各渲染阶段耗时 (结束时输出并保存到 输出目录/{stage_timer.TIMING_FILENAME})')
+    parser.add_argument('--diagnostics', nargs='?', type=int, const=diagnostics.sample_every, metavar='N',
+                        help=f'诊断: 每 N 项做一次 CPU 分析，并记录内存分配 (报告写入 {diagnostics.output_dir})')
+    parser.add_argument('-v', '--verbose', action='store_true', help=f'输出调试日志 (同环境变量 {app_log.ENV_VAR}=DEBUG)')
+    parser.add_argument('--watch', action='store_true', help='持续监视输入目录')
+    parser.add_argument('--no-recursive', action='store_true', help='不扫描子目录')
+    parser.add_argument('--no-mirror', action='store_true', help='输出不保留子目录结构')
+    parser.add_argument('--poll', type=float, default=hot_folder.POLL_INTERVAL, help='监视轮询间隔 (秒)')
+    parser.add_argument('--settle', type=float, default=hot_folder.SETTLE_TIME, help='文件多久不变视为写入完成 (秒)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.verbose:
+        app_log.set_level(app_log.DEBUG)
+    if not os.path.isdir(args.input):
+        print(f"错误: 输入目录不存在 {args.input}")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+    if args.watch and input_scanner.same_directory(args.output, args.input):
+        print("错误: 监视模式的输出目录不能与输入目录相同 (输出会被再次处理)")
+        return 1
+
+    spec_path = args.spec or os.path.join(args.output, hot_folder.JOB_SPEC_FILENAME)
+    try:
+        spec = hot_folder.load_job_spec(spec_path)
+    except Exception as e:
+        print(f"错误: 无法读取任务参数 {spec_path}: {e}")
+        return 1
+
+    if args.profile:
+        spec['encoder'] = args.profile
+    if args.output_format:
+        spec['output_format'] = args.output_format
+
+    text_source = text_sources.TextSource()
+    if args.captions:
+        text_source = text_sources.load_text_source(args.captions)
+        text_sources.record_read(args.captions, len(text_source.mapping), text_source.sequence_count)
+    text_mapping = text_source.mapping
+    # 顺序配文按处理序号流式读取 (只在一次性处理时使用，监视模式没有序号)
+    text_sequence = text_source.sequence_cursor()
+    editor_content = (spec.get('text_layer') or {}).get('content')
+    use_text = spec.get('use_text')
+
+    # 随机高亮需要 jieba，提前在后台加载
+    if use_text:
+        keyword_service.warm_up()
+
+    renderer = BatchRenderer(spec)
+    if args.timing:
+        stage_timer.enable()
+    manifest = batch_manifest.BatchManifest(args.output)
+    recursive = not args.no_recursive
+    mirror = not args.no_mirror
+    counts = {'done': 0, 'skipped': 0, 'failed': 0}
+    encoded = [0]  # 本次输出的总字节数
+    if args.diagnostics is not None:
+        diagnostics.configure(enabled=True, sample_every=args.diagnostics)
+    diag_session = diagnostics.session('batch_cli', cpu=False).start()
+    seen = [0]  # 已处理项数 (诊断采样用)
+
+    def handle(item, index=None):
+        text_content = None
+        if use_text:
+            text_content = text_mapping.get(os.path.basename(item.path))
+            if not text_content and index is not None and index < text_source.sequence_count:
+                text_content = text_sequence.get(index)
+            text_content = text_content or editor_content
+        print(f"处理: {os.path.join(item.rel_dir, os.path.basename(item.path))}")
+        item_profile = diagnostics.sample_item(seen[0], os.path.basename(item.path))
+        seen[0] += 1
+        if item_profile:
+            with item_profile:
+                status, path = hot_folder.process_file(renderer, item, args.output, text_content,
+                                                       manifest=manifest, mirror=mirror)
+            print(f"  诊断报告: {item_profile.dump()}")
+        else:
+            status, path = hot_folder.process_file(renderer, item, args.output, text_content,
+                                                   manifest=manifest, mirror=mirror)
+        counts[status] += 1
+        if status == 'done':
+            encoded[0] += os.path.getsize(path)
+            allowed, msg = auth.increment_usage(1)
+            if not allowed:
+                print(f"[STOP] {msg}")
+                return False
+        return True
+
+    try:
+        if not args.watch:
+            for index, item in enumerate(input_scanner.scan_images(args.input, recursive=recursive,
+                                                                   exclude=args.output)):
+                if not handle(item, index):
+                    break
+        else:
+            def on_ready(item):
+                if not handle(item):
+                    watcher.stop()
+
+            watcher = hot_folder.HotFolderWatcher(args.input, on_ready, recursive=recursive,
+                                                  poll_interval=args.poll, settle_time=args.settle,
+                                                  exclude=args.output)
+            watcher.start()
+            print(f"正在监视 {args.input} (Ctrl+C 退出)")
+            try:
+                while watcher.is_running():
+                    time.sleep(0.5)
+            except KeyboardInterrupt:
+                watcher.stop()
+            watcher.join()
+    finally:
+        text_sequence.close()
+        manifest.close()
+        diag_session.stop()
+        if args.timing:
+            stage_timer.disable()
+            stats = stage_timer.summary()
+            print("各阶段耗时 (ms):")
+            for line in stage_timer.format_summary(stats):
+                print(f"  {line}")
+            stage_timer.export_json(os.path.join(args.output, stage_timer.TIMING_FILENAME), stats)
+
+    print(f"完成: 成功 {counts['done']}，跳过 {counts['skipped']}，失败 {counts['failed']}，"
+          f"输出 {image_encoder.format_bytes(encoded[0])}")
+    return 0 if counts['failed'] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+批量日志模块 - 日志先缓冲再定时批量写入日志框 (限制刷新频率和行数)，
+同时把完整的结构化日志 (JSON Lines) 写入输出目录
+
+只在界面线程中调用 (后台线程请先用 after(0, ...) 切回界面线程)。
+"""
+
+import os
+import json
+import time
+
+LOG_FILENAME = '.batch_log.jsonl'
+
+# 日志框最多每隔多少毫秒刷新一次、最多保留多少行
+FLUSH_INTERVAL_MS = 250
+MAX_LINES = 2000
+
+
+class BatchLogSink:
+    """批量处理日志输出
+
+    Args:
+        widget: tk.Text 日志框 (平时为 DISABLED 状态)
+        flush_interval_ms: 刷新间隔
+        max_lines: 日志框保留的最大行数 (超出时删除最早的行，完整日志见日志文件)
+    """
+
+    def __init__(self, widget, flush_interval_ms=FLUSH_INTERVAL_MS, max_lines=MAX_LINES):
+        self.widget = widget
+        self.flush_interval_ms = flush_interval_ms
+        self.max_lines = max_lines
+        self._pending = []
+        self._scheduled = None
+        self._file = None
+        self.log_path = None
+
+    def write(self, message):
+        """追加一行日志 (定时刷新到日志框)"""
+        self._pending.append(message)
+        if self._file:
+            self.record('log', msg=message)
+        if self._scheduled is None:
+            self._scheduled = self.widget.after(self.flush_interval_ms, self.flush)
+
+    def flush(self):
+        """立即把缓冲的日志写入日志框"""
+        if self._scheduled is not None:
+            self.widget.after_cancel(self._scheduled)
+            self._scheduled = None
+        if self._file:
+            self._file.flush()
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+
+        w = self.widget
+        w.config(state='normal')
+        w.insert('end', '\n'.join(lines) + '\n')
+        # 'end-1c' 位于最后一个换行之后，行号减一即为已有行数
+        line_count = int(w.index('end-1c').split('.')[0]) - 1
+        if line_count > self.max_lines:
+            w.delete('1.0', f'{line_count - self.max_lines + 1}.0')
+        w.see('end')  # 自动滚动到底部
+        w.config(state='disabled')
+
+    # ---- 结构化日志文件 ----
+
+    def open_file(self, output_dir):
+        """开始把结构化日志追加写入输出目录 (失败时只输出到日志框)"""
+        self.close_file()
+        try:
+            self.log_path = os.path.join(output_dir, LOG_FILENAME)
+            self._file = open(self.log_path, 'a', encoding='utf-8')
+        except OSError as e:
+            print(f"[WARN] 无法写入批量日志文件: {e}")
+            self._file = None
+            self.log_path = None
+        return self.log_path
+
+    def record(self, event, **fields):
+        """写入一条结构化记录，如 record('item', item=路径, stage='done', durations={...})"""
+        if not self._file:
+            return
+        entry = {'ts': round(time.time(), 3), 'event': event}
+        entry.update(fields)
+        try:
+            self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        except Exception as e:
+            print(f"[WARN] 写入批量日志失败: {e}")
+
+    def close_file(self):
+        if self._file:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
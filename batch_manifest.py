@@ -0,0 +1,195 @@
+"""
+批量处理清单模块 - 使用 SQLite 记录每个输入的处理状态，支持断点续跑和增量处理
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# 清单文件名 (保存在输出目录中)
+MANIFEST_FILENAME = '.batch_manifest.sqlite'
+
+# 状态
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+_HASH_CHUNK = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    input_key    TEXT PRIMARY KEY,
+    size         INTEGER,
+    mtime        REAL,
+    content_hash TEXT,
+    spec_hash    TEXT,
+    output_path  TEXT,
+    status       TEXT,
+    started_at   REAL,
+    finished_at  REAL,
+    duration     REAL,
+    error        TEXT
+)
+"""
+
+
+def file_hash(path):
+    """分块计算文件内容哈希"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def text_hash(text):
+    """文字内容哈希"""
+    return hashlib.blake2b((text or '').encode('utf-8'), digest_size=20).hexdigest()
+
+
+def spec_hash(spec, *extra):
+    """任务参数哈希 (字典按键排序后序列化)"""
+    payload = json.dumps([spec, list(extra)], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+
+class BatchManifest:
+    """批量处理清单
+
+    每个输入一行：内容哈希、参数哈希、输出路径、状态和耗时。
+    - 输入和参数都未变化且输出文件仍存在的项可直接跳过
+    - 中断后状态仍为 running 的项会在下次运行时重新处理
+    """
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            # WAL + NORMAL: 每项提交一次的开销很小，且进程被杀时不会损坏数据库
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        except sqlite3.DatabaseError:
+            pass
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _row(self, input_key):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT size, mtime, content_hash, spec_hash, output_path, status '
+                'FROM items WHERE input_key = ?', (input_key,)
+            ).fetchone()
+
+    def content_hash(self, path, stat=None):
+        """输入文件内容哈希 (大小和修改时间未变时复用已记录的哈希，避免重复读文件)"""
+        stat = stat or os.stat(path)
+        row = self._row(path)
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime and row[2]:
+            return row[2]
+        return file_hash(path)
+
+    def lookup_done(self, input_key, content_hash, spec_hash):
+        """已完成且未变化时返回输出路径，否则返回 None"""
+        row = self._row(input_key)
+        if not row:
+            return None
+        _, _, done_hash, done_spec, output_path, status = row
+        if status != STATUS_DONE or done_hash != content_hash or done_spec != spec_hash:
+            return None
+        if not output_path or not os.path.exists(output_path):
+            return None
+        return output_path
+
+    def mark_running(self, input_key, content_hash, spec_hash, stat=None):
+        """标记开始处理 (stat: 输入文件状态，文字项为 None)"""
+        size, mtime = None, None
+        if stat is not None:
+            size, mtime = stat.st_size, stat.st_mtime
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO items '
+                '(input_key, size, mtime, content_hash, spec_hash, output_path, status, '
+                ' started_at, finished_at, duration, error) '
+                'VALUES (?, ?, ?, ?, ?, NULL, ?, ?, NULL, NULL, NULL)',
+                (input_key, size, mtime, content_hash, spec_hash, STATUS_RUNNING, time.time())
+            )
+            self._conn.commit()
+
+    def _finish(self, input_key, status, output_path=None, error=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'UPDATE items SET status = ?, output_path = ?, error = ?, finished_at = ?, '
+                'duration = ? - started_at WHERE input_key = ?',
+                (status, output_path, error, now, now, input_key)
+            )
+            self._conn.commit()
+
+    def mark_done(self, input_key, output_path):
+        """标记处理成功"""
+        self._finish(input_key, STATUS_DONE, output_path=output_path)
+
+    def mark_failed(self, input_key, error):
+        """标记处理失败 (开始处理之前就失败、还没有记录时新增一条)"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO items (input_key, status, started_at) VALUES (?, ?, ?)',
+                (input_key, STATUS_RUNNING, now)
+            )
+        self._finish(input_key, STATUS_FAILED, error=str(error))
+
+    def pending_paths(self, paths):
+        """按文件大小和修改时间快速筛选出尚未完成的输入 (不读取文件内容)
+
+        paths 可以是路径字符串或 input_scanner.ScannedFile (复用其缓存的 stat)
+        """
+        done = self.done_records()
+        return [path for path in paths if is_pending(path, done)]
+
+    def done_records(self):
+        """已完成项: 输入路径 -> (大小, 修改时间)"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT input_key, size, mtime FROM items WHERE status = ?', (STATUS_DONE,)
+            ).fetchall()
+        return {key: (size, mtime) for key, size, mtime in rows}
+
+    def summary(self):
+        """各状态计数"""
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM items GROUP BY status').fetchall()
+        return dict(rows)
+
+
+def is_pending(path, done):
+    """对照 done_records() 判断输入是否仍需处理 (只对已完成过的路径 stat)"""
+    record = done.get(os.fspath(path))
+    if not record:
+        return True
+    try:
+        stat = path.stat() if hasattr(path, 'stat') else os.stat(path)
+    except OSError:
+        return True
+    return record != (stat.st_size, stat.st_mtime)
+
+
+def open_manifest(output_dir):
+    """打开输出目录中的清单，失败时返回 None (不影响批量处理)"""
+    if not output_dir or not os.path.isdir(output_dir):
+        return None
+    try:
+        return BatchManifest(output_dir)
+    except Exception as e:
+        print(f"[ERROR] 无法打开批量清单: {e}")
+        return None
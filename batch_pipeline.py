@@ -0,0 +1,256 @@
+"""
+批量流水线模块 - 读取/解码、合成、编码三个阶段并行，用有界队列限制内存占用
+
+    submit() → [读取线程: 读文件字节 + 解码] → [合成线程] → [编码线程池: 保存] → results()
+
+- 读取线程提前读取后续文件 (网络盘上可以隐藏大部分 I/O 延迟)
+- 合成只在一个线程中进行 (字体、随机数、关键词服务都不需要加锁)
+- 编码/保存由线程池完成 (Pillow 压缩时会释放 GIL)
+"""
+
+import os
+import time
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from diagnostics import diagnostics
+
+# 队列容量：提交 → 读取、读取 → 合成、合成 → 编码
+DEFAULT_PREFETCH = 8
+DEFAULT_DECODED = 4
+DEFAULT_ENCODE = 4
+
+_SENTINEL = object()
+
+
+def default_encoder_count():
+    """编码线程数 (保留一个核给合成线程)"""
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+class PipelineJob:
+    """流水线中的一项
+
+    Attributes:
+        img_path: 源图片路径 (None 表示纯文字)
+        text_content: 配文
+        save_path: 输出路径 (输出格式改变扩展名时，保存后更新为实际路径)
+        context: 调用方附带的数据 (结果返回时原样带回)
+        logs: 本项的日志行 (渲染参数等)，结果返回时由调用方统一输出
+        ok: 是否保存成功
+        error: 失败原因
+        encoded_bytes: 编码后的字节数
+        timings: 各阶段耗时 (秒)，键为 read / decode / composite / encode
+        diag: 被诊断采样时的 ItemProfile (见 diagnostics.py)，否则为 None
+    """
+
+    __slots__ = ('img_path', 'text_content', 'save_path', 'context', 'logs',
+                 'image', 'composite', 'ok', 'error', 'encoded_bytes', 'timings', 'diag')
+
+    def __init__(self, img_path, text_content, save_path, context=None, logs=None):
+        self.img_path = img_path
+        self.text_content = text_content
+        self.save_path = save_path
+        self.context = context if context is not None else {}
+        self.logs = logs if logs is not None else []
+        self.image = None
+        self.composite = None
+        self.ok = False
+        self.error = None
+        self.encoded_bytes = 0
+        self.timings = {}
+        self.diag = None
+
+
+class BatchPipeline:
+    """三段式批量流水线
+
+    Args:
+        renderer: BatchRenderer (只在合成线程中使用)
+        prefetch: 读取阶段最多提前准备的项数
+        encoders: 编码线程数
+        profile: 编码档位 (默认使用任务参数中的 encoder)
+        output_format: 输出格式 (默认使用任务参数中的 output_format)
+    """
+
+    def __init__(self, renderer, prefetch=DEFAULT_PREFETCH, encoders=None, profile=None, output_format=None):
+        self.renderer = renderer
+        self.profile = profile or renderer.spec.get('encoder')
+        self.output_format = output_format or renderer.spec.get('output_format')
+        self.dpi = renderer.spec.get('dpi')
+        self.encoders = encoders or default_encoder_count()
+        decoded, encode_queue = DEFAULT_DECODED, DEFAULT_ENCODE
+        if renderer.tiled:
+            # 大尺寸预设 (分块渲染) 每项的解码图片有数百 MB，JPEG / WebP 保存时还要拼出整幅图片：
+            # 解码、合成、编码各阶段只保留一项
+            decoded, encode_queue, self.encoders = 1, 0, 1
+
+        self._submit_q = queue.Queue(maxsize=prefetch)
+        self._decoded_q = queue.Queue(maxsize=decoded)
+        self._results = queue.Queue()
+        # 编码阶段容量: 排队 + 正在编码
+        self._encode_slots = threading.BoundedSemaphore(encode_queue + self.encoders)
+        self._pool = ThreadPoolExecutor(max_workers=self.encoders, thread_name_prefix='batch-encode')
+
+        self._cancelled = threading.Event()
+        self._in_flight = 0
+        self._seq = 0  # 读取线程中的序号 (诊断采样用)
+        self._lock = threading.Lock()
+
+        self._reader = threading.Thread(target=self._read_loop, name='batch-read', daemon=True)
+        self._compositor = threading.Thread(target=self._composite_loop, name='batch-composite', daemon=True)
+        self._reader.start()
+        self._compositor.start()
+
+    # ---- 调用方接口 ----
+
+    def submit(self, job, timeout=None):
+        """提交一项；队列满时阻塞 (最多 timeout 秒)
+
+        Returns:
+            bool: 是否已提交 (超时返回 False，调用方可以先处理界面事件再重试)
+        """
+        try:
+            self._submit_q.put(job, timeout=timeout)
+        except queue.Full:
+            return False
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def results(self):
+        """取出所有已完成的项 (不阻塞)"""
+        done = []
+        while True:
+            try:
+                done.append(self._results.get_nowait())
+            except queue.Empty:
+                break
+        with self._lock:
+            self._in_flight -= len(done)
+        return done
+
+    def wait_result(self, timeout=None):
+        """等待下一项完成，超时返回 None"""
+        try:
+            job = self._results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            self._in_flight -= 1
+        return job
+
+    def pending(self):
+        """已提交但尚未取出结果的项数"""
+        with self._lock:
+            return self._in_flight
+
+    def close(self):
+        """不再提交新项 (已提交的项会继续处理完)"""
+        self._submit_q.put(_SENTINEL)
+
+    def cancel(self):
+        """放弃尚未开始合成的项"""
+        self._cancelled.set()
+        self.close()
+
+    def shutdown(self):
+        """等待所有阶段退出"""
+        self._reader.join()
+        self._compositor.join()
+        self._pool.shutdown(wait=True)
+
+    # ---- 各阶段 ----
+
+    def _finish(self, job):
+        if job.diag:
+            path = job.diag.dump()
+            job.diag = None
+            if path:
+                job.logs.append(f"  诊断报告: {path}")
+        self._results.put(job)
+
+    @staticmethod
+    def _profiled(job):
+        return job.diag if job.diag else nullcontext()
+
+    def _read_loop(self):
+        """读取阶段：读文件字节并解码、缩放到画布"""
+        while True:
+            job = self._submit_q.get()
+            if job is _SENTINEL:
+                self._decoded_q.put(_SENTINEL)
+                return
+            if self._cancelled.is_set():
+                job.error = '已取消'
+                self._finish(job)
+                continue
+            label = os.path.basename(job.img_path) if job.img_path else 'text'
+            job.diag = diagnostics.sample_item(self._seq, label)
+            self._seq += 1
+            if job.img_path:
+                try:
+                    t0 = time.perf_counter()
+                    with self._profiled(job):
+                        with open(job.img_path, 'rb') as f:
+                            data = f.read()
+                        t1 = time.perf_counter()
+                        job.image = self.renderer.load_image_bytes(data)
+                    job.timings['read'] = t1 - t0
+                    job.timings['decode'] = time.perf_counter() - t1
+                    if job.image is None:
+                        job.error = '无法读取图片'
+                except Exception as e:
+                    job.error = str(e)
+                if job.error:
+                    self._finish(job)
+                    continue
+            self._decoded_q.put(job)
+
+    def _composite_loop(self):
+        """合成阶段：单线程渲染，结果交给编码线程池"""
+        while True:
+            job = self._decoded_q.get()
+            if job is _SENTINEL:
+                return
+            if self._cancelled.is_set():
+                job.error = '已取消'
+                job.image = None
+                self._finish(job)
+                continue
+            try:
+                t0 = time.perf_counter()
+                with self._profiled(job):
+                    job.composite = self.renderer.render(job.img_path, job.text_content,
+                                                         log=job.logs.append, image=job.image)
+                job.timings['composite'] = time.perf_counter() - t0
+            except Exception as e:
+                job.error = str(e)
+                job.image = None
+                self._finish(job)
+                continue
+            job.image = None
+            self._encode_slots.acquire()
+            self._pool.submit(self._encode, job)
+
+    def _encode(self, job):
+        """编码阶段：保存到磁盘"""
+        try:
+            t0 = time.perf_counter()
+            with self._profiled(job):
+                job.ok = job.composite.save(job.save_path, self.profile, self.output_format, self.dpi)
+            job.timings['encode'] = time.perf_counter() - t0
+            if job.ok:
+                job.save_path = job.composite.saved_path
+                job.encoded_bytes = job.composite.saved_bytes
+            else:
+                job.error = '保存出错'
+        except Exception as e:
+            job.error = str(e)
+        finally:
+            job.composite = None
+            self._encode_slots.release()
+            self._finish(job)
+
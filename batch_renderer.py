@@ -0,0 +1,381 @@
+"""
+批量渲染模块 - 与界面无关的单项合成 (批量导出、监视目录模式、命令行共用)
+
+任务参数 (spec) 是可 JSON 序列化的字典，由 MainWindow._batch_job_spec 生成，
+也可以保存到文件供无界面运行使用。
+"""
+
+import os
+import re
+import random
+from datetime import datetime
+
+from PIL import ImageStat
+
+from image_processor import (ImageProcessor, CompositeImage, TextLayer, fit_image, fit_image_in_box,
+                             fit_image_geometry, fit_image_in_box_geometry)
+from constants import MACARON_COLORS, DOPAMINE_COLORS, BORDER_PATTERNS, LINE_STYLES
+from keyword_service import keyword_service
+from compositor import (LayerCompositor, Ref, freeze, scene_scale, scale_border, text_safe_margin, text_key,
+                        render_background, render_stickers, render_border, render_text)
+from tiled_render import TiledScene, should_tile
+from app_log import log
+
+# 随机化选项在 spec['random'] 中的顺序
+RANDOM_OPTIONS = ('color', 'style', 'pattern', 'highlight', 'font_style', 'background_style')
+
+
+def random_color():
+    """随机获取颜色 (马卡龙 + 多巴胺色系)"""
+    return random.choice(MACARON_COLORS + DOPAMINE_COLORS)
+
+
+def random_line_style():
+    """随机获取线条样式"""
+    return random.choice(LINE_STYLES)['id']
+
+
+def random_pattern():
+    """随机获取边框图案 (排除 'none')"""
+    patterns = [p['id'] for p in BORDER_PATTERNS if p['id'] != 'none']
+    return random.choice(patterns) if patterns else 'dots'
+
+
+def unique_output_name(filename):
+    """生成唯一输出文件名，格式: 原文件名_年月日时分秒毫秒"""
+    name, ext = os.path.splitext(filename)
+    time_str = datetime.now().strftime('%Y%m%d%H%M%S%f')[:-3]
+    return f"{name}_{time_str}{ext}"
+
+
+def _brightness(hex_color, default=200):
+    """颜色亮度 (0-255)"""
+    try:
+        c = str(hex_color).lstrip('#')
+        if len(c) != 6:
+            return default
+        rgb = tuple(int(c[i:i+2], 16) for i in (0, 2, 4))
+        return (rgb[0] * 299 + rgb[1] * 587 + rgb[2] * 114) / 1000
+    except ValueError:
+        return default
+
+
+class BatchRenderer:
+    """按任务参数合成单张图片
+
+    同一个实例可以连续渲染多项：字体、emoji 贴纸、边框遮罩等由 image_processor 的缓存保持预热，
+    适合监视目录模式下持续处理新到达的文件。
+    大尺寸预设 (tiled_render.should_tile，如 300dpi 的 A1 海报) 不建整幅图层，每项合成为 TiledScene 按条带保存。
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.width, self.height = spec['size']
+        self.display_width, self.display_height = spec['display']
+        self.random = dict(zip(RANDOM_OPTIONS, spec.get('random', ())))
+        self.tiled = should_tile(self.width, self.height)
+        # 按图层缓存：未随机化的背景、贴纸、边框在各项之间直接复用 (只在合成线程中使用)
+        self.compositor = None if self.tiled else LayerCompositor(self.width, self.height)
+
+    def load_image(self, img_path):
+        """解码并缩放到画布 (可在合成前单独调用，例如读取线程中预解码)"""
+        processor = ImageProcessor()
+        processor.load_image(img_path)
+        processor.set_canvas_size(self.width, self.height)
+        processor.resize_to_canvas(maintain_ratio=True)
+        return processor.get_current_image()
+
+    def load_image_bytes(self, data):
+        """从已读取的文件字节解码并缩放到画布，无法解码时返回 None"""
+        processor = ImageProcessor()
+        if not processor.load_image_from_bytes(data):
+            return None
+        processor.set_canvas_size(self.width, self.height)
+        processor.resize_to_canvas(maintain_ratio=True)
+        return processor.get_current_image()
+
+    def render(self, img_path=None, text_content=None, log=None, image=None):
+        """合成一项
+
+        Args:
+            img_path: 源图片路径 (None 表示纯背景/文字)
+            text_content: 本项配文 (None 表示不加文字)
+            log: 日志回调 log(message)
+            image: 已解码的源图片 (提供时不再读取 img_path)
+
+        Returns:
+            CompositeImage，大尺寸预设为 TiledScene (两者都用 save() 保存)
+        """
+        log = log or (lambda message: None)
+        spec = self.spec
+        preset_width, preset_height = self.width, self.height
+        tiled = self.tiled
+
+        # 1. 加载图片 (如果有)
+        cur_img = image
+        if cur_img is None and img_path:
+            cur_img = self.load_image(img_path)
+
+        # 2. 准备边框配置 (支持随机化)
+        border_config = dict(spec['border'])
+        if self.random.get('color'):
+            border_config['color'] = random_color()
+        if self.random.get('style'):
+            border_config['line_style'] = random_line_style()
+        if self.random.get('pattern'):
+            border_config['pattern'] = random_pattern()
+            # 自动调整图案大小
+            border_config['pattern_size'] = max(4, int(border_config['width'] * 0.6))
+
+        # [SCALE FIX] 提前计算分辨率缩放比例
+        # 所有的视觉元素（背景图案、边框宽度、贴纸）都需要从画布显示尺寸换算到输出分辨率
+        scale_x, scale_y, uniform_scale = scene_scale(preset_width, preset_height,
+                                                      self.display_width, self.display_height)
+
+        # [RANDOM BACKGROUND] 随机背景样式
+        current_bg_color, current_bg_pattern, current_bg_pattern_color, current_bg_pattern_size = spec['background']
+        if self.random.get('background_style'):
+            # 1. 随机背景颜色 (选择柔和的马卡龙色系，保证和深色文字有对比度)
+            current_bg_color = random.choice(MACARON_COLORS)
+            # 2. 随机背景图案
+            current_bg_pattern = random.choice([p['id'] for p in BORDER_PATTERNS])
+            # 3. 图案颜色：比背景色稍深，增加层次感
+            try:
+                bg_rgb = tuple(int(current_bg_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+                pattern_rgb = tuple(max(0, int(c * 0.7)) for c in bg_rgb)
+                current_bg_pattern_color = '#{:02X}{:02X}{:02X}'.format(*pattern_rgb)
+            except ValueError:
+                current_bg_pattern_color = '#CCCCCC'
+            # 4. 随机图案大小
+            current_bg_pattern_size = random.randint(8, 20)
+
+        # 3. 背景图层 (参数不变时各项之间复用)
+        comp = self.compositor
+        background = (current_bg_color, current_bg_pattern, current_bg_pattern_color,
+                      int(current_bg_pattern_size * uniform_scale))
+        if not tiled:
+            comp.update('background', background,
+                        lambda: render_background(preset_width, preset_height, *background))
+
+        # [LOGGING] 记录参考参数
+        log_details = []
+
+        # 4. 主图片图层 (仅在有图片时)
+        main_box, anchor = None, 'center'
+        if cur_img is not None:
+            geom = spec.get('geometry')
+            if spec.get('match_canvas') and geom:
+                rel_x, rel_y, rel_w, rel_h = geom
+                # 计算当前预设下的目标区域
+                target_x = rel_x * preset_width
+                target_y = rel_y * preset_height
+                target_w = rel_w * preset_width
+                target_h = rel_h * preset_height
+
+                img_ratio = cur_img.width / cur_img.height if cur_img.height > 0 else 1.0
+                box_ratio = target_w / target_h if target_h > 0 else 1.0
+                # 估算相对画布的缩放比例 (假设原始 fit 是 contain 满画布)
+                default_fit_w = preset_width if img_ratio > (preset_width / preset_height) else (preset_height * img_ratio)
+                scale_factor = target_w / default_fit_w if default_fit_w > 0 else 1.0
+
+                # [SMART ALIGN] 参考位置非常靠上/靠下 (5%) 时判定为顶部/底部对齐
+                anchor = 'center'
+                if rel_y < 0.05:
+                    anchor = 'n'
+                elif (rel_y + rel_h) > 0.95:
+                    anchor = 's'
+
+                main_box = (target_x, target_y, target_w, target_h)
+
+                anchor_map = {'n': '顶部', 's': '底部', 'center': '居中'}
+                log_details.append(f"参考位置: {rel_x:.2f},{rel_y:.2f} 尺寸: {rel_w:.2f}x{rel_h:.2f} => 目标: {int(target_x)},{int(target_y)} {int(target_w)}x{int(target_h)}")
+                log_details.append(f"比例检查: 图片{img_ratio:.2f} vs 目标框{box_ratio:.2f} | 缩放倍率: {scale_factor:.2f}x | 对齐: {anchor_map.get(anchor)}")
+            elif spec.get('match_canvas'):
+                # 获取失败回退到默认
+                log_details.append("参考位置获取失败，已回退到默认")
+            else:
+                log_details.append("位置模式: 默认(适应画布)")
+        else:
+            log_details.append("模式: 纯背景/文字 (无源图片)")
+
+        # 分块渲染只记录主图片的位置，由 TiledScene 按区域缩放
+        main = None
+        if tiled:
+            if cur_img is not None:
+                main = self._main_placement(cur_img, main_box, anchor)
+        elif cur_img is not None:
+            comp.update('main_image', (Ref(cur_img), main_box, anchor),
+                        lambda: self._main_layer(cur_img, main_box, anchor))
+        else:
+            comp.remove('main_image')
+
+        # 记录边框随机化结果
+        if self.random.get('color'):
+            log_details.append(f"随机颜色: {border_config.get('color')}")
+        if self.random.get('style'):
+            log_details.append(f"随机样式: {border_config.get('line_style')}")
+        if self.random.get('pattern'):
+            log_details.append(f"随机图案: {border_config.get('pattern')}")
+
+        if log_details:
+            log(f"  参数: {'; '.join(log_details)}")
+
+        # 5. 贴纸和边框图层 (坐标和尺寸换算到输出分辨率)
+        stickers = tuple((st['text'], int(st['x'] * scale_x), int(st['y'] * scale_y), int(st['size'] * uniform_scale))
+                         for st in spec.get('stickers', ()))
+        scaled_border_config = scale_border(border_config, uniform_scale)
+        if tiled:
+            scene = TiledScene(preset_width, preset_height, background, main, stickers, scaled_border_config)
+        else:
+            comp.update('stickers', stickers, lambda: render_stickers(preset_width, preset_height, stickers))
+            comp.update('border', freeze(scaled_border_config),
+                        lambda: render_border(preset_width, preset_height, scaled_border_config))
+
+        # 6. 文字图层
+        if text_content:
+            text_layer = self._make_text_layer(text_content)
+            if self.random.get('font_style'):
+                # 按文字层以下的合成结果挑选文字颜色 (分块渲染时按网格取样，不合成整幅)
+                base = scene.sample() if tiled else comp.base_image()
+                self._randomize_font(text_layer, CompositeImage.from_image(base))
+            if self.random.get('highlight'):
+                self._randomize_highlight(text_layer, text_content, log_details)
+
+            # 有效边框宽度 (用于文字防遮挡，使用已缩放的边框宽度)
+            # [FIX] font_size 已经是适配预设尺寸的数值，渲染时 scale=1.0
+            margin = text_safe_margin(scaled_border_config, preset_width, preset_height, scale_x)
+            if tiled:
+                scene.text = render_text(text_layer, preset_width, preset_height, margin)
+            else:
+                comp.update('text', text_key(text_layer, preset_width, preset_height, margin),
+                            lambda: render_text(text_layer, preset_width, preset_height, margin))
+        elif not tiled:
+            comp.remove('text')
+
+        if tiled:
+            return scene
+        return CompositeImage.from_image(comp.compose())
+
+    def _main_layer(self, image, box=None, anchor='center'):
+        """主图片图层：按目标区域 (x, y, w, h) 放置，未指定时按 contain 适应画布"""
+        if box:
+            return fit_image_in_box(image, *box, anchor=anchor)
+        return fit_image(image, self.width, self.height, 'contain')
+
+    def _main_placement(self, image, box=None, anchor='center'):
+        """分块渲染的主图片参数 (原图, (宽, 高), (x, y))，位置与 _main_layer 相同，不缩放图片"""
+        if box:
+            geometry = fit_image_in_box_geometry(image, *box, anchor=anchor)
+        else:
+            geometry = fit_image_geometry(image, self.width, self.height, 'contain')
+        if geometry is None or min(geometry[0]) <= 0:
+            return None
+        return (image,) + geometry
+
+    def _make_text_layer(self, text_content):
+        """按 spec 创建文字层"""
+        layer_data = self.spec.get('text_layer')
+        if layer_data:
+            # 优先克隆当前图层 (保证样式完全一致)
+            layer_data = dict(layer_data)
+            layer_data['content'] = text_content
+            return TextLayer.from_dict(layer_data)
+
+        # Fallback: 使用 Config 创建 (可能样式不全)
+        cfg = self.spec.get('text_config') or {}
+        return TextLayer(
+            content=text_content,
+            font_size=cfg.get('font_size', 48),
+            color=cfg.get('color', '#FFFFFF'),
+            font_family=cfg.get('font_family', 'yuanti'),
+            align=cfg.get('align', 'center'),
+            position=cfg.get('position', 'bottom'),
+            margin=cfg.get('margin', 20),
+            shadow=cfg.get('shadow'),
+            stroke=cfg.get('stroke'),
+            highlight=cfg.get('highlight'),
+            bold=cfg.get('bold', False),
+            italic=cfg.get('italic', False),
+            underline=cfg.get('underline', False),
+            indent=cfg.get('indent', False)
+        )
+
+    def _randomize_font(self, text_layer, composite):
+        """[RANDOM FONT] 随机字体样式 + 按背景亮度挑选文字颜色和描边"""
+        # 使用与 UI 下拉框一致的字体列表 (keys: pingfang, heiti, etc.)
+        text_layer.font_family = random.choice(list(text_layer.FONT_NAMES.keys()))
+        text_layer.bold = random.choice([True, False])
+        text_layer.italic = random.choice([True, False])
+        all_colors = MACARON_COLORS + DOPAMINE_COLORS
+
+        # 1. 计算背景亮度 (缩略图采样)
+        bg_brightness = 255
+        try:
+            thumb = composite.canvas.resize((50, 50))
+            if thumb.mode != 'RGB':
+                thumb = thumb.convert('RGB')
+            r, g, b = ImageStat.Stat(thumb).mean
+            bg_brightness = (r * 299 + g * 587 + b * 114) / 1000
+        except Exception as e:
+            log.debug("Calc bg brightness failed: %s", e)
+
+        # 2. 根据背景亮度筛选文字颜色
+        if bg_brightness < 100:
+            # 深色背景：强制选亮色文字
+            candidates = [c for c in all_colors if _brightness(c, 0) > 150] or ['#FFFFFF']
+        elif bg_brightness > 180:
+            # 浅色背景：倾向选深色文字，没有就随便选，靠描边补救
+            candidates = [c for c in all_colors if _brightness(c, 255) < 120] or all_colors
+        else:
+            candidates = all_colors
+        text_layer.color = random.choice(candidates)
+
+        # 3. [RANDOM STROKE] 智能描边 (确保最终对比度)
+        if text_layer.stroke and text_layer.stroke.get('enabled'):
+            txt_brightness = _brightness(text_layer.color)
+            if bg_brightness > 150:  # 浅色背景
+                if txt_brightness > 150:
+                    # 文字也亮 (对比度差)：强制深色描边
+                    final_stroke_color = random.choice(['#000000', '#333333', '#1A1A1A', '#2F4F4F', '#8B4513', '#800000', '#191970', '#006400'])
+                else:
+                    # 文字深，背景亮：浅色描边形成光晕
+                    final_stroke_color = random.choice(['#FFFFFF', '#F0F8FF', '#F5F5F5'])
+            elif bg_brightness < 100:  # 深色背景
+                if txt_brightness < 100:
+                    # 文字也暗：强制亮色描边
+                    final_stroke_color = random.choice(['#FFFFFF', '#F0F8FF', '#F5F5F5', '#FFFACD', '#E0FFFF', '#FFC0CB', '#98FB98'])
+                else:
+                    final_stroke_color = random.choice(['#000000', '#333333'])
+            else:  # 中性背景：对比文字亮度即可
+                final_stroke_color = '#333333' if txt_brightness > 128 else '#FFFFFF'
+
+            text_layer.stroke['color'] = final_stroke_color
+            # 确保描边宽度可见
+            if text_layer.stroke.get('width', 0) < 3:
+                text_layer.stroke['width'] = 4
+
+    def _randomize_highlight(self, text_layer, text_content, log_details):
+        """[RANDOM HIGHLIGHT] 随机文字高亮 (配合 NLP)"""
+        # 使用 'random'，让 image_processor 内部为每个关键词随机分配颜色 (彩虹效果)
+        if not text_layer.highlight or isinstance(text_layer.highlight, bool):
+            text_layer.highlight = {'enabled': True, 'keywords': [], 'color': 'random'}
+        else:
+            text_layer.highlight['enabled'] = True
+            text_layer.highlight['color'] = 'random'
+
+        # [NLP] always try NLP first (关键词服务按文本缓存结果)
+        extracted = keyword_service.extract_tags(text_layer.content, top_k=5)
+        if extracted:
+            text_layer.highlight['keywords'] = extracted
+            log_details.append(f"NLP关键词: {extracted}")
+
+        if not text_layer.highlight.get('keywords', []):
+            # 正则兜底: 中文或英文单词，随机选几个
+            words = re.findall(r'[\u4e00-\u9fa5]{2,}|[a-zA-Z]{4,}', text_content)
+            if words:
+                fallback_keywords = random.sample(words, min(3, len(words)))
+                text_layer.highlight['keywords'] = fallback_keywords
+                log_details.append(f"正则兜底: {fallback_keywords}")
+
+        log_details.append("随机高亮: random")
+
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+渲染核心微基准 - 文字层、边框/图案、主图适配、贴纸，覆盖 constants.SIZE_PRESETS 中的每个尺寸
+
+结果写入 JSON，可保存为基准并与之比较 (热点路径变慢时退出码为 1)。
+
+用法:
+    python benchmark.py                              # 运行全部，结果写入 .cache/benchmarks/
+    python benchmark.py --filter border --repeat 10  # 只运行名称包含 border 的用例
+    python benchmark.py --save-baseline              # 运行并保存为基准
+    python benchmark.py --compare                    # 运行并与基准比较
+    python benchmark.py --compare old.json --threshold 1.3
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import contextlib
+from datetime import datetime
+
+from PIL import Image, ImageDraw
+
+from constants import SIZE_PRESETS, BORDER_PATTERNS, BACKGROUND_PATTERNS
+import image_processor
+from image_processor import CompositeImage, TextLayer
+from tiled_render import should_tile
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'benchmarks')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+DEFAULT_REPEAT = 5
+# 比基准慢多少倍视为回归；差值小于 MIN_DELTA_MS 的波动忽略
+DEFAULT_THRESHOLD = 1.25
+MIN_DELTA_MS = 0.5
+
+TEXTS = {
+    'cjk_short': '今天也要开心呀',
+    'cjk_long': '春风十里不如你，山河远阔人间烟火，无一是你无一不是你。' * 3,
+    'latin_short': 'Have a nice day',
+    'latin_long': 'The quick brown fox jumps over the lazy dog, again and again. ' * 4,
+}
+
+HIGHLIGHT_KEYWORDS = ['开心', '春风', '人间烟火', 'nice', 'fox', 'lazy']
+
+EFFECTS = {
+    'plain': {},
+    'stroke': {'stroke': {'enabled': True, 'color': '#000000', 'width': 3}},
+    'shadow': {'shadow': {'enabled': True, 'color': '#000000', 'offset': (3, 3), 'blur': 4}},
+    'bold': {'bold': True},
+    'italic': {'italic': True},
+    'highlight': {'highlight': {'enabled': True, 'keywords': HIGHLIGHT_KEYWORDS, 'color': '#FFB7B2'}},
+}
+
+FIT_MODES = ('contain', 'cover', 'stretch')
+STICKERS = ('💖', '🌸', '⭐')
+
+
+def clear_render_caches():
+    """清空渲染缓存 (边框遮罩/图案层、贴纸、字号)，每次计时都从冷缓存开始
+
+    否则重复运行时边框等用例测的只是缓存命中。字体文件的解析 (_truetype) 仍然缓存。
+    """
+    image_processor._border_pattern_layer.cache_clear()
+    image_processor._rect_border_mask.cache_clear()
+    image_processor._rounded_content_mask.cache_clear()
+    image_processor._rounded_border_mask.cache_clear()
+    image_processor._emoji_sprite.cache_clear()
+    TextLayer._font_cache.clear()
+
+
+class Case:
+    """一个基准用例：setup() 的耗时不计入，run(setup 的返回值) 计时 (每次 setup 前清空渲染缓存)"""
+
+    def __init__(self, name, group, preset, run, setup=None):
+        self.name = name
+        self.group = group
+        self.preset = preset
+        self.run = run
+        self._setup = setup or (lambda: None)
+
+    def setup(self):
+        clear_render_caches()
+        return self._setup()
+
+
+def _synthetic_photo(width=3000, height=2000):
+    """生成固定的"照片" (渐变 + 色块)，避免依赖外部文件"""
+    img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for i in range(12):
+        x, y = (i * 397) % width, (i * 613) % height
+        draw.ellipse([x, y, x + width // 5, y + height // 5], fill=((i * 40) % 256, (i * 90) % 256, 160))
+    return img
+
+
+def build_cases(presets):
+    photo = _synthetic_photo()
+    cases = []
+    for preset in presets:
+        w, h, pid = preset['width'], preset['height'], preset['id']
+        scale = max(w, h) / 800
+        font_size = max(12, int(48 * scale))
+
+        # 文字层
+        for text_id, content in TEXTS.items():
+            for effect_id, kwargs in EFFECTS.items():
+                layer = TextLayer(content, font_size=font_size, color='#FFFFFF', **kwargs)
+                cases.append(Case(f'text/{text_id}/{effect_id}/{pid}', 'text', pid,
+                                  lambda _, layer=layer, w=w, h=h: layer.render(w, h)))
+
+        # 边框 (直角 / 圆角) × 图案
+        for pattern in BORDER_PATTERNS:
+            for shape in ('rect', 'rounded'):
+                config = {
+                    'width': max(4, int(30 * scale)),
+                    'color': '#FFB7B2',
+                    'pattern': pattern['id'],
+                    'pattern_color': '#FFFFFF',
+                    'pattern_size': max(4, int(12 * scale)),
+                    'radius': max(8, int(40 * scale)) if shape == 'rounded' else 0,
+                }
+                method = CompositeImage.add_rounded_border if shape == 'rounded' else CompositeImage.add_border
+                cases.append(Case(f'border/{shape}/{pattern["id"]}/{pid}', 'border', pid,
+                                  lambda c, config=config, method=method: method(c, config),
+                                  setup=lambda w=w, h=h: CompositeImage(w, h)))
+
+        # 背景图案
+        for pattern in BACKGROUND_PATTERNS:
+            cases.append(Case(f'background/{pattern["id"]}/{pid}', 'background', pid,
+                              lambda c, pattern_id=pattern['id'], size=max(4, int(10 * scale)):
+                                  c.draw_background_pattern(pattern_id, '#FFDAC1', size),
+                              setup=lambda w=w, h=h: CompositeImage(w, h)))
+
+        # 主图适配
+        for fit_mode in FIT_MODES:
+            cases.append(Case(f'main_image/{fit_mode}/{pid}', 'main_image', pid,
+                              lambda c, fit_mode=fit_mode: c.add_main_image(photo, fit_mode=fit_mode),
+                              setup=lambda w=w, h=h: CompositeImage(w, h)))
+
+        # 贴纸
+        def add_stickers(c, w=w, h=h, size=max(16, int(64 * scale))):
+            for i, emoji in enumerate(STICKERS):
+                c.add_sticker(emoji, w * (i + 1) // 4, h // 2, size)
+
+        cases.append(Case(f'sticker/{pid}', 'sticker', pid, add_stickers,
+                          setup=lambda w=w, h=h: CompositeImage(w, h)))
+    return cases
+
+
+def run_case(case, repeat):
+    """运行一个用例，返回耗时统计 (毫秒)"""
+    samples = []
+    for _ in range(repeat):
+        state = case.setup()
+        start = time.perf_counter()
+        case.run(state)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'group': case.group,
+        'preset': case.preset,
+        'first_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'min_ms': round(min(samples), 3),
+        'repeat': repeat,
+    }
+
+
+def run_suite(cases, repeat, verbose=True):
+    results = {}
+    for i, case in enumerate(cases, 1):
+        # 渲染代码中的 [DEBUG] 输出不显示
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[case.name] = run_case(case, repeat)
+        if verbose:
+            print(f"[{i}/{len(cases)}] {case.name:<48} {results[case.name]['median_ms']:>9.2f} ms")
+    return results
+
+
+def environment():
+    import PIL
+    return {
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def group_totals(results):
+    totals = {}
+    for r in results.values():
+        totals[r['group']] = totals.get(r['group'], 0) + r['median_ms']
+    return {group: round(total, 2) for group, total in totals.items()}
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """与基准比较
+
+    Returns:
+        (regressions, improvements): [(用例名, 基准ms, 当前ms, 倍数)]
+    """
+    regressions, improvements = [], []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        before, after = base['median_ms'], current['median_ms']
+        if abs(after - before) < MIN_DELTA_MS or before <= 0:
+            continue
+        ratio = after / before
+        if ratio > threshold:
+            regressions.append((name, before, after, ratio))
+        elif ratio < 1 / threshold:
+            improvements.append((name, before, after, ratio))
+    regressions.sort(key=lambda r: -r[3])
+    improvements.sort(key=lambda r: r[3])
+    return regressions, improvements
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='图片套版 - 渲染核心微基准')
+    parser.add_argument('--filter', help='只运行名称包含该字符串的用例 (如 text、border/rounded、square_1_1)')
+    parser.add_argument('--presets', nargs='*', help='只运行指定尺寸 id (默认全部，超大打印尺寸除外)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='每个用例运行次数')
+    parser.add_argument('--out', help='结果 JSON 路径 (默认 .cache/benchmarks/bench_时间.json)')
+    parser.add_argument('--save-baseline', action='store_true', help=f'同时保存为基准 ({BASELINE_PATH})')
+    parser.add_argument('--compare', nargs='?', const=BASELINE_PATH, help='与基准 JSON 比较 (默认使用已保存的基准)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='慢于基准多少倍视为回归')
+    parser.add_argument('-q', '--quiet', action='store_true', help='不逐项输出')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # 打印海报等超大尺寸 (导出时分块渲染) 默认不运行，需用 --presets 指定
+    presets = [p for p in SIZE_PRESETS
+               if (p['id'] in args.presets if args.presets else not should_tile(p['width'], p['height']))]
+    cases = build_cases(presets)
+    if args.filter:
+        cases = [c for c in cases if args.filter in c.name]
+    if not cases:
+        print("没有匹配的用例")
+        return 1
+
+    print(f"运行 {len(cases)} 个用例，每个 {args.repeat} 次...")
+    started = time.perf_counter()
+    results = run_suite(cases, args.repeat, verbose=not args.quiet)
+    report = {
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': environment(),
+        'elapsed_s': round(time.perf_counter() - started, 2),
+        'group_totals_ms': group_totals(results),
+        'results': results,
+    }
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    out_path = args.out or os.path.join(BENCH_DIR, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n各组合计 (中位数之和, ms): {report['group_totals_ms']}")
+    print(f"结果已保存: {out_path}")
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基准已保存: {BASELINE_PATH}")
+
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except Exception as e:
+            print(f"错误: 无法读取基准 {args.compare}: {e}")
+            return 1
+        regressions, improvements = compare(results, baseline.get('results', {}), args.threshold)
+        print(f"\n与基准比较 ({baseline.get('generated_at', '?')}，阈值 {args.threshold}x):")
+        for name, before, after, ratio in improvements:
+            print(f"  ✓ {name:<48} {before:>9.2f} → {after:>9.2f} ms  ({ratio:.2f}x)")
+        for name, before, after, ratio in regressions:
+            print(f"  ✗ {name:<48} {before:>9.2f} → {after:>9.2f} ms  ({ratio:.2f}x)")
+        if regressions:
+            print(f"发现 {len(regressions)} 项回归")
+            return 1
+        print("无回归")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
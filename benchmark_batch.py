@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+批量处理端到端吞吐基准 - 生成可复现的测试图片集 (不同尺寸、宽高比的"照片" + 配文表)，
+无界面按界面批量导出 (MainWindow.batch_export) 的流程运行 (扫描 → 配文 → 关键词预提取 → 清单 / 渲染缓存
+→ BatchPipeline 读取/解码、合成、编码保存)，按 尺寸 × 主题 × 编码线程数 矩阵报告 张/秒、峰值内存和各阶段耗时。
+
+每个矩阵单元在独立子进程中运行，峰值内存互不影响；渲染缓存使用单元自己的临时目录，不读写本机的缓存。
+
+用法:
+    python benchmark_batch.py                                   # 默认矩阵，40 张
+    python benchmark_batch.py -n 200 --encoders 1 2 4 8
+    python benchmark_batch.py --presets square_1_1 --themes full --save-baseline
+    python benchmark_batch.py --no-cache --no-manifest          # 只测渲染流水线
+    python benchmark_batch.py --rerun                           # 测重跑 (清单跳过 / 缓存命中)
+    python benchmark_batch.py --compare                         # 与基准比较吞吐
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+import contextlib
+from datetime import datetime
+
+from PIL import Image, ImageDraw
+
+from constants import SIZE_PRESETS
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'benchmarks')
+CORPUS_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'bench_corpus')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'batch_baseline.json')
+
+DEFAULT_COUNT = 40
+DEFAULT_SEED = 20260114
+DEFAULT_PRESETS = ('square_1_1', 'xiaohongshu_3_4', 'post_16_9')
+DEFAULT_ENCODERS = (1, 2, 4)
+# 吞吐低于基准的多少比例视为回归
+DEFAULT_THRESHOLD = 0.8
+
+CORPUS_MARKER = '.corpus.json'
+CAPTIONS_FILENAME = 'captions.csv'
+
+# 手机横竖拍、截图、方图、长图、小图
+PHOTO_SIZES = [
+    (4032, 3024), (3024, 4032), (1920, 1080), (1080, 1920),
+    (1200, 1200), (800, 600), (640, 1136), (2400, 1000),
+]
+
+CAPTION_PARTS = [
+    '今天也要开心呀', '春风十里不如你', '周末去海边看日落', '人间烟火气，最抚凡人心',
+    'Have a nice day', 'Coffee first, then the world', '小确幸', 'Weekend vibes only',
+    '把日子过成诗', 'Less is more', '和喜欢的一切在一起', 'Stay curious',
+]
+
+# 主题: 任务参数中与尺寸无关的部分 (随机化全部关闭，保证可复现)
+THEMES = {
+    'minimal': {
+        'border': {'shape': 'rectangle', 'width': 0, 'radius': 0, 'color': '#FFFFFF',
+                   'line_style': 'solid', 'pattern': 'none', 'pattern_color': '#FFFFFF', 'pattern_size': 10},
+        'background': ('#FFFFFF', 'none', '#E0E0E0', 10),
+        'stickers': [],
+        'text': None,
+    },
+    'pattern_border': {
+        'border': {'shape': 'rectangle', 'width': 30, 'radius': 0, 'color': '#FFB7B2',
+                   'line_style': 'solid', 'pattern': 'heart', 'pattern_color': '#FFFFFF', 'pattern_size': 12},
+        'background': ('#FFF5EE', 'dots', '#FFDAC1', 10),
+        'stickers': [{'text': '💖', 'x': 40, 'y': 40, 'size': 40}, {'text': '🌸', 'x': 200, 'y': 60, 'size': 32}],
+        'text': None,
+    },
+    'caption': {
+        'border': {'shape': 'rectangle', 'width': 12, 'radius': 0, 'color': '#333333',
+                   'line_style': 'solid', 'pattern': 'solid', 'pattern_color': '#FFFFFF', 'pattern_size': 10},
+        'background': ('#FFFFFF', 'none', '#E0E0E0', 10),
+        'stickers': [],
+        'text': {'stroke': {'enabled': True, 'color': '#000000', 'width': 3},
+                 'shadow': {'enabled': True, 'color': '#000000', 'offset': (3, 3), 'blur': 4}},
+    },
+    'full': {
+        'border': {'shape': 'rounded_rect', 'width': 30, 'radius': 40, 'color': '#BBDEFB',
+                   'line_style': 'solid', 'pattern': 'diamond', 'pattern_color': '#FFFFFF', 'pattern_size': 12},
+        'background': ('#E3F2FD', 'grid', '#BBDEFB', 12),
+        'stickers': [{'text': '⭐', 'x': 40, 'y': 40, 'size': 40}, {'text': '🌈', 'x': 220, 'y': 40, 'size': 40}],
+        'text': {'stroke': {'enabled': True, 'color': '#000000', 'width': 2},
+                 'highlight': {'enabled': True, 'keywords': ['开心', '日落', 'day', '诗'], 'color': '#FFB7B2'},
+                 'bold': True},
+    },
+}
+
+
+# ---- 测试图片集 ----
+
+def _random_color(rng):
+    return tuple(rng.randint(30, 240) for _ in range(3))
+
+
+def _synthetic_photo(rng, width, height):
+    """渐变底 + 色块 + 噪点，接近照片的压缩特性"""
+    from generate_default_backgrounds import gradient_image
+    from generate_borders import simple_border, double_border, decorative_border
+
+    img = gradient_image(width, height, _random_color(rng), _random_color(rng))
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(8, 24)):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randint(min(width, height) // 20, min(width, height) // 4)
+        shape = draw.ellipse if rng.random() < 0.6 else draw.rectangle
+        shape([x - r, y - r, x + r, y + r], fill=_random_color(rng))
+    # 部分图片带相框
+    frame = rng.choice([None, None, simple_border, double_border, decorative_border])
+    if frame:
+        frame(draw, (width, height))
+    noise = Image.effect_noise((width, height), rng.randint(8, 24)).convert('RGB')
+    return Image.blend(img, noise, 0.12)
+
+
+def generate_corpus(count=DEFAULT_COUNT, seed=DEFAULT_SEED, root=CORPUS_ROOT):
+    """生成 (或复用) 测试图片集
+
+    约 70% 为 JPEG、30% 为 PNG，约四分之一放在子目录中；同目录下的 captions.csv 为 文件名,配文。
+
+    Returns:
+        图片集目录
+    """
+    corpus_dir = os.path.join(root, f'n{count}_seed{seed}')
+    marker = os.path.join(corpus_dir, CORPUS_MARKER)
+    if os.path.exists(marker):
+        return corpus_dir
+
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    os.makedirs(corpus_dir)
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        width, height = rng.choice(PHOTO_SIZES)
+        ext = '.jpg' if rng.random() < 0.7 else '.png'
+        sub_dir = 'set_b' if rng.random() < 0.25 else ''
+        filename = f'photo_{i:04d}{ext}'
+        os.makedirs(os.path.join(corpus_dir, sub_dir), exist_ok=True)
+        img = _synthetic_photo(rng, width, height)
+        img.save(os.path.join(corpus_dir, sub_dir, filename), quality=90)
+        caption = '，'.join(rng.sample(CAPTION_PARTS, rng.randint(1, 3)))
+        rows.append((filename, caption))
+        print(f"生成测试图片 [{i + 1}/{count}] {os.path.join(sub_dir, filename)} {width}x{height}")
+
+    with open(os.path.join(corpus_dir, CAPTIONS_FILENAME), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('文件名', '内容'))
+        writer.writerows(rows)
+    with open(marker, 'w', encoding='utf-8') as f:
+        json.dump({'count': count, 'seed': seed}, f)
+    return corpus_dir
+
+
+# ---- 单个矩阵单元 (子进程中运行) ----
+
+def build_spec(preset, theme_id):
+    """按尺寸和主题构造任务参数 (与界面中 _batch_job_spec 的结构相同)"""
+    theme = THEMES[theme_id]
+    width, height = preset['width'], preset['height']
+    # 界面预览画布约为输出尺寸的 1/3
+    display = (max(1, width // 3), max(1, height // 3))
+    text_layer = None
+    if theme['text']:
+        text_layer = {'content': '', 'font_size': max(16, int(48 * max(width, height) / 800)),
+                      'color': '#FFFFFF', 'font_family': 'yuanti', 'position': 'bottom'}
+        text_layer.update(theme['text'])
+    return {
+        'size': (width, height),
+        'display': display,
+        'border': dict(theme['border']),
+        'background': theme['background'],
+        'stickers': theme['stickers'],
+        'match_canvas': False,
+        'geometry': None,
+        'text_layer': text_layer,
+        'text_config': None,
+        'use_text': bool(text_layer),
+        'random': (False,) * 6,
+        'dpi': preset.get('dpi'),
+    }
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_cell(corpus_dir, preset_id, theme_id, encoders, stages=True, cache=True, manifest=True,
+             random_highlight=False, rerun=False):
+    """按批量导出的流程完整跑一遍，返回吞吐、内存和各阶段耗时
+
+    Args:
+        encoders: BatchPipeline 的编码线程数 (读取、合成各一个线程)
+        cache: 使用渲染缓存 (单元自己的临时缓存目录)
+        manifest: 使用输出目录中的批量清单 (跳过未变化的项)
+        random_highlight: 开启随机高亮 (先预提取全部配文的关键词；与界面相同，随机化时不使用渲染缓存)
+        rerun: 先完整跑一遍不计时，再对同一输出目录和缓存计时重跑
+    """
+    import input_scanner
+    import text_sources
+    import stage_timer
+    import batch_manifest
+    import image_encoder
+    from keyword_service import keyword_service
+    from render_cache import RenderCache
+    from batch_renderer import BatchRenderer, unique_output_name
+    from batch_pipeline import BatchPipeline, PipelineJob
+
+    preset = next(p for p in SIZE_PRESETS if p['id'] == preset_id)
+    spec = build_spec(preset, theme_id)
+    if random_highlight:
+        spec['random'] = (False, False, False, True, False, False)
+    work_dir = tempfile.mkdtemp(prefix='bench_batch_')
+    output_dir = os.path.join(work_dir, 'output')
+    os.makedirs(output_dir)
+    render_cache = RenderCache(os.path.join(work_dir, 'renders'))
+    use_cache = cache and not any(spec['random'])
+
+    def run_pass():
+        counts = {'ok': 0, 'failed': 0, 'skipped': 0, 'cached': 0, 'bytes': 0, 'items': 0}
+        text_source = text_sources.load_text_source(os.path.join(corpus_dir, CAPTIONS_FILENAME))
+        text_mapping = text_source.mapping
+        if spec['random'][3]:
+            keyword_service.extract_tags_batch(
+                itertools.chain(text_mapping.values(), text_source.iter_sequence()))
+        batch = batch_manifest.open_manifest(output_dir) if manifest else None
+        renderer = BatchRenderer(spec)
+        pipeline = BatchPipeline(renderer, encoders=encoders)
+        text_sequence = text_source.sequence_cursor()
+
+        def finish(job):
+            ctx = job.context
+            if stages:
+                for stage, seconds in job.timings.items():
+                    stage_timer.add(f'pipeline.{stage}', seconds)
+            if not job.ok:
+                counts['failed'] += 1
+                if ctx['item_key']:
+                    batch.mark_failed(ctx['item_key'], job.error)
+                return
+            counts['ok'] += 1
+            counts['bytes'] += job.encoded_bytes
+            if ctx['item_key']:
+                batch.mark_done(ctx['item_key'], job.save_path)
+            if ctx['cache_key']:
+                render_cache.store(ctx['cache_key'], os.path.splitext(job.save_path)[1], job.save_path)
+
+        for idx, item in enumerate(input_scanner.scan_images(corpus_dir, exclude=output_dir)):
+            counts['items'] += 1
+            filename = os.path.basename(item.path)
+            text_content = None
+            if spec['use_text']:
+                if filename in text_mapping:
+                    text_content = text_mapping[filename]
+                elif idx < text_source.sequence_count:
+                    text_content = text_sequence.get(idx)
+            item_key = cache_key = None
+            if batch or use_cache:
+                content_hash = batch.content_hash(item.path, item.stat()) if batch else batch_manifest.file_hash(item.path)
+                item_spec_hash = batch_manifest.spec_hash(spec, text_content)
+            if batch:
+                item_key = item.path
+                if batch.lookup_done(item_key, content_hash, item_spec_hash):
+                    counts['skipped'] += 1
+                    continue
+                batch.mark_running(item_key, content_hash, item_spec_hash, item.stat())
+            out_ext = image_encoder.output_extension(spec.get('output_format'), os.path.splitext(filename)[1])
+            save_path = os.path.join(output_dir, unique_output_name(filename))
+            if out_ext:
+                save_path = os.path.splitext(save_path)[0] + out_ext
+            if use_cache:
+                cache_key = render_cache.make_key(content_hash, item_spec_hash, out_ext or '.auto')
+                cached_path = None
+                for ext in ([out_ext] if out_ext else image_encoder.AUTO_EXTENSIONS):
+                    candidate = os.path.splitext(save_path)[0] + ext
+                    if render_cache.fetch(cache_key, ext, candidate):
+                        cached_path = candidate
+                        break
+                if cached_path:
+                    counts['cached'] += 1
+                    counts['bytes'] += os.path.getsize(cached_path)
+                    if item_key:
+                        batch.mark_done(item_key, cached_path)
+                    continue
+            pipeline.submit(PipelineJob(item.path, text_content, save_path,
+                                        context={'item_key': item_key, 'cache_key': cache_key}))
+            for job in pipeline.results():
+                finish(job)
+        pipeline.close()
+        while pipeline.pending():
+            job = pipeline.wait_result(timeout=0.1)
+            if job:
+                finish(job)
+        pipeline.shutdown()
+        text_sequence.close()
+        keyword_service.release_batch()
+        if batch:
+            batch.close()
+        return counts
+
+    try:
+        if rerun:
+            run_pass()
+        if stages:
+            stage_timer.reset()
+            stage_timer.enable()
+        started = time.perf_counter()
+        counts = run_pass()
+        elapsed = time.perf_counter() - started
+    finally:
+        if stages:
+            stage_timer.disable()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # 跳过和缓存命中的项也算作完成 (与界面的"成功"计数一致)
+    done = counts['ok'] + counts['skipped'] + counts['cached']
+    return {
+        'preset': preset_id,
+        'theme': theme_id,
+        'encoders': encoders,
+        'options': _cell_options(cache, manifest, random_highlight, rerun),
+        'images': counts['items'],
+        'ok': counts['ok'],
+        'skipped': counts['skipped'],
+        'cached': counts['cached'],
+        'failed': counts['failed'],
+        'seconds': round(elapsed, 3),
+        'images_per_sec': round(done / elapsed, 3) if elapsed > 0 else 0,
+        'output_mb': round(counts['bytes'] / (1024 * 1024), 2),
+        'peak_rss_mb': _peak_rss_mb(),
+        'stages': stage_timer.summary() if stages else {},
+    }
+
+
+def _cell_options(cache, manifest, random_highlight, rerun):
+    """单元的流程选项 (与默认不同的项，用于报告和基准比较)"""
+    options = []
+    if not cache:
+        options.append('no-cache')
+    if not manifest:
+        options.append('no-manifest')
+    if random_highlight:
+        options.append('random-highlight')
+    if rerun:
+        options.append('rerun')
+    return '+'.join(options)
+
+
+def _run_cell_subprocess(corpus_dir, preset_id, theme_id, encoders, stages, flags):
+    cell = {'corpus': corpus_dir, 'preset': preset_id, 'theme': theme_id, 'encoders': encoders, 'stages': stages}
+    cell.update(flags)
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--cell', json.dumps(cell)],
+                          capture_output=True, text=True, encoding='utf-8')
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f'退出码 {proc.returncode}')
+    return json.loads(lines[-1])
+
+
+# ---- 报告 ----
+
+def print_table(results):
+    print(f"\n{'尺寸':<18}{'主题':<16}{'编码线程':>8}{'张/秒':>9}{'耗时s':>8}{'峰值MB':>9}{'失败':>6}  最耗时阶段")
+    for r in results:
+        top = sorted(((k, v) for k, v in r['stages'].items() if not k.startswith('pipeline.')),
+                     key=lambda kv: -kv[1]['total_ms'])[:3]
+        top_text = ', '.join(f"{k} {v['total_ms']:.0f}ms" for k, v in top)
+        rss = r['peak_rss_mb'] if r['peak_rss_mb'] is not None else '-'
+        print(f"{r['preset']:<18}{r['theme']:<16}{_encoders(r):>8}{r['images_per_sec']:>9.2f}"
+              f"{r['seconds']:>8.2f}{rss:>9}{r['failed']:>6}  {top_text}")
+
+
+def _encoders(r):
+    # 旧版结果中编码线程数记为 workers
+    return r.get('encoders', r.get('workers'))
+
+
+def _cell_key(r):
+    key = f"{r['preset']}/{r['theme']}/e{_encoders(r)}"
+    return f"{key}/{r['options']}" if r.get('options') else key
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """与基准比较吞吐，返回回归项 [(单元, 基准张/秒, 当前张/秒)]"""
+    base = {_cell_key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(_cell_key(r))
+        if b and b['images_per_sec'] > 0 and r['images_per_sec'] < b['images_per_sec'] * threshold:
+            regressions.append((_cell_key(r), b['images_per_sec'], r['images_per_sec']))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='图片套版 - 批量处理端到端吞吐基准')
+    parser.add_argument('-n', '--count', type=int, default=DEFAULT_COUNT, help='测试图片数')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='随机种子 (相同种子生成相同图片集)')
+    parser.add_argument('--presets', nargs='*', default=list(DEFAULT_PRESETS), help='尺寸 id')
+    parser.add_argument('--themes', nargs='*', default=list(THEMES), choices=list(THEMES), help='主题')
+    parser.add_argument('--encoders', '--workers', nargs='*', type=int, default=list(DEFAULT_ENCODERS),
+                        help='流水线编码线程数 (读取、合成固定各一个线程)')
+    parser.add_argument('--no-cache', action='store_true', help='不使用渲染缓存')
+    parser.add_argument('--no-manifest', action='store_true', help='不使用批量清单')
+    parser.add_argument('--random-highlight', action='store_true',
+                        help='开启随机高亮 (含关键词预提取，与界面相同，此时不使用渲染缓存)')
+    parser.add_argument('--rerun', action='store_true', help='先跑一遍不计时，再计时重跑 (清单跳过 / 缓存命中)')
+    parser.add_argument('--no-stages', action='store_true', help='不统计各阶段耗时')
+    parser.add_argument('--out', help='结果 JSON 路径 (默认 .cache/benchmarks/batch_时间.json)')
+    parser.add_argument('--save-baseline', action='store_true', help=f'同时保存为基准 ({BASELINE_PATH})')
+    parser.add_argument('--compare', nargs='?', const=BASELINE_PATH, help='与基准 JSON 比较吞吐')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='吞吐低于基准多少比例视为回归')
+    parser.add_argument('--cell', help=argparse.SUPPRESS)  # 子进程内部使用
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.cell:
+        cell = json.loads(args.cell)
+        # 渲染代码中的 [DEBUG] 输出不混入结果
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_cell(cell['corpus'], cell['preset'], cell['theme'], cell['encoders'], cell['stages'],
+                              cell['cache'], cell['manifest'], cell['random_highlight'], cell['rerun'])
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+
+    unknown = [p for p in args.presets if p not in {s['id'] for s in SIZE_PRESETS}]
+    if unknown:
+        print(f"错误: 未知尺寸 {unknown}")
+        return 1
+
+    corpus_dir = generate_corpus(args.count, args.seed)
+    print(f"测试图片集: {corpus_dir}")
+
+    flags = {'cache': not args.no_cache, 'manifest': not args.no_manifest,
+             'random_highlight': args.random_highlight, 'rerun': args.rerun}
+    options = _cell_options(**flags)
+    if options:
+        print(f"流程选项: {options}")
+    results = []
+    cells = [(p, t, e) for p in args.presets for t in args.themes for e in args.encoders]
+    for i, (preset_id, theme_id, encoders) in enumerate(cells, 1):
+        print(f"[{i}/{len(cells)}] {preset_id} / {theme_id} / {encoders} 编码线程...", end=' ', flush=True)
+        try:
+            r = _run_cell_subprocess(corpus_dir, preset_id, theme_id, encoders, not args.no_stages, flags)
+        except Exception as e:
+            print(f"✗ 失败: {e}")
+            continue
+        results.append(r)
+        print(f"{r['images_per_sec']:.2f} 张/秒")
+
+    print_table(results)
+
+    report = {
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count()},
+        'corpus': {'count': args.count, 'seed': args.seed},
+        'results': results,
+    }
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    out_path = args.out or os.path.join(BENCH_DIR, f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {out_path}")
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基准已保存: {BASELINE_PATH}")
+
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except Exception as e:
+            print(f"错误: 无法读取基准 {args.compare}: {e}")
+            return 1
+        if baseline.get('corpus') != report['corpus']:
+            print(f"[WARN] 基准使用的图片集不同: {baseline.get('corpus')}")
+        regressions = compare(results, baseline.get('results', []), args.threshold)
+        for key, before, after in regressions:
+            print(f"  ✗ {key:<40} {before:.2f} → {after:.2f} 张/秒")
+        if regressions:
+            print(f"发现 {len(regressions)} 项吞吐回归")
+            return 1
+        print("无吞吐回归")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,7 +8,21 @@ from PIL import Image, ImageTk, ImageDraw, ImageFont
 import math
 import os
 import platform
+from functools import lru_cache
 from constants import COLORS
+from app_log import log
+from image_processor import pyramid_resize
+from tiled_preview import TiledPreview
+
+# 拖拽缩放时预览的刷新间隔 (约 60fps)：期间只用低成本滤镜缩放已渲染的位图
+DRAG_FRAME_MS = 16
+FAST_RESAMPLE = Image.Resampling.BILINEAR
+
+
+@lru_cache(maxsize=32)
+def _load_sticker_png(path):
+    """读取贴纸 PNG (解码结果缓存，调用方不要修改返回的图片)"""
+    return Image.open(path).convert('RGBA')
 
 
 class CanvasWidget(tk.Frame):
@@ -36,12 +50,21 @@ class CanvasWidget(tk.Frame):
         self.main_image_id = None
         self.stickers = []  # 贴纸列表 [{id, x, y, text, size, is_image}]
         self.selected_sticker = None
-        self.sticker_photo_refs = []  # 保持图片引用，防止被垃圾回收
+        # 画布图片对象持有的 PhotoImage: {item_id: (photo, (size, mode))}
+        # 每个对象只保留一张，替换或删除对象时释放，尺寸不变时原地 paste 复用
+        self._item_photos = {}
         
         self.dragging_item = None
         self.drag_start_x = 0
         self.drag_start_y = 0
         
+        # 拖拽缩放的快速预览：{'kind', 'item', 'source', ...}，松开鼠标时做高质量渲染
+        self._fast_preview = None
+        self._fast_preview_job = None
+        
+        # 导出尺寸的缩放预览 (TiledPreview)，打开时鼠标操作用于缩放和平移
+        self.zoom_preview = None
+        
         # 缩放和选择状态
         self.selected_item = None  # 当前选中的 Canvas ID
         self.handle_type = None    # 当前拖拽的缩放柄类型 ('nw', 'ne', etc.)
@@ -57,6 +80,13 @@ class CanvasWidget(tk.Frame):
         self.canvas.bind('<Button-2>', self.show_context_menu)
         self.canvas.bind('<Button-3>', self.show_context_menu)
         self.canvas.bind('<Control-Button-1>', self.show_context_menu)
+        
+        # 缩放预览：滚轮缩放 (Linux 为 Button-4/5)，双击切换 100%，Esc 退出
+        self.canvas.bind('<MouseWheel>', self.on_canvas_wheel)
+        self.canvas.bind('<Button-4>', self.on_canvas_wheel)
+        self.canvas.bind('<Button-5>', self.on_canvas_wheel)
+        self.canvas.bind('<Double-Button-1>', self.on_canvas_double_click)
+        self.canvas.bind('<Escape>', lambda e: self.exit_zoom_preview())
             
         # 创建右键上下文菜单
         self.context_menu = tk.Menu(self, tearoff=0)
@@ -119,6 +149,7 @@ class CanvasWidget(tk.Frame):
     def clear_canvas(self):
         """清空画布"""
         self.canvas.delete('all')
+        self._item_photos.clear()
         self.canvas_items = []
         self.main_image_id = None
     def _ensure_layer_order(self):
@@ -192,8 +223,8 @@ class CanvasWidget(tk.Frame):
         if not pil_image:
             return
         
-        # 保存原始图片引用以便缩放
-        self.original_pil_image = pil_image.copy()
+        # 保存原始图片引用以便缩放 (图片处理都会生成新对象，不会原地修改，无需复制)
+        self.original_pil_image = pil_image
         
         # 调整图片大小以适应画布，留出边框空间
         img_width, img_height = pil_image.size
@@ -212,18 +243,18 @@ class CanvasWidget(tk.Frame):
         # 保存当前显示尺寸
         self.current_display_size = (new_width, new_height)
             
-        display_img = pil_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        self.photo = ImageTk.PhotoImage(display_img)
+        # 从金字塔中最接近的一级缩放，刷新和调整窗口时不必每次处理原图
+        display_img = pyramid_resize(pil_image, (new_width, new_height))
         
         # 删除所有标记为 main_image 的旧对象，确保不叠加
-        self.canvas.delete('main_image')
+        self._delete_items('main_image')
             
         self.main_image_id = self.canvas.create_image(
             self.width // 2, self.height // 2, 
-            image=self.photo, 
             anchor=tk.CENTER,
             tags='main_image'
         )
+        self.photo = self._set_item_image(self.main_image_id, display_img)
         self.canvas.image = self.photo
         
         # 强制重排图层
@@ -231,7 +262,7 @@ class CanvasWidget(tk.Frame):
     
     def clear_main_image(self):
         """清除主图片"""
-        self.canvas.delete('main_image')
+        self._delete_items('main_image')
         self.main_image_id = None
         self.photo = None
         self.original_pil_image = None
@@ -279,11 +310,9 @@ class CanvasWidget(tk.Frame):
             png_path = os.path.join(assets_dir, emoji_to_file[emoji_text])
             if os.path.exists(png_path):
                 try:
-                    img = Image.open(png_path).convert('RGBA')
-                    img = img.resize((size, size), Image.Resampling.LANCZOS)
-                    return img
+                    return _load_sticker_png(png_path).resize((size, size), Image.Resampling.LANCZOS)
                 except Exception as e:
-                    print(f"[DEBUG] 加载PNG贴纸失败: {e}")
+                    log.debug("加载PNG贴纸失败: %s", e)
         
         # 使用字体渲染彩色emoji
         font = self._get_emoji_font(size * 2)  # 使用更大的字体以获得更好的质量
@@ -304,7 +333,7 @@ class CanvasWidget(tk.Frame):
                         emoji_cropped = emoji_cropped.resize((size, size), Image.Resampling.LANCZOS)
                     return emoji_cropped
             except Exception as e:
-                print(f"[DEBUG] 渲染emoji失败: {e}")
+                log.debug("渲染emoji失败: %s", e)
         
         # 降级方案：返回None，使用文本显示
         return None
@@ -339,15 +368,12 @@ class CanvasWidget(tk.Frame):
         
         if emoji_img:
             # 使用图片显示（彩色）
-            photo = ImageTk.PhotoImage(emoji_img)
-            self.sticker_photo_refs.append(photo)  # 保持引用
-            
             sticker_id = self.canvas.create_image(
                 x, y,
-                image=photo,
                 anchor=tk.CENTER,
                 tags='sticker'
             )
+            self._set_item_image(sticker_id, emoji_img)
         else:
             # 降级方案：使用文本显示（黑白）
             sticker_id = self.canvas.create_text(
@@ -397,15 +423,12 @@ class CanvasWidget(tk.Frame):
         y = max(margin, min(self.height - margin, base_y + offset_y))
         
         # 使用图片显示
-        photo = ImageTk.PhotoImage(img)
-        self.sticker_photo_refs.append(photo)  # 保持引用
-        
         sticker_id = self.canvas.create_image(
             x, y,
-            image=photo,
             anchor=tk.CENTER,
             tags='sticker'
         )
+        self._set_item_image(sticker_id, img)
         
         # 添加到贴纸列表
         sticker_data = {
@@ -961,6 +984,8 @@ class CanvasWidget(tk.Frame):
 
     def show_context_menu(self, event):
         """显示右键菜单"""
+        if self.zoom_preview:
+            return
         # 查找下方对象
         item = self.canvas.find_closest(event.x, event.y)[0]
         tags = self.canvas.gettags(item)
@@ -986,6 +1011,10 @@ class CanvasWidget(tk.Frame):
 
     def on_canvas_click(self, event):
         """画布点击事件 - 增强识别逻辑"""
+        if self.zoom_preview:
+            self.zoom_preview.on_press(event)
+            return
+        
         # 1. 优先识别缩放手柄 (Handle)
         # 我们使用 find_closest 并限制距离，这比 find_overlapping 在大图层重叠时更可靠
         closest_items = self.canvas.find_closest(event.x, event.y, halo=3)
@@ -1032,18 +1061,17 @@ class CanvasWidget(tk.Frame):
             if 'text_layer' in tags:
                 was_selected = True
         
-        self.canvas.delete('text_layer')
+        self._delete_items('text_layer')
         
         self.text_pil_image = pil_image
-        self.text_photo = ImageTk.PhotoImage(pil_image)
         
         # 创建图片对象
         text_id = self.canvas.create_image(
             x, y,
-            image=self.text_photo,
             anchor=tk.NW, # 文字渲染通常从左上角开始
             tags='text_layer'
         )
+        self.text_photo = self._set_item_image(text_id, pil_image)
         # 确保在贴纸之上，边框之下
         self._ensure_layer_order()
         
@@ -1056,7 +1084,7 @@ class CanvasWidget(tk.Frame):
     
     def clear_text_layer(self):
         """清除文字层"""
-        self.canvas.delete('text_layer')
+        self._delete_items('text_layer')
         self.text_pil_image = None
         self.text_photo = None
         
@@ -1066,6 +1094,10 @@ class CanvasWidget(tk.Frame):
     
     def on_canvas_drag(self, event):
         """画布拖拽事件"""
+        if self.zoom_preview:
+            self.zoom_preview.on_drag(event)
+            return
+        
         dx = event.x - self.drag_start_x
         dy = event.y - self.drag_start_y
         
@@ -1087,19 +1119,19 @@ class CanvasWidget(tk.Frame):
                         sticker['size'] = new_size
                         
                         if sticker.get('is_image', False):
-                            # 图片类型：重新渲染并更新
-                            emoji_img = self._render_emoji_image(sticker['text'], new_size)
-                            if emoji_img:
-                                photo = ImageTk.PhotoImage(emoji_img)
-                                self.sticker_photo_refs.append(photo)  # 保持引用
-                                self.canvas.itemconfigure(self.selected_item, image=photo)
+                            # 图片类型：拖拽中缩放已渲染的位图，松开后再重新渲染
+                            if self._begin_fast_preview('sticker', self.selected_item,
+                                                        lambda: self._render_sticker_bitmap(sticker, current_size),
+                                                        sticker=sticker):
+                                self._fast_preview['size'] = (new_size, new_size)
+                                self._schedule_fast_preview()
                         else:
                             # 文本类型：调整字体大小
                             self.canvas.itemconfigure(self.selected_item, font=('Arial', new_size))
                         break
             
             elif 'text_layer' in tags:
-                # 文字层缩放：通过回调通知主窗口调整字号
+                # 文字层缩放：拖拽中缩放当前文字位图，松开后通过回调通知主窗口调整字号 (重新渲染)
                 if hasattr(self, 'on_text_interaction') and self.on_text_interaction:
                     # 简单的缩放因子计算
                     if 's' in self.handle_type or 'e' in self.handle_type:
@@ -1108,9 +1140,14 @@ class CanvasWidget(tk.Frame):
                         delta = -max(-dx, -dy)
                     
                     # 避免过快
-                    if abs(delta) > 5:
+                    if abs(delta) > 5 and getattr(self, 'text_pil_image', None) is not None:
                         factor = 1.0 + (delta / 200.0)
-                        self.on_text_interaction('scale', factor=factor)
+                        if self._begin_fast_preview('text', self.selected_item, lambda: self.text_pil_image):
+                            preview = self._fast_preview
+                            preview['factor'] = preview.get('factor', 1.0) * factor
+                            src = preview['source']
+                            preview['size'] = (int(src.width * preview['factor']), int(src.height * preview['factor']))
+                            self._schedule_fast_preview()
                         
                         # 重置 drag start 防止累积过快
                         self.drag_start_x = event.x
@@ -1150,11 +1187,10 @@ class CanvasWidget(tk.Frame):
                     new_w = min(new_w, self.width * 2)
                     new_h = min(new_h, self.height * 2)
                     
-                    # 重新渲染图片
-                    display_img = self.original_pil_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-                    self.photo = ImageTk.PhotoImage(display_img)
-                    self.canvas.itemconfigure(self.main_image_id, image=self.photo)
-                    self.canvas.image = self.photo
+                    # 拖拽中从缩小的代理图快速缩放，松开后从原图高质量渲染
+                    if self._begin_fast_preview('main_image', self.main_image_id, self._main_image_proxy):
+                        self._fast_preview['size'] = (new_w, new_h)
+                        self._schedule_fast_preview()
                     
                     # 更新当前显示尺寸
                     self.current_display_size = (new_w, new_h)
@@ -1197,11 +1233,156 @@ class CanvasWidget(tk.Frame):
     
     def on_canvas_release(self, event):
         """画布释放事件"""
+        if self.zoom_preview:
+            self.zoom_preview.on_release(event)
+            return
+        
         self.dragging_item = None
         self.handle_type = None
         # 清除缩放开始时的尺寸记录
         if hasattr(self, '_scale_start_size'):
             del self._scale_start_size
+        self._finish_fast_preview()
+    
+    # ---- 缩放预览 ----
+    
+    def enter_zoom_preview(self, scene_size, render_region, version=0):
+        """打开导出尺寸的缩放预览 (已打开时更新场景)
+        
+        Args:
+            scene_size: 导出尺寸 (width, height)
+            render_region: 渲染场景区域 (x0, y0, x1, y1) 的函数
+            version: 场景版本，变化后缓存的分块失效
+        """
+        if self.zoom_preview:
+            self.zoom_preview.set_scene(scene_size, render_region, version)
+            return
+        self._finish_fast_preview()
+        self._hide_scaling_handles()
+        self.dragging_item = None
+        self.handle_type = None
+        self.zoom_preview = TiledPreview(self.canvas, scene_size, render_region, version)
+        self.canvas.focus_set()
+    
+    def exit_zoom_preview(self):
+        """关闭缩放预览，回到编辑"""
+        if self.zoom_preview:
+            self.zoom_preview.close()
+            self.zoom_preview = None
+    
+    def on_canvas_wheel(self, event):
+        if self.zoom_preview:
+            self.zoom_preview.on_wheel(event)
+    
+    def on_canvas_double_click(self, event):
+        if self.zoom_preview:
+            self.zoom_preview.on_double_click(event)
+    
+    # ---- 画布图片对象的 PhotoImage ----
+    
+    def _set_item_image(self, item_id, pil_image):
+        """设置画布图片对象显示的图片，返回其 PhotoImage
+        
+        尺寸和模式与当前图片相同时原地 paste (不新建 PhotoImage)，否则替换并释放旧的
+        """
+        key = (pil_image.size, pil_image.mode)
+        entry = self._item_photos.get(item_id)
+        if entry is not None and entry[1] == key:
+            entry[0].paste(pil_image)
+            return entry[0]
+        if entry is None:
+            self._prune_item_images()
+        photo = ImageTk.PhotoImage(pil_image)
+        self._item_photos[item_id] = (photo, key)
+        self.canvas.itemconfigure(item_id, image=photo)
+        return photo
+    
+    def _delete_items(self, tag_or_id):
+        """删除画布对象并释放其图片"""
+        for item_id in self.canvas.find_withtag(tag_or_id):
+            self._item_photos.pop(item_id, None)
+        self.canvas.delete(tag_or_id)
+    
+    def _prune_item_images(self):
+        """释放已被删除的对象的图片 (如外部直接调用 canvas.delete 删除的贴纸)"""
+        stale = [item_id for item_id in self._item_photos if not self.canvas.type(item_id)]
+        for item_id in stale:
+            del self._item_photos[item_id]
+    
+    # ---- 拖拽缩放的快速预览 ----
+    
+    def _begin_fast_preview(self, kind, item, get_source, **extra):
+        """开始 (或继续) 快速预览，get_source 返回拖拽开始时已渲染的位图；无位图时返回 False"""
+        preview = self._fast_preview
+        if preview is not None and preview['item'] == item:
+            return True
+        self._finish_fast_preview()
+        source = get_source()
+        if source is None:
+            return False
+        self._fast_preview = dict(kind=kind, item=item, source=source, size=source.size, **extra)
+        return True
+    
+    def _schedule_fast_preview(self):
+        """合并鼠标事件，每帧最多刷新一次预览"""
+        if self._fast_preview_job is None:
+            self._fast_preview_job = self.after(DRAG_FRAME_MS, self._draw_fast_preview)
+    
+    def _draw_fast_preview(self):
+        self._fast_preview_job = None
+        preview = self._fast_preview
+        if preview is None:
+            return
+        w, h = preview['size']
+        if w <= 0 or h <= 0:
+            return
+        source = preview['source']
+        img = source if source.size == (w, h) else source.resize((w, h), FAST_RESAMPLE)
+        self._set_item_image(preview['item'], img)
+        self._update_scaling_handles()
+    
+    def _finish_fast_preview(self):
+        """结束快速预览：按最终尺寸做一次高质量渲染"""
+        if self._fast_preview_job is not None:
+            self.after_cancel(self._fast_preview_job)
+            self._fast_preview_job = None
+        preview, self._fast_preview = self._fast_preview, None
+        if preview is None:
+            return
+        kind = preview['kind']
+        if kind == 'sticker':
+            sticker = preview['sticker']
+            img = self._render_sticker_bitmap(sticker, sticker['size'])
+            if img:
+                self._set_item_image(preview['item'], img)
+        elif kind == 'main_image':
+            if getattr(self, 'original_pil_image', None) is not None and self.main_image_id:
+                display_img = pyramid_resize(self.original_pil_image, self.current_display_size)
+                self.photo = self._set_item_image(self.main_image_id, display_img)
+                self.canvas.image = self.photo
+        elif kind == 'text':
+            # 字号变化由主窗口重新渲染 (会替换文字层对象)
+            factor = preview.get('factor', 1.0)
+            if factor != 1.0 and getattr(self, 'on_text_interaction', None):
+                self.on_text_interaction('scale', factor=factor)
+        self._update_scaling_handles()
+    
+    def _render_sticker_bitmap(self, sticker, size):
+        """贴纸的高质量位图 (PNG 图片贴纸从原图缩放)"""
+        if sticker.get('image') is not None:
+            return sticker['image'].resize((size, size), Image.Resampling.LANCZOS)
+        return self._render_emoji_image(sticker['text'], size)
+    
+    def _main_image_proxy(self):
+        """主图片的代理图：原图缩小到不超过最大显示尺寸 (画布的 2 倍)，拖拽缩放时从它快速缩放"""
+        img = getattr(self, 'original_pil_image', None)
+        if img is None:
+            return None
+        limit_w, limit_h = self.width * 2, self.height * 2
+        if img.width <= limit_w and img.height <= limit_h:
+            return img
+        ratio = min(limit_w / img.width, limit_h / img.height)
+        return pyramid_resize(img, (max(1, int(img.width * ratio)), max(1, int(img.height * ratio))), FAST_RESAMPLE)
     
     def delete_selected_sticker(self):
         """删除选中项"""
@@ -1211,7 +1392,7 @@ class CanvasWidget(tk.Frame):
         tags = self.canvas.gettags(self.selected_item)
         
         if 'sticker' in tags:
-            self.canvas.delete(self.selected_item)
+            self._delete_items(self.selected_item)
             self.stickers = [s for s in self.stickers if s['id'] != self.selected_item]
             self.selected_sticker = None
             self.selected_item = None
@@ -1234,6 +1415,7 @@ class CanvasWidget(tk.Frame):
     
     def resize_canvas(self, width, height):
         """调整画布大小"""
+        self.exit_zoom_preview()
         if self.width == 0 or self.height == 0:
             scale_x = 1
             scale_y = 1
@@ -1258,11 +1440,9 @@ class CanvasWidget(tk.Frame):
             
             if sticker.get('is_image', False):
                 # 图片类型：重新渲染并更新
-                emoji_img = self._render_emoji_image(sticker['text'], sticker['size'])
+                emoji_img = self._render_sticker_bitmap(sticker, sticker['size'])
                 if emoji_img:
-                    photo = ImageTk.PhotoImage(emoji_img)
-                    self.sticker_photo_refs.append(photo)  # 保持引用
-                    self.canvas.itemconfigure(sticker['id'], image=photo)
+                    self._set_item_image(sticker['id'], emoji_img)
             else:
                 # 文本类型：调整字体大小
                 self.canvas.itemconfigure(sticker['id'], font=('Arial', sticker['size']))
@@ -1353,6 +1533,6 @@ class CanvasWidget(tk.Frame):
     
     def clear_text_layer(self):
         """清除文字层"""
-        self.canvas.delete('text_layer')
+        self._delete_items('text_layer')
         self._text_photo = None
         self._text_id = None
@@ -0,0 +1,317 @@
+"""
+图层合成模块 - 单张导出、预览文字层、批量处理共用的合成器
+
+每个图层按输出分辨率渲染成 RGBA 图层并缓存，图层以 key (可比较的输入参数) 标识：
+key 不变时直接复用，只重绘输入变化的图层，最后用 alpha_composite 合成。
+
+图层从下到上:
+    background  底色 + 背景图案 (不透明)
+    main_image  主图片
+    stickers    贴纸
+    border      边框 (圆角边框同时裁掉下方内容的四角)
+    text        文字层
+
+文字层以下的合成结果也会缓存，因此只改配文时只重绘文字层并做一次合成；
+预览后立即导出时，各图层 (包括预览时渲染的文字层) 都直接复用。
+compose_region 只合成指定区域 (如放大预览的可见分块)，不需要合成整幅图片。
+"""
+
+import json
+
+from PIL import Image, ImageChops
+
+from image_processor import CompositeImage, alpha_paste, rounded_clip_mask
+
+LAYER_ORDER = ('background', 'main_image', 'stickers', 'border', 'text')
+BASE_LAYERS = LAYER_ORDER[:-1]
+
+
+class Ref:
+    """按对象身份比较的 key 成员 (如源图片：不必逐像素比较，同时保持引用避免 id 被复用)"""
+
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __eq__(self, other):
+        return isinstance(other, Ref) and other.obj is self.obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+
+def freeze(value):
+    """字典/列表参数 → 可比较的 key"""
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class _Layer:
+    __slots__ = ('key', 'image', 'dest', 'clip')
+
+    def __init__(self, key, image=None, dest=(0, 0), clip=None):
+        self.key = key
+        self.image = image
+        self.dest = dest
+        self.clip = clip
+
+
+class LayerCompositor:
+    """按图层缓存的合成器 (非线程安全，每个使用者持有自己的实例)
+
+    Args:
+        width, height: 输出尺寸
+    """
+
+    def __init__(self, width=0, height=0):
+        self.width = 0
+        self.height = 0
+        self._layers = {}
+        self._base = None  # (文字层以下各层的 key, 合成结果)
+        self.revision = 0  # 任一图层重绘或尺寸变化时递增 (用于外部缓存，如预览分块)
+        self.set_size(width, height)
+
+    def set_size(self, width, height):
+        """改变输出尺寸 (所有图层失效)"""
+        if (width, height) != (self.width, self.height):
+            self.width, self.height = width, height
+            self.clear()
+
+    def fork(self):
+        """副本：共享已渲染的图层 (图层图片只读)，之后各自更新互不影响，可交给其他线程使用"""
+        other = LayerCompositor()
+        other.width, other.height = self.width, self.height
+        other._layers = dict(self._layers)
+        other._base = self._base
+        other.revision = self.revision
+        return other
+
+    def clear(self):
+        self._layers.clear()
+        self._base = None
+        self.revision += 1
+
+    def update(self, name, key, render):
+        """更新图层：key 与缓存相同时不重绘
+
+        Args:
+            name: LAYER_ORDER 中的图层名
+            key: 图层的全部输入参数 (可比较)
+            render: 重绘函数，返回 None (空图层)、RGBA 图片、(图片, (x, y))
+                    或 (图片, (x, y), 裁切遮罩) —— 遮罩为 L 模式，白色为下方内容保留区域
+
+        Returns:
+            bool: 是否重绘了图层
+        """
+        layer = self._layers.get(name)
+        if layer is not None and layer.key == key:
+            return False
+        self.revision += 1
+        result = render()
+        if result is None:
+            self._layers[name] = _Layer(key)
+            return True
+        if isinstance(result, Image.Image):
+            result = (result, (0, 0))
+        image, dest = result[0], result[1]
+        clip = result[2] if len(result) > 2 else None
+        if image is not None and image.mode != 'RGB':
+            if image.mode != 'RGBA':
+                image = image.convert('RGBA')
+            # 只保留有内容的区域，减少合成的像素数；完全不透明的图层存为 RGB，合成时直接粘贴
+            bbox = image.getbbox()
+            if bbox is None:
+                image = None
+            else:
+                if bbox != (0, 0, image.width, image.height):
+                    image = image.crop(bbox)
+                    dest = (dest[0] + bbox[0], dest[1] + bbox[1])
+                if image.getchannel('A').getextrema() == (255, 255):
+                    image = image.convert('RGB')
+        self._layers[name] = _Layer(key, image, dest, clip)
+        return True
+
+    def remove(self, name):
+        """清空图层"""
+        self.update(name, None, lambda: None)
+
+    def layer(self, name):
+        """已渲染的图层: (图片, (x, y))，空图层返回 (None, (0, 0))"""
+        layer = self._layers.get(name)
+        if layer is None:
+            return None, (0, 0)
+        return layer.image, layer.dest
+
+    def _composite(self, box, names):
+        """合成 box (x0, y0, x1, y1) 区域内的图层 names (不透明时为 RGB，有透明区域时为 RGBA)"""
+        x0, y0, x1, y1 = box
+        size = (x1 - x0, y1 - y0)
+        background = self._layers.get('background')
+        if background is not None and background.image is not None and background.image.mode == 'RGB' \
+                and background.dest == (0, 0) and background.image.size == (self.width, self.height):
+            base = background.image.crop(box)
+        else:
+            base = Image.new('RGBA', size, (0, 0, 0, 0))
+            if background is not None:
+                self._paste_layer(base, background, box)
+        for name in names[1:]:
+            layer = self._layers.get(name)
+            if layer is None:
+                continue
+            if layer.clip is not None:
+                if base.mode != 'RGBA':
+                    base = base.convert('RGBA')
+                clip = layer.clip if size == layer.clip.size else layer.clip.crop(box)
+                base.putalpha(ImageChops.multiply(base.getchannel('A'), clip))
+            self._paste_layer(base, layer, box)
+        return base
+
+    @staticmethod
+    def _paste_layer(base, layer, box):
+        """把图层与 box 相交的部分合成到 base (base 左上角对应 box 的左上角)"""
+        if layer.image is not None:
+            paste_region(base, layer.image, layer.dest, box)
+
+    def _build_base(self):
+        """文字层以下的合成结果 (缓存；不透明时为 RGB，有透明区域时为 RGBA)"""
+        chain = tuple(self._layers[n].key if n in self._layers else None for n in BASE_LAYERS)
+        if self._base is not None and self._base[0] == chain:
+            return self._base[1]
+        base = self._composite((0, 0, self.width, self.height), BASE_LAYERS)
+        self._base = (chain, base)
+        return base
+
+    def base_image(self):
+        """文字层以下的合成结果 (只读，如按背景亮度挑选文字颜色)"""
+        return self._build_base()
+
+    def compose(self, include_text=True):
+        """合成输出图片 (新图片，调用方可以修改)
+
+        Args:
+            include_text: False 时只合成文字层以下的图层
+
+        Returns:
+            没有透明区域时为 RGB 图片，否则为 RGBA 图片
+        """
+        result = self._build_base().copy()
+        text = self._layers.get('text')
+        if include_text and text is not None and text.image is not None:
+            alpha_paste(result, text.image, *text.dest)
+        return result
+
+    def compose_region(self, box):
+        """只合成 box (x0, y0, x1, y1) 区域 (新图片)
+
+        文字层以下的整幅结果已缓存时从中裁剪，否则只合成各图层与该区域相交的部分。
+        """
+        box = (max(0, box[0]), max(0, box[1]), min(self.width, box[2]), min(self.height, box[3]))
+        if self._base is not None and self._base[0] == tuple(
+                self._layers[n].key if n in self._layers else None for n in BASE_LAYERS):
+            result = self._base[1].crop(box)
+        else:
+            result = self._composite(box, BASE_LAYERS)
+        text = self._layers.get('text')
+        if text is not None:
+            self._paste_layer(result, text, box)
+        return result
+
+
+def paste_region(base, image, dest, box):
+    """把位于 dest 的图片与 box 相交的部分合成到 base (base 左上角对应 box 的左上角)"""
+    lx, ly = dest
+    ix0, iy0 = max(box[0], lx), max(box[1], ly)
+    ix1, iy1 = min(box[2], lx + image.width), min(box[3], ly + image.height)
+    if ix0 >= ix1 or iy0 >= iy1:
+        return
+    if (ix1 - ix0, iy1 - iy0) != image.size:
+        image = image.crop((ix0 - lx, iy0 - ly, ix1 - lx, iy1 - ly))
+    alpha_paste(base, image, ix0 - box[0], iy0 - box[1])
+
+
+# ---- 场景参数 → 输出分辨率 ----
+
+def scene_scale(width, height, display_width, display_height):
+    """画布显示坐标到输出分辨率的缩放比例
+
+    Returns:
+        (scale_x, scale_y, uniform): uniform 用于边框宽度、图案、贴纸大小等不分方向的尺寸
+    """
+    scale_x = width / display_width if display_width > 0 else 1.0
+    scale_y = height / display_height if display_height > 0 else 1.0
+    return scale_x, scale_y, max(scale_x, scale_y)
+
+
+def scale_border(border_config, scale):
+    """按输出分辨率缩放边框配置"""
+    scaled = dict(border_config)
+    for field in ('width', 'radius', 'pattern_size'):
+        if field in scaled:
+            scaled[field] = int((scaled.get(field) or 0) * scale)
+    return scaled
+
+
+def text_safe_margin(scaled_border, width, height, scale_x):
+    """文字防遮挡的安全边距：边框宽度 + 按方向的留白 (横屏多留白，竖屏少留白)"""
+    if not scaled_border or scaled_border.get('id') == 'none':
+        return 0
+    margin = scaled_border.get('width', 0)
+    margin += int((60 if width > height else 10) * scale_x)
+    return margin
+
+
+# ---- 各图层的渲染 (输出分辨率) ----
+
+def render_background(width, height, color, pattern, pattern_color, pattern_size):
+    composite = CompositeImage(width, height, bg_color=color)
+    composite.draw_background_pattern(pattern, pattern_color, pattern_size)
+    return composite.canvas
+
+
+def render_stickers(width, height, stickers):
+    """stickers: [(emoji, x, y, size)] (输出分辨率)"""
+    if not stickers:
+        return None
+    composite = CompositeImage(width, height, bg_color=(0, 0, 0, 0), mode='RGBA')
+    for emoji, x, y, size in stickers:
+        composite.add_sticker(emoji, x, y, size)
+    return composite.canvas
+
+
+def has_border(scaled_border):
+    """是否需要绘制边框 (无边框或宽度为 0 时不绘制)"""
+    return bool(scaled_border) and scaled_border.get('id') != 'none' and scaled_border.get('width', 0) > 0
+
+
+def is_rounded_border(scaled_border):
+    """圆角边框 (同时裁掉下方内容的四角，输出带透明区域)"""
+    return (scaled_border.get('shape') in ('rounded_rect', 'circle', 'ellipse')
+            or scaled_border.get('radius', 0) > 0)
+
+
+def render_border(width, height, scaled_border):
+    """边框图层 (圆角边框附带裁切遮罩)，宽度为 0 时不绘制"""
+    if not has_border(scaled_border):
+        return None
+    composite = CompositeImage(width, height, bg_color=(0, 0, 0, 0), mode='RGBA')
+    if is_rounded_border(scaled_border):
+        composite.add_rounded_border(scaled_border)
+        clip = rounded_clip_mask(width, height, scaled_border.get('width', 10), scaled_border.get('radius', 20))
+        return composite.canvas, (0, 0), clip
+    composite.add_border(scaled_border)
+    return composite.canvas
+
+
+def render_text(text_layer, width, height, safe_margin):
+    """文字图层 (只占文字区域)"""
+    if not text_layer or not text_layer.content:
+        return None
+    rendered, x, y = text_layer.render(width, height, scale=1.0,
+                                       safe_margin_x=safe_margin, safe_margin_y=safe_margin)
+    if not rendered:
+        return None
+    return rendered, (x, y)
+
+
+def text_key(text_layer, width, height, safe_margin):
+    return (freeze(text_layer.to_dict()), width, height, safe_margin)
@@ -46,6 +46,13 @@ SIZE_PRESETS = [
         'height': 1920,
         'dpi': 72
     },
+    {
+        'id': 'print_poster_a1',
+        'name': 'A1 打印海报',
+        'width': 7016,
+        'height': 9933,
+        'dpi': 300
+    },
     {
         'id': 'custom',
         'name': '自定义尺寸',
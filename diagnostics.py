@@ -0,0 +1,221 @@
+"""
+诊断模块 - 可选的 cProfile / tracemalloc 采样，报告写入诊断目录
+
+默认关闭，不影响性能。开启方式 (任选其一，环境变量优先):
+    环境变量  TUPIAN_DIAGNOSTICS=1             (或 "every=20,memory=0")
+    settings.json  "diagnostics": {"enabled": true, "sample_every": 20, "memory": true}
+
+- 单张导出: 整个渲染 + 保存过程的 CPU 分析和内存分配
+- 批量导出: 整批的内存分配 (tracemalloc)，每 N 项对一项做 CPU 分析 (读取、合成、编码三个阶段)
+"""
+
+import io
+import os
+import re
+import cProfile
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+
+ENV_VAR = 'TUPIAN_DIAGNOSTICS'
+DIAG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'diagnostics')
+
+DEFAULT_SAMPLE_EVERY = 20
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 30
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]+', '_', name)[:60]
+
+
+def _write_cpu_report(profile, path):
+    """保存 .pstats 以及按累计耗时排序的文本摘要"""
+    profile.dump_stats(path)
+    buffer = io.StringIO()
+    stats = pstats.Stats(path, stream=buffer)
+    stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    with open(os.path.splitext(path)[0] + '_cpu.txt', 'w', encoding='utf-8') as f:
+        f.write(buffer.getvalue())
+
+
+class ItemProfile:
+    """单项 CPU 分析，可在多个线程中分段启用 (读取 → 合成 → 编码)，最后 dump()"""
+
+    def __init__(self, path):
+        self.path = path
+        self.profile = cProfile.Profile()
+        self._active = False
+        self._used = False
+
+    def __enter__(self):
+        try:
+            self.profile.enable()
+            self._active = self._used = True
+        except (ValueError, RuntimeError):
+            # Python 3.12+ 同一时刻只能启用一个分析器，冲突时跳过这一段
+            self._active = False
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._active:
+            self.profile.disable()
+            self._active = False
+        return False
+
+    def dump(self):
+        if not self._used:
+            return None
+        try:
+            _write_cpu_report(self.profile, self.path)
+            return self.path
+        except Exception as e:
+            print(f"[WARN] 保存诊断报告失败: {e}")
+            return None
+
+
+class DiagnosticSession:
+    """一次导出/批量处理的诊断 (未开启诊断时 start/stop 不做任何事)"""
+
+    def __init__(self, owner, name, cpu=True):
+        self.owner = owner
+        self.name = name
+        self.cpu = cpu
+        self._profile = None
+        self._started_tracing = False
+        self._start_time = None
+        self.reports = []
+
+    def start(self):
+        if not self.owner.enabled or self._start_time is not None:
+            return self
+        self._start_time = time.perf_counter()
+        if self.owner.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.cpu:
+            self._profile = ItemProfile(self.owner.report_path(self.name, '.pstats'))
+            self._profile.__enter__()
+        return self
+
+    def stop(self):
+        """结束并写入报告 (可重复调用)"""
+        if self._start_time is None:
+            return self.reports
+        elapsed = time.perf_counter() - self._start_time
+        self._start_time = None
+
+        if self._profile:
+            self._profile.__exit__(None, None, None)
+            path = self._profile.dump()
+            if path:
+                self.reports.append(path)
+            self._profile = None
+
+        if tracemalloc.is_tracing():
+            try:
+                self.reports.append(self._write_memory_report(elapsed))
+            except Exception as e:
+                print(f"[WARN] 保存内存报告失败: {e}")
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+        print(f"[DIAG] {self.name}: {elapsed:.2f}s, 报告: {', '.join(self.reports) or '无'}")
+        return self.reports
+
+    def _write_memory_report(self, elapsed):
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib*'),
+        ))
+        path = self.owner.report_path(self.name, '_alloc.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"{self.name}  耗时 {elapsed:.2f}s\n")
+            f.write(f"峰值: {peak / (1024 * 1024):.1f} MB  当前: {current / (1024 * 1024):.1f} MB\n\n")
+            f.write(f"当前未释放的分配 (前 {TOP_ALLOCATIONS} 行):\n")
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write(f"  {stat}\n")
+        return path
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+class Diagnostics:
+    """诊断开关和报告目录 (全局单例 diagnostics)"""
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_every = DEFAULT_SAMPLE_EVERY
+        self.memory = True
+        self.output_dir = DIAG_DIR
+        self._settings = {}  # settings.json 中的配置 (保存设置时原样写回，不写入环境变量的临时配置)
+        self.from_env = self.configure_from_env()
+
+    def configure(self, enabled=None, sample_every=None, memory=None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if sample_every is not None:
+            self.sample_every = max(0, int(sample_every))
+        if memory is not None:
+            self.memory = bool(memory)
+
+    def configure_from_env(self):
+        """读取环境变量，返回是否已设置"""
+        value = os.environ.get(ENV_VAR, '').strip()
+        if not value:
+            return False
+        if value.lower() in ('0', 'false', 'off', 'no'):
+            self.configure(enabled=False)
+            return True
+        self.configure(enabled=True)
+        for part in value.split(','):
+            key, _, val = part.partition('=')
+            try:
+                if key.strip() == 'every':
+                    self.configure(sample_every=int(val))
+                elif key.strip() == 'memory':
+                    self.configure(memory=val.strip() not in ('0', 'false', 'off', 'no'))
+            except ValueError:
+                print(f"[WARN] 无法解析 {ENV_VAR}: {part}")
+        return True
+
+    def configure_from_settings(self, settings):
+        """读取 settings.json 中的 diagnostics 配置 (设置了环境变量时以环境变量为准)"""
+        if not isinstance(settings, dict):
+            return
+        self._settings = dict(settings)
+        if self.from_env:
+            return
+        self.configure(settings.get('enabled'), settings.get('sample_every'), settings.get('memory'))
+
+    def to_settings(self):
+        if self.from_env:
+            return dict(self._settings)
+        return {'enabled': self.enabled, 'sample_every': self.sample_every, 'memory': self.memory}
+
+    def report_path(self, name, suffix):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
+        return os.path.join(self.output_dir, f"{stamp}_{_safe_name(name)}{suffix}")
+
+    def session(self, name, cpu=True):
+        """整次操作的诊断，用法: with diagnostics.session('export_image'): ... 或 start()/stop()"""
+        return DiagnosticSession(self, name, cpu)
+
+    def sample_item(self, index, label):
+        """第 index 项 (从 0 开始) 是否采样；采样时返回 ItemProfile，否则返回 None"""
+        if not self.enabled or self.sample_every <= 0 or index % self.sample_every:
+            return None
+        return ItemProfile(self.report_path(f"item{index:05d}_{label}", '.pstats'))
+
+
+# 全局单例
+diagnostics = Diagnostics()
@@ -8,25 +8,40 @@ import os
 from pathlib import Path
 
 BG_DIR = Path(__file__).parent / 'assets' / 'backgrounds'
-BG_DIR.mkdir(parents=True, exist_ok=True)
 
 # 小红书竖屏尺寸
 WIDTH = 1242
 HEIGHT = 1660
 
-def create_gradient_background(name, color1, color2):
-    """创建渐变背景"""
-    img = Image.new('RGB', (WIDTH, HEIGHT), color1)
+def gradient_image(width, height, color1, color2):
+    """垂直渐变图 (benchmark_batch.py 生成测试图片时也会用到)"""
+    img = Image.new('RGB', (width, height), color1)
     draw = ImageDraw.Draw(img)
     
     # 垂直渐变
-    for y in range(HEIGHT):
-        ratio = y / HEIGHT
+    for y in range(height):
+        ratio = y / height
         r = int(color1[0] * (1 - ratio) + color2[0] * ratio)
         g = int(color1[1] * (1 - ratio) + color2[1] * ratio)
         b = int(color1[2] * (1 - ratio) + color2[2] * ratio)
-        draw.line([(0, y), (WIDTH, y)], fill=(r, g, b))
-    
+        draw.line([(0, y), (width, y)], fill=(r, g, b))
+    return img
+
+def dot_pattern_image(width, height, base_color, pattern_color, spacing=80, radius=10):
+    """圆点图案图"""
+    img = Image.new('RGB', (width, height), base_color)
+    draw = ImageDraw.Draw(img)
+    for x in range(0, width, spacing):
+        for y in range(0, height, spacing):
+            draw.ellipse(
+                [x-radius, y-radius, x+radius, y+radius],
+                fill=pattern_color
+            )
+    return img
+
+def create_gradient_background(name, color1, color2):
+    """创建渐变背景"""
+    img = gradient_image(WIDTH, HEIGHT, color1, color2)
     img.save(BG_DIR / f'{name}.png')
     print(f"✓ {name}.png")
 
@@ -38,41 +53,36 @@ def create_solid_background(name, color):
 
 def create_pattern_background(name, base_color, pattern_color):
     """创建图案背景"""
-    img = Image.new('RGB', (WIDTH, HEIGHT), base_color)
-    draw = ImageDraw.Draw(img)
-    
     # 简单圆点图案
-    spacing = 80
-    radius = 10
-    for x in range(0, WIDTH, spacing):
-        for y in range(0, HEIGHT, spacing):
-            draw.ellipse(
-                [x-radius, y-radius, x+radius, y+radius],
-                fill=pattern_color
-            )
-    
+    img = dot_pattern_image(WIDTH, HEIGHT, base_color, pattern_color)
     img.save(BG_DIR / f'{name}.png')
     print(f"✓ {name}.png")
 
-print("=" * 50)
-print("  生成默认背景图片")
-print("=" * 50)
-print()
+def main():
+    BG_DIR.mkdir(parents=True, exist_ok=True)
+    
+    print("=" * 50)
+    print("  生成默认背景图片")
+    print("=" * 50)
+    print()
+
+    # 纯色背景
+    create_solid_background('white', (255, 255, 255))
+    create_solid_background('light_gray', (245, 245, 245))
+    create_solid_background('cream', (255, 248, 220))
 
-# 纯色背景
-create_solid_background('white', (255, 255, 255))
-create_solid_background('light_gray', (245, 245, 245))
-create_solid_background('cream', (255, 248, 220))
+    # 渐变背景
+    create_gradient_background('gradient_blue', (227, 242, 253), (187, 222, 251))
+    create_gradient_background('gradient_pink', (252, 228, 236), (248, 187, 208))
+    create_gradient_background('gradient_purple', (243, 229, 245), (225, 190, 231))
+    create_gradient_background('gradient_green', (232, 245, 233), (200, 230, 201))
 
-# 渐变背景
-create_gradient_background('gradient_blue', (227, 242, 253), (187, 222, 251))
-create_gradient_background('gradient_pink', (252, 228, 236), (248, 187, 208))
-create_gradient_background('gradient_purple', (243, 229, 245), (225, 190, 231))
-create_gradient_background('gradient_green', (232, 245, 233), (200, 230, 201))
+    # 图案背景
+    create_pattern_background('dots_light', (255, 255, 255), (240, 240, 240))
 
-# 图案背景
-create_pattern_background('dots_light', (255, 255, 255), (240, 240, 240))
+    print()
+    print(f"✓ 完成！共生成 8 个背景图片")
+    print(f"✓ 保存位置: {BG_DIR}")
 
-print()
-print(f"✓ 完成！共生成 8 个背景图片")
-print(f"✓ 保存位置: {BG_DIR}")
+if __name__ == '__main__':
+    main()
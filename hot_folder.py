@@ -0,0 +1,190 @@
+"""
+监视目录模块 - 轮询输入目录，新文件写入完成后持续套用当前主题处理
+"""
+
+import os
+import json
+import time
+import threading
+
+import input_scanner
+import batch_manifest
+from batch_renderer import unique_output_name
+from image_encoder import format_bytes
+
+# 默认轮询间隔和"写入完成"判定时间 (秒)
+POLL_INTERVAL = 0.5
+SETTLE_TIME = 1.0
+
+# 任务参数文件 (批量导出/开始监视时写入输出目录，供无界面运行使用)
+JOB_SPEC_FILENAME = '.batch_job.json'
+
+
+def _is_readable(path):
+    """文件能否以只读方式打开 (部分系统上仍在写入的文件会被锁定)"""
+    try:
+        with open(path, 'rb') as f:
+            f.read(1)
+        return True
+    except OSError:
+        return False
+
+
+class HotFolderWatcher:
+    """轮询监视目录中的新图片
+
+    文件大小和修改时间在 settle_time 内保持不变且可以打开时，才认为已写入完成，
+    然后在监视线程中回调 on_ready(ScannedFile)。
+
+    每次轮询每个目录只 stat 一次，只重新读取有变化的目录 (见 DirectoryListings)，
+    然后只检查尚未完成写入的文件，大目录树上的轮询开销与文件总数无关。
+    输出目录位于输入目录内时作为 exclude 传入，输出的文件不会再被当作输入。
+    """
+
+    def __init__(self, root, on_ready, recursive=True, poll_interval=POLL_INTERVAL,
+                 settle_time=SETTLE_TIME, include_existing=True, exclude=None):
+        self.root = root
+        self.on_ready = on_ready
+        self.recursive = recursive
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.include_existing = include_existing
+
+        self._listings = input_scanner.DirectoryListings(root, recursive, exclude=exclude)
+        self._seen = {}         # 目录路径 -> 其中已交付的文件路径 (目录变化时清理已删除的文件)
+        self._pending = {}      # 路径 -> (ScannedFile, 目录路径, size, mtime, 首次观察到该状态的时间)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def is_running(self):
+        return bool(self._thread and self._thread.is_alive() and not self._stop.is_set())
+
+    def join(self, timeout=None):
+        """等待监视线程退出 (正在处理的文件会先处理完)"""
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        if not self.include_existing:
+            # 只处理启动之后出现的文件
+            for dir_path, items in self._listings.changed_dirs():
+                self._seen[dir_path] = {item.path for item in items}
+
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[ERROR] 监视目录扫描失败: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def poll(self):
+        """扫描一次，交付已写入完成的新文件"""
+        for dir_path, items in self._listings.changed_dirs():
+            seen = self._seen.get(dir_path)
+            if seen:
+                # 目录内容有变化：不再列出的文件 (已删除或改名) 不再记录
+                seen.intersection_update(item.path for item in items)
+            for item in items:
+                if (not seen or item.path not in seen) and item.path not in self._pending:
+                    # 不保留 DirEntry：其缓存的状态可能是文件写入过程中的
+                    self._pending[item.path] = (input_scanner.ScannedFile(item.path, item.rel_dir), dir_path,
+                                                None, None, None)
+        for dir_path in self._listings.removed:
+            self._seen.pop(dir_path, None)
+
+        now = time.monotonic()
+        for path in sorted(self._pending):
+            if self._stop.is_set():
+                return
+            item, dir_path, size, mtime, since = self._pending[path]
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # 未完成的文件已被删除
+                del self._pending[path]
+                continue
+            except OSError:
+                continue
+
+            if (size, mtime) != (stat.st_size, stat.st_mtime):
+                # 新出现或仍在变化，重新计时
+                self._pending[path] = (item, dir_path, stat.st_size, stat.st_mtime, now)
+                continue
+            if stat.st_size == 0 or now - since < self.settle_time:
+                continue
+            if not _is_readable(path):
+                continue
+
+            del self._pending[path]
+            self._seen.setdefault(dir_path, set()).add(path)
+            try:
+                self.on_ready(item)
+            except Exception as e:
+                # 单个文件出错不影响同一轮的其他文件
+                print(f"[ERROR] 处理 {path} 失败: {e}")
+
+
+def write_job_spec(spec, output_dir):
+    """保存任务参数到输出目录 (命令行运行时默认读取)"""
+    path = os.path.join(output_dir, JOB_SPEC_FILENAME)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_job_spec(path):
+    """读取任务参数文件"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def process_file(renderer, item, output_dir, text_content=None, manifest=None, mirror=True, log=None):
+    """渲染一个到达的文件并保存 (监视模式和命令行共用)
+
+    Returns:
+        (status, path): status 为 'done' / 'skipped' (输入和参数都未变化，path 为已有输出) / 'failed'
+    """
+    log = log or print
+    filename = os.path.basename(item.path)
+    item_output_dir = output_dir
+    try:
+        if mirror and item.rel_dir:
+            item_output_dir = os.path.join(output_dir, item.rel_dir)
+            os.makedirs(item_output_dir, exist_ok=True)
+        # 扫描之后文件可能已被删除或仍被锁定：读取失败同样记为失败，不影响同一轮的其他文件
+        if manifest:
+            content_hash = manifest.content_hash(item.path, item.stat())
+            item_spec_hash = batch_manifest.spec_hash(renderer.spec, text_content)
+            done_path = manifest.lookup_done(item.path, content_hash, item_spec_hash)
+            if done_path:
+                log(f"  └─ 跳过: 未变化 ({os.path.basename(done_path)})")
+                return 'skipped', done_path
+            manifest.mark_running(item.path, content_hash, item_spec_hash, item.stat())
+
+        composite = renderer.render(item.path, text_content, log=log)
+        save_path = os.path.join(item_output_dir, unique_output_name(filename))
+        if not composite.save(save_path, renderer.spec.get('encoder'), renderer.spec.get('output_format'),
+                              renderer.spec.get('dpi')):
+            raise IOError('保存出错')
+        save_path = composite.saved_path
+    except Exception as e:
+        log(f"  └─ 错误: {e}")
+        if manifest:
+            manifest.mark_failed(item.path, e)
+        return 'failed', None
+
+    if manifest:
+        manifest.mark_done(item.path, save_path)
+    log(f"  └─ 成功: {os.path.basename(save_path)} ({format_bytes(composite.saved_bytes)})")
+    return 'done', save_path
+
@@ -0,0 +1,356 @@
+"""
+图片编码模块 - 按编码档位 (快速 / 均衡 / 最小体积) 保存 PNG、JPEG、WebP
+
+单张导出、批量导出、监视目录和命令行共用，保存后返回编码后的字节数。
+另支持调色板量化 PNG 和"自动"输出格式 (在画质阈值内选体积最小的格式)，
+以及按条带逐块写入的 PNG (超大打印尺寸不需要整幅图片在内存中)。
+"""
+
+import io
+import os
+import math
+import zlib
+import struct
+
+from PIL import Image, ImageChops, ImageStat
+
+# 编码档位 -> 各格式的保存参数
+# PNG optimize=True 会强制最高压缩级别并多次尝试，往往比合成本身还慢
+ENCODER_PROFILES = {
+    'fast': {
+        'png': {'compress_level': 1},
+        'jpeg': {'quality': 90, 'subsampling': '4:2:0'},
+        'webp': {'lossless': False, 'quality': 85, 'method': 0},
+    },
+    'balanced': {
+        'png': {'compress_level': 6},
+        'jpeg': {'quality': 95, 'optimize': True},
+        'webp': {'lossless': False, 'quality': 90, 'method': 4},
+    },
+    'smallest': {
+        'png': {'optimize': True},
+        'jpeg': {'quality': 85, 'optimize': True, 'progressive': True, 'subsampling': '4:2:0'},
+        'webp': {'lossless': False, 'quality': 80, 'method': 6},
+    },
+}
+
+# 档位友好名称 (用于UI显示)
+PROFILE_NAMES = {
+    'fast': '快速',
+    'balanced': '均衡 (默认)',
+    'smallest': '最小体积',
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+# 扩展名 -> 格式
+FORMATS = {
+    '.png': 'png',
+    '.jpg': 'jpeg',
+    '.jpeg': 'jpeg',
+    '.webp': 'webp',
+}
+
+# 批量输出格式 -> 友好名称
+OUTPUT_FORMATS = {
+    'source': '与原图相同',
+    'png': 'PNG',
+    'png8': 'PNG 调色板 (量化)',
+    'jpeg': 'JPEG',
+    'webp': 'WebP',
+    'auto': '自动 (最小体积)',
+}
+DEFAULT_OUTPUT_FORMAT = 'source'
+
+FORMAT_EXTENSIONS = {
+    'png': '.png',
+    'png8': '.png',
+    'jpeg': '.jpg',
+    'webp': '.webp',
+}
+
+# 自动格式可能产生的扩展名
+AUTO_EXTENSIONS = ('.png', '.webp', '.jpg')
+
+# 有损输出 (量化 PNG / WebP / JPEG) 的最低画质 (PSNR, dB)
+DEFAULT_MIN_PSNR = 40.0
+
+# 调色板颜色数上限
+PALETTE_COLORS = 256
+
+
+def profile_from_name(name):
+    """友好名称 (或档位名) -> 档位名，未知时返回默认档位"""
+    if name in ENCODER_PROFILES:
+        return name
+    for key, label in PROFILE_NAMES.items():
+        if label == name:
+            return key
+    return DEFAULT_PROFILE
+
+
+def format_for_path(file_path):
+    """根据扩展名确定输出格式 (其他扩展名返回 None，由 Pillow 自行判断)"""
+    return FORMATS.get(os.path.splitext(file_path)[1].lower())
+
+
+def output_format_from_name(name):
+    """友好名称 (或格式名) -> 输出格式，未知时返回默认格式"""
+    if name in OUTPUT_FORMATS:
+        return name
+    for key, label in OUTPUT_FORMATS.items():
+        if label == name:
+            return key
+    return DEFAULT_OUTPUT_FORMAT
+
+
+def output_extension(output_format, source_ext):
+    """输出文件扩展名 ('auto' 编码前无法确定，返回 None)"""
+    if output_format == 'auto':
+        return None
+    return FORMAT_EXTENSIONS.get(output_format, source_ext)
+
+
+def save_options(fmt, profile=None):
+    """某格式在指定档位下的保存参数"""
+    options = ENCODER_PROFILES.get(profile or DEFAULT_PROFILE, ENCODER_PROFILES[DEFAULT_PROFILE])
+    return dict(options[fmt])
+
+
+def prepare_image(image, fmt):
+    """转换为目标格式支持的模式 (JPEG 不支持透明，透明部分填充为白色)"""
+    if fmt == 'jpeg':
+        if image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])
+            return background
+        if image.mode != 'RGB':
+            return image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+        return image.convert('RGBA')
+    return image
+
+
+def has_transparency(image):
+    """是否含有非不透明像素"""
+    if image.mode == 'RGBA':
+        return image.getchannel('A').getextrema()[0] < 255
+    return image.mode in ('LA', 'PA') or 'transparency' in image.info
+
+
+def psnr(original, encoded):
+    """两张图片的峰值信噪比 (dB)，完全相同返回 inf"""
+    mode = 'RGBA' if original.mode in ('RGBA', 'LA', 'PA') else 'RGB'
+    a = original.convert(mode)
+    b = encoded.convert(mode)
+    stat = ImageStat.Stat(ImageChops.difference(a, b))
+    mse = sum(stat.sum2) / (a.width * a.height * len(stat.sum2))
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 * 255 / mse)
+
+
+def _palette_mode(image):
+    """调色板转换前统一为 RGB / RGBA (没有透明像素的 RGBA 按 RGB 处理)"""
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if has_transparency(image) else 'RGB')
+    if image.mode == 'RGBA' and not has_transparency(image):
+        image = image.convert('RGB')
+    return image
+
+
+def exact_palette(image):
+    """无损转换为调色板图片，做不到时返回 None
+
+    颜色数不超过调色板大小时每种颜色一个调色板项；带透明度的图片用 tRNS 记录每项的 alpha，
+    要求同一 RGB 颜色只有一种透明度。转换结果还原后与原图逐像素比较，不一致时同样返回 None。
+    """
+    image = _palette_mode(image)
+    used = image.getcolors(PALETTE_COLORS)
+    if used is None:
+        return None
+    rgb, alphas = image, None
+    if image.mode == 'RGBA':
+        alphas = {}
+        for _, (r, g, b, a) in used:
+            if alphas.setdefault((r, g, b), a) != a:
+                return None
+        rgb = image.convert('RGB')
+    quantized = rgb.quantize(len(used), method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+    if alphas is not None:
+        palette = quantized.getpalette()
+        quantized.info['transparency'] = bytes(alphas.get(tuple(palette[i:i + 3]), 255)
+                                               for i in range(0, len(palette), 3))
+    if ImageChops.difference(quantized.convert(image.mode), image).getbbox(alpha_only=False) is not None:
+        return None
+    return quantized
+
+
+def quantize(image, colors=PALETTE_COLORS):
+    """转换为调色板图片 (png8 / 自动格式使用，可能有损)
+
+    能无损转换时使用 exact_palette 的结果，否则自适应量化。
+    """
+    image = _palette_mode(image)
+    exact = exact_palette(image)
+    if exact is not None:
+        return exact
+    used = image.getcolors(colors)
+    method = Image.Quantize.FASTOCTREE if image.mode == 'RGBA' else Image.Quantize.MEDIANCUT
+    if used is not None:
+        # 颜色少但无法逐色对应 (同一颜色有多种透明度)：每种颜色一个调色板项，不抖动
+        return image.quantize(len(used), method=method, dither=Image.Dither.NONE)
+    return image.quantize(colors, method=method)
+
+
+def _encode_bytes(image, fmt, profile=None, dpi=None):
+    """编码到内存 (dpi 写入 PNG / JPEG 元数据)"""
+    buffer = io.BytesIO()
+    image = prepare_image(image, fmt)
+    options = save_options('png' if fmt == 'png8' else fmt, profile)
+    if dpi and fmt != 'webp':
+        options['dpi'] = (dpi, dpi)
+    if fmt == 'png8':
+        image = quantize(image)
+        fmt = 'png'
+    elif fmt == 'png' and profile == 'smallest':
+        # 能无损转换时保存为调色板 PNG，体积通常只有几分之一 (否则保持真彩色)
+        image = exact_palette(image) or image
+    image.save(buffer, format=fmt.upper(), **options)
+    return buffer.getvalue()
+
+
+def _quality_ok(image, data, min_psnr):
+    return psnr(image, Image.open(io.BytesIO(data))) >= min_psnr
+
+
+def encode_best(image, profile=None, min_psnr=DEFAULT_MIN_PSNR, dpi=None):
+    """在画质阈值内选择体积最小的格式
+
+    无损 PNG 始终作为候选；量化 PNG、WebP、JPEG (仅不透明图片) 达到 min_psnr 时参与比较。
+    dpi 写入 PNG / JPEG 元数据 (见 _encode_bytes)。
+
+    Returns:
+        (fmt, data): fmt 为 'png' / 'webp' / 'jpeg'
+    """
+    best_fmt, best = 'png', _encode_bytes(image, 'png', profile, dpi)
+    candidates = ['png8', 'webp']
+    if not has_transparency(image):
+        candidates.append('jpeg')
+    for fmt in candidates:
+        data = _encode_bytes(image, fmt, profile, dpi)
+        if len(data) < len(best) and _quality_ok(image, data, min_psnr):
+            best_fmt, best = ('png' if fmt == 'png8' else fmt), data
+    return best_fmt, best
+
+
+def encode_image(image, file_path, profile=None, dpi=None):
+    """按档位保存图片
+
+    Args:
+        dpi: 写入文件的分辨率 (如打印尺寸的 300)，None 时不写
+
+    Returns:
+        int: 编码后的字节数
+    """
+    fmt = format_for_path(file_path)
+    if fmt is None:
+        # BMP / GIF 等格式没有可调的编码参数
+        image.save(file_path, **({'dpi': (dpi, dpi)} if dpi else {}))
+        return os.path.getsize(file_path)
+    data = _encode_bytes(image, fmt, profile, dpi)
+    with open(file_path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def save_as(image, file_path, profile=None, output_format=None, min_psnr=DEFAULT_MIN_PSNR, dpi=None):
+    """按输出格式保存，扩展名随格式调整
+
+    Args:
+        output_format: OUTPUT_FORMATS 中的格式，None / 'source' 表示按 file_path 的扩展名
+        min_psnr: 量化 PNG、自动格式的最低画质
+        dpi: 写入文件的分辨率，None 时不写
+
+    Returns:
+        (path, size): 实际保存路径和字节数
+    """
+    if output_format in (None, 'source'):
+        return file_path, encode_image(image, file_path, profile, dpi)
+
+    base = os.path.splitext(file_path)[0]
+    if output_format == 'auto':
+        fmt, data = encode_best(image, profile, min_psnr, dpi)
+        ext = FORMAT_EXTENSIONS[fmt]
+    else:
+        data = _encode_bytes(image, output_format, profile, dpi)
+        ext = FORMAT_EXTENSIONS[output_format]
+        if output_format == 'png8' and not _quality_ok(image, data, min_psnr):
+            # 颜色过多，量化后画质不达标时保存完整 PNG
+            data = _encode_bytes(image, 'png', profile, dpi)
+
+    path = base + ext
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path, len(data)
+
+
+def _png_chunk(f, tag, data=b''):
+    f.write(struct.pack('>I', len(data)) + tag + data)
+    f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(tag)) & 0xFFFFFFFF))
+    return len(data) + 12
+
+
+def write_png_strips(file_path, size, mode, strips, profile=None, dpi=None):
+    """按条带逐块压缩写入 PNG (内存中只有当前条带)
+
+    每行使用 Up 滤波 (与上一行逐字节相减)，纯色背景和照片都能压缩得较好；
+    压缩级别取编码档位的 PNG 参数 (optimize 按最高级别)。
+
+    Args:
+        size: 整幅尺寸 (width, height)
+        mode: 'RGB' 或 'RGBA'
+        strips: 依次产生 (y, 条带图片) 的可迭代对象，条带宽度为整幅宽度，自上而下覆盖整幅
+        dpi: 写入 pHYs 的分辨率，None 时不写
+
+    Returns:
+        int: 写入的字节数
+    """
+    width, height = size
+    options = save_options('png', profile)
+    level = options.get('compress_level', 9 if options.get('optimize') else 6)
+    compressor = zlib.compressobj(level)
+    row_bytes = width * len(mode)
+    previous = Image.new(mode, (width, 1))  # 第一行之上视为全 0
+    with open(file_path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        written = 8 + _png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8,
+                                                          6 if mode == 'RGBA' else 2, 0, 0, 0))
+        if dpi:
+            pixels_per_meter = int(round(dpi / 0.0254))
+            written += _png_chunk(f, b'pHYs', struct.pack('>IIB', pixels_per_meter, pixels_per_meter, 1))
+        for _y, strip in strips:
+            if strip.mode != mode:
+                strip = strip.convert(mode)
+            # 上一行下移一行后逐字节相减 (模 256) 即为 Up 滤波
+            above = Image.new(mode, strip.size)
+            above.paste(previous, (0, 0))
+            above.paste(strip.crop((0, 0, width, strip.height - 1)), (0, 1))
+            data = ImageChops.subtract_modulo(strip, above).tobytes()
+            previous = strip.crop((0, strip.height - 1, width, strip.height))
+            rows = b''.join(b'\x02' + data[i:i + row_bytes] for i in range(0, len(data), row_bytes))
+            compressed = compressor.compress(rows)
+            if compressed:
+                written += _png_chunk(f, b'IDAT', compressed)
+        written += _png_chunk(f, b'IDAT', compressor.flush())
+        written += _png_chunk(f, b'IEND')
+    return written
+
+
+def format_bytes(size):
+    """字节数 -> 便于阅读的字符串"""
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / (1024 * 1024):.2f} MB"
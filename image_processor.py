@@ -7,9 +7,135 @@ import io
 import os
 import random
 import math
+import bisect
 import hashlib
 import platform
-from constants import MACARON_COLORS, DOPAMINE_COLORS
+import threading
+import weakref
+from collections import OrderedDict, deque
+from functools import lru_cache, wraps
+from image_encoder import save_as
+from constants import MACARON_COLORS, DOPAMINE_COLORS, BRIGHT_HIGHLIGHT_COLORS
+from app_log import log
+
+
+def _fold_case(text):
+    """逐字符转小写 (保证长度不变，便于用下标定位原文)"""
+    return ''.join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+@lru_cache(maxsize=256)
+def _truetype(font_path, size):
+    """加载 TrueType 字体 (按路径和字号缓存，批量/监视模式下不再重复解析字体文件)"""
+    return ImageFont.truetype(font_path, size)
+
+
+@lru_cache(maxsize=4096)
+def _highlight_hash(key):
+    """高亮样式/颜色选择用的稳定哈希 (结果缓存)"""
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+
+
+class KeywordMatcher:
+    """多关键词匹配器 (Aho-Corasick，大小写不敏感)
+
+    一次构建，对每行文字只扫描一遍即可找出所有关键词的出现位置。
+    """
+    
+    def __init__(self, keywords):
+        self.keywords = [k for k in keywords if k]
+        # goto 表、失败指针、输出 (关键词下标列表)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        
+        for kw_idx, keyword in enumerate(self.keywords):
+            node = 0
+            for ch in _fold_case(keyword):
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(kw_idx)
+        
+        # BFS 构建失败指针
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+    
+    def find_all(self, text):
+        """查找所有出现位置 (与逐个关键词 re.finditer 的结果一致)
+        
+        Returns:
+            list of (start, end, kw_idx)，每个关键词内部不重叠
+        """
+        if not self.keywords or not text:
+            return []
+        
+        raw = []
+        node = 0
+        for pos, ch in enumerate(_fold_case(text)):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for kw_idx in self._out[node]:
+                length = len(self.keywords[kw_idx])
+                raw.append((pos + 1 - length, pos + 1, kw_idx))
+        
+        # 同一关键词从左到右取不重叠的匹配 (与 finditer 行为一致)
+        raw.sort(key=lambda m: (m[2], m[0]))
+        matches = []
+        last_end = {}
+        for start, end, kw_idx in raw:
+            if start >= last_end.get(kw_idx, 0):
+                matches.append((start, end, kw_idx))
+                last_end[kw_idx] = end
+        return matches
+    
+    def select(self, text, min_gap=12):
+        """选择高亮位置：优先长词，且与已选区域保持最小间距
+        
+        Returns:
+            list of dict: {'start', 'end', 'text', 'keyword', 'len'}
+        """
+        candidates = self.find_all(text)
+        # 排序：优先长词 (避免 "Apple Pie" 的 "Apple" 被优先匹配)，同长按关键词顺序和位置
+        candidates.sort(key=lambda m: (-(m[1] - m[0]), m[2], m[0]))
+        
+        # 已选区间 (互不相交，按起点有序)
+        starts = []
+        ends = []
+        selected = []
+        text_len = len(text)
+        for start, end, kw_idx in candidates:
+            check_start = max(0, start - min_gap)
+            check_end = min(text_len, end + min_gap)
+            # 起点 < check_end 的最后一个区间若未越过 check_start，则无冲突
+            pos = bisect.bisect_left(starts, check_end)
+            if pos > 0 and ends[pos - 1] > check_start:
+                continue
+            starts.insert(pos, start)
+            ends.insert(pos, end)
+            selected.append({
+                'start': start,
+                'end': end,
+                'text': text[start:end],
+                'keyword': self.keywords[kw_idx],
+                'len': end - start
+            })
+        return selected
 
 
 class ImageProcessor:
@@ -231,6 +357,10 @@ class TextLayer:
     }
     
     _font_search_cache = {}
+    # (font_family, size) -> ImageFont，只保留最近使用的字号 (自动适配字号时每段文字的字号都可能不同)
+    _font_cache = OrderedDict()
+    _font_cache_lock = threading.Lock()
+    FONT_CACHE_SIZE = 256
 
     @classmethod
     def _find_font_path(cls, family):
@@ -249,7 +379,7 @@ class TextLayer:
             '/System/Library/Fonts'
         ]
         
-        print(f"[DEBUG] Searching for font family '{family}' in system...")
+        log.debug("Searching for font family '%s' in system...", family)
         for root_dir in search_roots:
             if not os.path.exists(root_dir):
                 continue
@@ -257,7 +387,7 @@ class TextLayer:
                 for file in files:
                     if file in filenames:
                         full_path = os.path.join(root, file)
-                        print(f"[DEBUG] Found font: {full_path}")
+                        log.debug("Found font: %s", full_path)
                         cls._font_search_cache[family] = full_path
                         return full_path
                         
@@ -306,7 +436,23 @@ class TextLayer:
         self.rel_y = 0.1 if position == 'top' else (0.9 if position == 'bottom' else 0.5)
         
     def _get_font(self, size):
-        """获取字体对象"""
+        """获取字体对象 (按字体和字号缓存)"""
+        key = (self.font_family, size)
+        cache = self._font_cache
+        with self._font_cache_lock:
+            font = cache.get(key)
+            if font is not None:
+                cache.move_to_end(key)
+                return font
+        font = self._load_font(size)
+        with self._font_cache_lock:
+            cache[key] = font
+            while len(cache) > self.FONT_CACHE_SIZE:
+                cache.popitem(last=False)
+        return font
+
+    def _load_font(self, size):
+        """查找并加载字体对象"""
         candidate_paths = self.FONT_PATHS.get(self.font_family, [])
         
         # 确保是列表
@@ -332,7 +478,7 @@ class TextLayer:
                 # 苹方: 0=Regular, 1=Thin, 2=Light...
                 # 简单起见，暂时使用默认 index=0
                 # TODO: 如果用户反馈字体太细，可以尝试 index=5 (Medium) for PingFang
-                font = ImageFont.truetype(font_path, size)
+                font = _truetype(font_path, size)
                 # print(f"[DEBUG] 加载字体成功: {font_path}, size={size}")
                 return font
             except Exception as e:
@@ -354,14 +500,14 @@ class TextLayer:
         for fallback in fallback_fonts:
             if os.path.exists(fallback):
                 try:
-                    font = ImageFont.truetype(fallback, size)
-                    print(f"[DEBUG] 使用回退字体: {fallback}")
+                    font = _truetype(fallback, size)
+                    log.debug("使用回退字体: %s", fallback)
                     return font
                 except:
                     continue
         
         # 最终回退到默认
-        print("[DEBUG] 使用 Pillow 默认字体")
+        log.debug("使用 Pillow 默认字体")
         return ImageFont.load_default()
     
     def render(self, canvas_width, canvas_height, scale=1.0, safe_margin_x=0, safe_margin_y=0):
@@ -503,6 +649,11 @@ class TextLayer:
             render_img = Image.new('RGBA', (render_width, render_height), (0, 0, 0, 0))
             render_draw = ImageDraw.Draw(render_img)
         
+        # 关键词匹配器 (每个文字层按关键词列表构建一次)
+        highlight_matcher = None
+        if self.highlight.get('enabled') and self.highlight.get('keywords'):
+            highlight_matcher = self._get_highlight_matcher()
+        
         for i, line in enumerate(lines):
             # 先计算 Y 坐标 (供斜体补偿使用)
             line_y = draw_y + sum(line_heights[:i]) + line_spacing * i
@@ -521,58 +672,13 @@ class TextLayer:
             
 
             # 0. 绘制关键字高亮 (升级版：防重叠 + 防连续)
-            if self.highlight.get('enabled') and self.highlight.get('keywords'):
-                import re
-                import hashlib
-                import math
-                from constants import MACARON_COLORS, DOPAMINE_COLORS
+            if highlight_matcher:
                 highlight_color = self.highlight.get('color', '#FFB7B2')
                 underline_height = max(4, int(scaled_font_size * 0.15))
                 
-                # 1. 收集所有候选匹配
-                candidates = [] # item: (start, end, keyword, hash_key)
-                for keyword in self.highlight.get('keywords', []):
-                    if not keyword: continue
-                    pattern = re.compile(re.escape(keyword), re.IGNORECASE)
-                    for match in pattern.finditer(line):
-                        candidates.append({
-                            'start': match.start(),
-                            'end': match.end(),
-                            'text': match.group(),
-                            'keyword': keyword,
-                            'len': match.end() - match.start()
-                        })
-                
-                # 2. 排序：优先长词 (避免 "Apple Pie" 的 "Apple" 被优先匹配)
-                candidates.sort(key=lambda x: x['len'], reverse=True)
-                
-                # 3. 筛选：防重叠 & 防连续 (Greedy selection)
-                selected_matches = []
-                occupied_mask = [False] * len(line) # 简单的位图标记
-                
+                # 1-3. 一次扫描找出所有匹配，并按区间筛选 (防重叠 & 防连续)
                 # 最小间距 (Gap)，例如 12 个字符 (约等于 15字限制)
-                min_gap = 12
-                
-                for cand in candidates:
-                    start, end = cand['start'], cand['end']
-                    
-                    # 检查是否与已选区域冲突 (包括间距)
-                    # 检查区间 [max(0, start-gap), min(len, end+gap)] 是否被占用
-                    check_start = max(0, start - min_gap)
-                    check_end = min(len(line), end + min_gap)
-                    
-                    is_colliding = False
-                    for k in range(check_start, check_end):
-                        if k < len(occupied_mask) and occupied_mask[k]:
-                            is_colliding = True
-                            break
-                    
-                    if not is_colliding:
-                        # 选中该匹配
-                        selected_matches.append(cand)
-                        # 标记占用 (严格占用，间距已在检查时处理)
-                        for k in range(start, end):
-                            occupied_mask[k] = True
+                selected_matches = highlight_matcher.select(line, min_gap=12)
 
                 # 4. 绘制所有选中项
                 for match in selected_matches:
@@ -590,13 +696,12 @@ class TextLayer:
 
                     # 样式逻辑
                     styles_pool = ['underline', 'wavy', 'background', 'marker']
-                    style_hash = int(hashlib.md5((keyword + str(idx) + "style").encode('utf-8')).hexdigest(), 16)
+                    style_hash = _highlight_hash(keyword + str(idx) + "style")
                     style_type = styles_pool[style_hash % len(styles_pool)]
                     
                     if highlight_color == 'random':
-                        from constants import BRIGHT_HIGHLIGHT_COLORS
                         color_pool = BRIGHT_HIGHLIGHT_COLORS
-                        hash_val = int(hashlib.md5((keyword + str(idx)).encode('utf-8')).hexdigest(), 16)
+                        hash_val = _highlight_hash(keyword + str(idx))
                         base_color = color_pool[hash_val % len(color_pool)]
                     else:
                         base_color = str(highlight_color).strip()
@@ -721,6 +826,15 @@ class TextLayer:
         
         return render_img, x, y
     
+    def _get_highlight_matcher(self):
+        """获取关键词匹配器 (关键词列表不变时复用)"""
+        keywords = tuple(self.highlight.get('keywords', []))
+        cached = getattr(self, '_highlight_matcher', None)
+        if cached is None or cached[0] != keywords:
+            cached = (keywords, KeywordMatcher(keywords))
+            self._highlight_matcher = cached
+        return cached[1]
+    
     def _calculate_position(self, canvas_width, canvas_height, text_width, text_height, margin, safe_margin_x=0, safe_margin_y=0):
         """计算文字在画布上的位置"""
         # 处理自定义位置 (拖拽后)
@@ -831,104 +945,424 @@ def get_emoji_font(font_size=64):
     for font_path in emoji_font_paths:
         if os.path.exists(font_path):
             try:
-                font = ImageFont.truetype(font_path, font_size)
+                font = _truetype(font_path, font_size)
                 return font
             except Exception as e:
-                print(f"[DEBUG] 无法加载字体 {font_path}: {e}")
+                log.debug("无法加载字体 %s: %s", font_path, e)
                 continue
     
     return None
 
 
+@lru_cache(maxsize=256)
+def _emoji_sprite(emoji_text, font_size):
+    """渲染并裁剪 emoji 贴纸 (按内容和尺寸缓存)
+
+    Returns:
+        RGBA 图片 (调用方只读使用)，无法渲染时返回 None
+    """
+    font = get_emoji_font(font_size)
+    if not font:
+        return None
+    # 使用临时画布渲染 emoji（支持 embedded_color）
+    temp_size = font_size * 3
+    emoji_temp = Image.new('RGBA', (temp_size, temp_size), (0, 0, 0, 0))
+    emoji_draw = ImageDraw.Draw(emoji_temp)
+    emoji_draw.text((temp_size // 2, temp_size // 2), emoji_text,
+                    font=font, anchor="mm", embedded_color=True)
+
+    # 裁剪到实际内容
+    bbox = emoji_temp.getbbox()
+    if not bbox:
+        return None
+    emoji_cropped = emoji_temp.crop(bbox)
+    # 调整大小
+    if emoji_cropped.width != font_size or emoji_cropped.height != font_size:
+        emoji_cropped = emoji_cropped.resize((font_size, font_size), Image.Resampling.LANCZOS)
+    return emoji_cropped
+
+
+def alpha_paste(base, overlay, x, y):
+    """把图层按 alpha 合成到 base 的 (x, y) 处 (可以部分超出画布)
+
+    base 为 RGB (不透明) 时按 alpha 混合颜色；base 为 RGBA 时用 alpha_composite，
+    与 paste(overlay, mask=overlay) 不同，在透明底的图层上合成时边缘不会变暗，也不会改变不透明区域的 alpha。
+    """
+    if overlay.mode == 'RGB':
+        base.paste(overlay, (x, y))
+        return
+    if overlay.mode != 'RGBA':
+        overlay = overlay.convert('RGBA')
+    if base.mode != 'RGBA':
+        base.paste(overlay, (x, y), overlay)
+        return
+    sx, sy = max(0, -x), max(0, -y)
+    if sx >= overlay.width or sy >= overlay.height or x >= base.width or y >= base.height:
+        return
+    base.alpha_composite(overlay, (x + sx, y + sy), (sx, sy))
+
+
+class _LayerCache:
+    """按图片字节数限制的 LRU 缓存 (边框遮罩/图案层共用)
+
+    这些图层都是整幅尺寸，按条数限制时 24MP 输出下可达 1GB 以上；
+    超过上限时淘汰最久未用的图层，单个超过上限的图层不缓存。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # (函数名, 参数) -> 图片
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _image_bytes(image):
+        return image.width * image.height * len(image.getbands())
+
+    def cached(self, fn):
+        """装饰器：按参数缓存返回的图片 (调用方只读使用)"""
+        @wraps(fn)
+        def wrapper(*args):
+            key = (fn.__name__, args)
+            with self._lock:
+                image = self._items.get(key)
+                if image is not None:
+                    self._items.move_to_end(key)
+                    return image
+            image = fn(*args)
+            size = self._image_bytes(image)
+            if size > self.max_bytes:
+                return image
+            with self._lock:
+                if key not in self._items:
+                    self._items[key] = image
+                    self._total += size
+                    while self._total > self.max_bytes:
+                        _, old = self._items.popitem(last=False)
+                        self._total -= self._image_bytes(old)
+            return image
+
+        wrapper.cache_clear = self.clear
+        return wrapper
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._total = 0
+
+
+# 边框遮罩/图案层缓存：整幅尺寸的图层较大，按总字节数限制
+# (256MB 约为 24MP 时一幅 RGBA 图案层加两幅 L 遮罩，换主题时旧配置的图层随之淘汰)
+LAYER_CACHE_BYTES = 256 * 1024 * 1024
+_layer_cache = _LayerCache(LAYER_CACHE_BYTES)
+
+
+# ---- 边框的参数和图形 (整幅合成与分块渲染 tiled_render 共用，保证两条路径结果一致) ----
+# 绘制函数都按整幅尺寸 (width, height) 的坐标绘制；draw 参数为创建绘图对象的函数，
+# 分块渲染传入按区域平移坐标的绘图对象，只画出 size 大小的区域
+
+def border_params(border_style, rounded):
+    """边框配置 -> (边框宽度, 颜色, 圆角半径 (直角为 None), 图案参数)
+
+    图案参数为 (底色, 图案, 图案颜色, 图案大小)，纯色边框为 None。
+    直角边框的图案铺在边框主色上；圆角边框的图案用边框颜色画在透明底上，图案大小为边框宽度。
+    """
+    width = border_style.get('width', 10)
+    color = border_style.get('color', '#000000')
+    pattern = border_style.get('pattern', 'solid')
+    if rounded:
+        radius = border_style.get('radius', 20)
+        fill = None if pattern == 'solid' or not pattern else (None, pattern, color, width)
+        return width, color, radius, fill
+    if pattern in ('solid', 'none', '', None):
+        return width, color, None, None
+    return width, color, None, (color, pattern, border_style.get('pattern_color', '#FFFFFF'),
+                                border_style.get('pattern_size', 10))
+
+
+def draw_solid_border(draw, width, height, border_width, color, radius=None):
+    """纯色边框 (radius 为 None 时为直角)"""
+    if radius is None:
+        for i in range(border_width):
+            draw.rectangle([i, i, width - 1 - i, height - 1 - i], outline=color)
+    else:
+        draw.rounded_rectangle([0, 0, width - 1, height - 1], radius=radius, outline=color, width=border_width)
+
+
+def make_border_mask(kind, size, width, height, border_width, radius=0, draw=ImageDraw.Draw):
+    """边框遮罩 (L)
+
+    Args:
+        kind: 'rect' 矩形边框 (白色为边框区域) / 'rounded' 圆角边框 (外圈白、内圈挖空) /
+              'rounded_content' 圆角内容 (白色为保留的主内容区域)
+        size: 遮罩图片尺寸 (整幅时为 (width, height))
+    """
+    mask = Image.new('L', size, 255 if kind == 'rect' else 0)
+    mask_draw = draw(mask)
+    if kind == 'rect':
+        mask_draw.rectangle([border_width, border_width, width - 1 - border_width, height - 1 - border_width],
+                            fill=0)
+    elif kind == 'rounded':
+        mask_draw.rounded_rectangle([0, 0, width - 1, height - 1], radius=radius, fill=255)
+        mask_draw.rounded_rectangle(
+            [border_width, border_width, width - 1 - border_width, height - 1 - border_width],
+            radius=radius, fill=0)
+    else:
+        mask_draw.rounded_rectangle([border_width, border_width, width - border_width, height - border_width],
+                                    radius=radius, fill=255)
+    return mask
+
+
+def make_pattern_layer(size, width, height, bg_color, pattern, pattern_color, pattern_size, draw=ImageDraw.Draw):
+    """边框图案层 (RGBA，bg_color 为 None 时透明底)"""
+    layer = Image.new('RGBA', size, bg_color if bg_color else (0, 0, 0, 0))
+    CompositeImage._draw_pattern(draw(layer), pattern, pattern_color, pattern_size, width, height)
+    return layer
+
+
+@_layer_cache.cached
+def _rect_border_mask(width, height, border_width):
+    """矩形边框遮罩 (白色为边框区域)"""
+    return make_border_mask('rect', (width, height), width, height, border_width)
+
+
+@_layer_cache.cached
+def _rounded_content_mask(width, height, border_width, radius):
+    """圆角内容遮罩 (白色为保留的主内容区域)"""
+    return make_border_mask('rounded_content', (width, height), width, height, border_width, radius)
+
+
+def rounded_clip_mask(width, height, border_width, radius):
+    """圆角边框对下方内容的裁切遮罩 (白色为保留区域，按尺寸缓存，只读使用)"""
+    return _rounded_content_mask(width, height, border_width, radius)
+
+
+@_layer_cache.cached
+def _rounded_border_mask(width, height, border_width, radius):
+    """圆角边框遮罩 (外圈白、内圈挖空)"""
+    return make_border_mask('rounded', (width, height), width, height, border_width, radius)
+
+
+@_layer_cache.cached
+def _border_pattern_layer(width, height, bg_color, pattern, pattern_color, pattern_size):
+    """边框图案层 (bg_color 为 None 时透明底)"""
+    return make_pattern_layer((width, height), width, height, bg_color, pattern, pattern_color, pattern_size)
+
+
+def fit_image_geometry(image, width, height, fit_mode='contain'):
+    """fit_image 的缩放尺寸和粘贴位置 (不缩放图片，分块渲染按区域缩放时使用)
+
+    Returns:
+        ((宽, 高), (x, y))，无图片时返回 None
+    """
+    if not image:
+        return None
+    
+    if fit_mode == 'contain':
+        # 保持宽高比，完整显示
+        img_ratio = image.width / image.height
+        canvas_ratio = width / height
+        
+        if img_ratio > canvas_ratio:
+            new_width = width
+            new_height = int(width / img_ratio)
+        else:
+            new_height = height
+            new_width = int(height * img_ratio)
+        
+    elif fit_mode == 'cover':
+        # 填充整个画布，可能裁剪
+        img_ratio = image.width / image.height
+        canvas_ratio = width / height
+        
+        if img_ratio > canvas_ratio:
+            new_height = height
+            new_width = int(height * img_ratio)
+        else:
+            new_width = width
+            new_height = int(width / img_ratio)
+        
+    elif fit_mode == 'stretch':
+        # 拉伸到画布大小
+        new_width, new_height = width, height
+    else:
+        return None
+    
+    return (new_width, new_height), ((width - new_width) // 2, (height - new_height) // 2)
+
+
+def fit_image(image, width, height, fit_mode='contain'):
+    """按适配模式缩放图片到 width x height 的画布
+
+    Returns:
+        (缩放后的图片, (x, y) 粘贴位置)，无图片时返回 None
+    """
+    geometry = fit_image_geometry(image, width, height, fit_mode)
+    if geometry is None:
+        return None
+    size, position = geometry
+    return image.resize(size, Image.Resampling.LANCZOS), position
+
+
+def fit_image_in_box_geometry(image, x, y, w, h, anchor='center'):
+    """fit_image_in_box 的缩放尺寸和粘贴位置 (不缩放图片)
+
+    Returns:
+        ((宽, 高), (x, y))，无图片或区域为空时返回 None
+    """
+    if not image or w <= 0 or h <= 0:
+        return None
+        
+    # 计算缩放 (Contain模式)
+    img_ratio = image.width / image.height
+    box_ratio = w / h
+    
+    if img_ratio > box_ratio:
+        # 图片更宽，以宽为准
+        new_w = int(w)
+        new_h = int(w / img_ratio)
+    else:
+        # 图片更瘦，以高为准
+        new_h = int(h)
+        new_w = int(h * img_ratio)
+        
+    # 计算粘贴位置
+    # 水平始终居中
+    paste_x = int(x + (w - new_w) / 2)
+    
+    # 垂直根据 anchor 调整
+    if anchor == 'n':
+        paste_y = int(y)
+    elif anchor == 's':
+        paste_y = int(y + (h - new_h))
+    else:
+        # center
+        paste_y = int(y + (h - new_h) / 2)
+    
+    return (new_w, new_h), (paste_x, paste_y)
+
+
+def fit_image_in_box(image, x, y, w, h, anchor='center'):
+    """按 contain 方式把图片缩放到目标区域 (x, y, w, h)
+    anchor: 'center', 'n' (top), 's' (bottom)
+
+    Returns:
+        (缩放后的图片, (x, y) 粘贴位置)，无图片或区域为空时返回 None
+    """
+    geometry = fit_image_in_box_geometry(image, x, y, w, h, anchor)
+    if geometry is None:
+        return None
+    size, position = geometry
+    return image.resize(size, Image.Resampling.LANCZOS), position
+
+
+# 有透明通道的模式按预乘 alpha 逐级缩小 (与 Image.resize 的处理一致，避免透明像素的颜色渗到边缘)
+_PREMULTIPLIED = {'RGBA': 'RGBa', 'LA': 'La'}
+_PYRAMID_MODES = ('RGB', 'RGBA', 'L', 'LA', 'CMYK', 'YCbCr', 'I', 'F')
+
+
+class ImagePyramid:
+    """图片的多级金字塔：逐级 Image.reduce(2) 减半 (按需生成并缓存)
+
+    缩放到目标尺寸时，从不小于目标尺寸的最近一级开始做高质量缩放，
+    而不是每次都从原图缩放。只持有原图的弱引用，原图释放后各级随之释放。
+    """
+
+    def __init__(self, image):
+        self._image_ref = weakref.ref(image)
+        self._mode = image.mode
+        self._levels = []  # 第 i 项为原图缩小 2^(i+1) 倍
+        self._lock = threading.Lock()
+
+    @property
+    def image(self):
+        return self._image_ref()
+
+    def source_for(self, width, height):
+        """不小于 width x height 的最小一级 (原图或缩小图)"""
+        image = self.image
+        if self._mode not in _PYRAMID_MODES:
+            return image
+        with self._lock:
+            level, i = image, 0
+            while True:
+                next_size = ((level.width + 1) // 2, (level.height + 1) // 2)
+                if next_size[0] < width or next_size[1] < height or next_size == level.size:
+                    return level
+                if i == len(self._levels):
+                    if i == 0 and self._mode in _PREMULTIPLIED:
+                        level = level.convert(_PREMULTIPLIED[self._mode])
+                    self._levels.append(level.reduce(2))
+                level = self._levels[i]
+                i += 1
+
+    def resize(self, size, resample=Image.Resampling.LANCZOS):
+        """缩放到 size (新图片，模式与原图相同)"""
+        source = self.source_for(*size)
+        resized = source.resize(size, resample) if source.size != tuple(size) else source.copy()
+        if resized.mode != self._mode:
+            resized = resized.convert(self._mode)
+        return resized
+
+
+_pyramids = {}
+_pyramids_lock = threading.Lock()
+
+
+def image_pyramid(image):
+    """图片对应的金字塔 (按图片对象缓存：图片被替换为新对象后自动失效，原图释放时清除)"""
+    key = id(image)
+    with _pyramids_lock:
+        pyramid = _pyramids.get(key)
+        if pyramid is None or pyramid.image is not image:
+            pyramid = ImagePyramid(image)
+            _pyramids[key] = pyramid
+            weakref.finalize(image, _pyramids.pop, key, None)
+    return pyramid
+
+
+def pyramid_resize(image, size, resample=Image.Resampling.LANCZOS):
+    """经由金字塔缩放图片 (反复缩放同一张大图时只有第一次需要处理原图)"""
+    return image_pyramid(image).resize(size, resample)
+
+
 class CompositeImage:
     """复合图片生成器 - 用于合成最终图片"""
     
-    def __init__(self, width, height, bg_color='white'):
+    def __init__(self, width, height, bg_color='white', mode='RGB'):
         self.width = width
         self.height = height
-        self.canvas = Image.new('RGB', (width, height), bg_color)
+        self.canvas = Image.new(mode, (width, height), bg_color)
         self.draw = ImageDraw.Draw(self.canvas)
+        self.saved_path = None
+        self.saved_bytes = 0
+
+    @classmethod
+    def from_image(cls, image):
+        """包装已合成好的图片 (不另外创建画布)"""
+        composite = cls.__new__(cls)
+        composite.width, composite.height = image.size
+        composite.canvas = image
+        composite.draw = ImageDraw.Draw(image)
+        composite.saved_path = None
+        composite.saved_bytes = 0
+        return composite
         
     def add_main_image(self, image, fit_mode='contain'):
         """添加主图片"""
-        if not image:
-            return
-        
-        if fit_mode == 'contain':
-            # 保持宽高比，完整显示
-            img_ratio = image.width / image.height
-            canvas_ratio = self.width / self.height
-            
-            if img_ratio > canvas_ratio:
-                new_width = self.width
-                new_height = int(self.width / img_ratio)
-            else:
-                new_height = self.height
-                new_width = int(self.height * img_ratio)
-            
-            resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            x = (self.width - new_width) // 2
-            y = (self.height - new_height) // 2
-            self.canvas.paste(resized, (x, y))
-            
-        elif fit_mode == 'cover':
-            # 填充整个画布，可能裁剪
-            img_ratio = image.width / image.height
-            canvas_ratio = self.width / self.height
-            
-            if img_ratio > canvas_ratio:
-                new_height = self.height
-                new_width = int(self.height * img_ratio)
-            else:
-                new_width = self.width
-                new_height = int(self.width / img_ratio)
-            
-            resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            x = (self.width - new_width) // 2
-            y = (self.height - new_height) // 2
-            self.canvas.paste(resized, (x, y))
-            
-        elif fit_mode == 'stretch':
-            # 拉伸到画布大小
-            resized = image.resize((self.width, self.height), Image.Resampling.LANCZOS)
-            self.canvas.paste(resized, (0, 0))
+        placed = fit_image(image, self.width, self.height, fit_mode)
+        if placed:
+            resized, pos = placed
+            self.canvas.paste(resized, pos)
 
     def add_main_image_with_geometry(self, image, x, y, w, h, anchor='center'):
         """按照指定几何位置添加图片 (Fit in Box)
         anchor: 'center', 'n' (top), 's' (bottom)
         """
-        if not image or w <= 0 or h <= 0:
-            return
-            
-        # 计算缩放 (Contain模式)
-        img_ratio = image.width / image.height
-        box_ratio = w / h
-        
-        if img_ratio > box_ratio:
-            # 图片更宽，以宽为准
-            new_w = int(w)
-            new_h = int(w / img_ratio)
-        else:
-            # 图片更瘦，以高为准
-            new_h = int(h)
-            new_w = int(h * img_ratio)
-            
-        resized = image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        
-        # 计算粘贴位置
-        # 水平始终居中
-        paste_x = int(x + (w - new_w) / 2)
-        
-        # 垂直根据 anchor 调整
-        if anchor == 'n':
-            paste_y = int(y)
-        elif anchor == 's':
-            paste_y = int(y + (h - new_h))
-        else:
-            # center
-            paste_y = int(y + (h - new_h) / 2)
-        
-        self.canvas.paste(resized, (paste_x, paste_y))
+        placed = fit_image_in_box(image, x, y, w, h, anchor)
+        if placed:
+            resized, pos = placed
+            self.canvas.paste(resized, pos)
     
     def add_text_layer(self, text_layer, scale=1.0, border_width=0):
         """添加文字层到画布
@@ -952,37 +1386,22 @@ class CompositeImage:
     
     def add_sticker(self, emoji_text, x, y, font_size=64):
         """添加贴纸（表情符号）"""
-        # 尝试使用跨平台的彩色 emoji 字体
-        font = get_emoji_font(font_size)
-        
-        if font:
-            try:
-                # 使用临时画布渲染 emoji（支持 embedded_color）
-                temp_size = font_size * 3
-                emoji_temp = Image.new('RGBA', (temp_size, temp_size), (0, 0, 0, 0))
-                emoji_draw = ImageDraw.Draw(emoji_temp)
-                emoji_draw.text((temp_size // 2, temp_size // 2), emoji_text, 
-                              font=font, anchor="mm", embedded_color=True)
-                
-                # 裁剪到实际内容
-                bbox = emoji_temp.getbbox()
-                if bbox:
-                    emoji_cropped = emoji_temp.crop(bbox)
-                    # 调整大小
-                    if emoji_cropped.width != font_size or emoji_cropped.height != font_size:
-                        emoji_cropped = emoji_cropped.resize((font_size, font_size), Image.Resampling.LANCZOS)
-                    
-                    # 确保画布是 RGBA 模式
-                    if self.canvas.mode != 'RGBA':
-                        self.canvas = self.canvas.convert('RGBA')
-                    
-                    # 计算粘贴位置（居中）
-                    paste_x = x - emoji_cropped.width // 2
-                    paste_y = y - emoji_cropped.height // 2
-                    self.canvas.paste(emoji_cropped, (paste_x, paste_y), emoji_cropped)
-                    return
-            except Exception as e:
-                print(f"[DEBUG] 使用彩色 emoji 字体渲染失败: {e}")
+        # 尝试使用跨平台的彩色 emoji 字体 (渲染结果缓存)
+        try:
+            emoji_cropped = _emoji_sprite(emoji_text, font_size)
+            if emoji_cropped:
+                # 确保画布是 RGBA 模式
+                if self.canvas.mode != 'RGBA':
+                    self.canvas = self.canvas.convert('RGBA')
+                    self.draw = ImageDraw.Draw(self.canvas)
+
+                # 计算粘贴位置（居中）
+                paste_x = x - emoji_cropped.width // 2
+                paste_y = y - emoji_cropped.height // 2
+                alpha_paste(self.canvas, emoji_cropped, paste_x, paste_y)
+                return
+        except Exception as e:
+            log.debug("使用彩色 emoji 字体渲染失败: %s", e)
         
         # 降级方案：使用默认字体（黑白）
         try:
@@ -996,41 +1415,21 @@ class CompositeImage:
         if border_style.get('id', '') == 'none':
             return
         
-        width = border_style.get('width', 10)
-        color = border_style.get('color', '#000000')
-        pattern = border_style.get('pattern', 'solid')
+        # 'solid' 或 'none' 或空值都表示纯色边框 (fill 为 None)
+        width, color, _, fill = border_params(border_style, rounded=False)
         
-        print(f"[DEBUG] add_border: width={width}, color={color}, pattern={pattern}")
+        log.debug("add_border: width=%s, color=%s, pattern=%s", width, color, border_style.get('pattern', 'solid'))
         
-        # 'solid' 或 'none' 或空值都表示纯色边框
-        if pattern in ('solid', 'none', '', None):
+        if fill is None:
             # 纯色边框
-            for i in range(width):
-                 self.draw.rectangle(
-                    [i, i, self.width - 1 - i, self.height - 1 - i],
-                    outline=color
-                )
+            draw_solid_border(self.draw, self.width, self.height, width, color)
         else:
             # 图案边框
-            # 获取图案颜色和大小
-            pattern_color = border_style.get('pattern_color', '#FFFFFF')
-            pattern_size = border_style.get('pattern_size', 10)
+            # 1. 边框背景层（使用边框主色）+ 图案（使用图案颜色和大小）
+            border_bg = _border_pattern_layer(self.width, self.height, *fill)
             
-            # 1. 先创建边框背景层（使用边框主色）
-            border_bg = Image.new('RGBA', (self.width, self.height), color)
-            
-            # 2. 在边框背景上绘制图案（使用图案颜色和大小）
-            border_draw = ImageDraw.Draw(border_bg)
-            self._draw_pattern(border_draw, pattern, pattern_color, pattern_size, self.width, self.height)
-            
-            # 3. 创建边框遮罩 (白色为保留区域)
-            mask = Image.new('L', (self.width, self.height), 255)
-            mask_draw = ImageDraw.Draw(mask)
-            # 挖空中间 (黑色为剔除区域)
-            mask_draw.rectangle(
-                [width, width, self.width - 1 - width, self.height - 1 - width],
-                fill=0
-            )
+            # 2. 边框遮罩 (白色为保留区域，中间挖空)
+            mask = _rect_border_mask(self.width, self.height, width)
             
             # 4. 将边框层通过遮罩覆盖到画布上
             if self.canvas.mode != 'RGBA':
@@ -1042,20 +1441,11 @@ class CompositeImage:
         if border_style.get('id', '') == 'none':
             return
         
-        width = border_style.get('width', 10)
-        color = border_style.get('color', '#000000')
-        radius = border_style.get('radius', 20)
-        pattern = border_style.get('pattern', 'solid')
+        width, color, radius, fill = border_params(border_style, rounded=True)
         
         # 1. 先应用圆角裁剪 (统一逻辑)
-        # 创建圆角矩形遮罩
-        mask = Image.new('L', (self.width, self.height), 0)
-        mask_draw = ImageDraw.Draw(mask)
-        mask_draw.rounded_rectangle(
-            [width, width, self.width - width, self.height - width],
-            radius=radius,
-            fill=255
-        )
+        # 圆角矩形遮罩 (按尺寸缓存)
+        mask = _rounded_content_mask(self.width, self.height, width, radius)
         
         # 应用遮罩裁切主内容
         output = Image.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
@@ -1066,41 +1456,18 @@ class CompositeImage:
         self.draw = ImageDraw.Draw(self.canvas)
         
         # 2. 绘制边框
-        if pattern == 'solid' or not pattern:
-            self.draw.rounded_rectangle(
-                [0, 0, self.width - 1, self.height - 1],
-                radius=radius,
-                outline=color,
-                width=width
-            )
+        if fill is None:
+            draw_solid_border(self.draw, self.width, self.height, width, color, radius)
         else:
-            # 图案边框
-            pattern_layer = Image.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
-            pattern_draw = ImageDraw.Draw(pattern_layer)
-            
-            self._draw_pattern(pattern_draw, pattern, color, width, self.width, self.height)
-            
-            # 创建边框遮罩
-            border_mask = Image.new('L', (self.width, self.height), 0)
-            mask_draw = ImageDraw.Draw(border_mask)
-            
-            # 外圈白
-            mask_draw.rounded_rectangle(
-                [0, 0, self.width - 1, self.height - 1],
-                radius=radius,
-                fill=255
-            )
-            # 内圈黑 (挖空)
-            mask_draw.rounded_rectangle(
-                [width, width, self.width - 1 - width, self.height - 1 - width],
-                radius=radius,
-                fill=0
-            )
+            # 图案边框 (图案层和边框遮罩按配置缓存)
+            pattern_layer = _border_pattern_layer(self.width, self.height, *fill)
+            border_mask = _rounded_border_mask(self.width, self.height, width, radius)
             
             # 合成
             self.canvas.paste(pattern_layer, (0, 0), border_mask)
 
-    def _draw_pattern(self, draw, pattern_id, color, pattern_size, width, height):
+    @staticmethod
+    def _draw_pattern(draw, pattern_id, color, pattern_size, width, height):
         """绘制图案 (内部辅助方法)"""
         if pattern_id == 'stripe':
             # 斜纹
@@ -1319,22 +1686,19 @@ class CompositeImage:
         """获取最终图片"""
         return self.canvas
     
-    def save(self, file_path, quality=95):
-        """保存图片"""
+    def save(self, file_path, profile=None, output_format=None, dpi=None):
+        """保存图片
+
+        Args:
+            profile: 编码档位，见 image_encoder.ENCODER_PROFILES
+            output_format: 输出格式，见 image_encoder.OUTPUT_FORMATS (扩展名随格式调整)
+            dpi: 写入文件的分辨率 (尺寸预设中的 dpi)，None 时不写
+
+        保存成功后 saved_path 为实际保存路径，saved_bytes 为编码后的字节数
+        """
         try:
-            save_img = self.canvas
-            ext = os.path.splitext(file_path)[1].lower()
-            
-            # 如果是JPG，必须转换为RGB，并将透明部分填充为白色
-            if ext in ['.jpg', '.jpeg']:
-                if save_img.mode == 'RGBA':
-                    background = Image.new('RGB', save_img.size, (255, 255, 255))
-                    background.paste(save_img, mask=save_img.split()[3])
-                    save_img = background
-                elif save_img.mode != 'RGB':
-                    save_img = save_img.convert('RGB')
-            
-            save_img.save(file_path, quality=quality, optimize=True)
+            # JPG 不支持透明，由编码模块转换为RGB并将透明部分填充为白色
+            self.saved_path, self.saved_bytes = save_as(self.canvas, file_path, profile, output_format, dpi=dpi)
             return True
         except Exception as e:
             print(f"保存图片失败: {e}")
@@ -0,0 +1,173 @@
+"""
+批量输入扫描模块 - 基于 os.scandir 递归、流式地发现图片文件
+"""
+
+import os
+import time
+
+# 支持的图片扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+class ScannedFile:
+    """扫描到的图片文件
+
+    Attributes:
+        path: 完整路径
+        rel_dir: 相对输入根目录的子目录 ('' 表示根目录)，用于在输出中镜像目录结构
+    """
+
+    __slots__ = ('path', 'rel_dir', '_entry', '_stat')
+
+    def __init__(self, path, rel_dir='', entry=None):
+        self.path = path
+        self.rel_dir = rel_dir
+        self._entry = entry
+        self._stat = None
+
+    def stat(self):
+        """文件状态 (只调用一次系统 stat，结果缓存)"""
+        if self._stat is None:
+            self._stat = self._entry.stat() if self._entry is not None else os.stat(self.path)
+        return self._stat
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"ScannedFile({self.path!r})"
+
+
+def _real_dir(path):
+    return os.path.normcase(os.path.realpath(path))
+
+
+def same_directory(a, b):
+    """两个路径是否为同一目录 (按解析符号链接后的真实路径比较)"""
+    return _real_dir(a) == _real_dir(b)
+
+
+def _list_dir(dir_path, recursive, extensions):
+    """读取一个目录: (按名称排序的图片 DirEntry, 子目录名称)"""
+    with os.scandir(dir_path) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    files, subdirs = [], []
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    subdirs.append(entry.name)
+                continue
+            if not entry.is_file():
+                continue
+        except OSError:
+            continue
+        if entry.name.lower().endswith(extensions):
+            files.append(entry)
+    return files, subdirs
+
+
+def _walk(root, recursive, extensions, exclude, read_dir=None):
+    """深度优先遍历目录树，产出 (rel_dir, dir_path, 图片 DirEntry 列表)
+
+    read_dir(dir_path) 返回 (files, subdirs)，files 为 None 表示该目录未变化 (不产出)。
+    """
+    excluded = _real_dir(exclude) if exclude else None
+    # 第三项为真实路径 (子目录不跟随符号链接，父目录的真实路径拼上名称即可)
+    stack = [('', root, _real_dir(root) if excluded else None)]
+    while stack:
+        rel_dir, dir_path, real_path = stack.pop()
+        try:
+            if read_dir is None:
+                files, subdirs = _list_dir(dir_path, recursive, extensions)
+            else:
+                files, subdirs = read_dir(dir_path)
+        except OSError as e:
+            print(f"[WARN] 无法读取目录 {dir_path}: {e}")
+            continue
+
+        if files is not None:
+            yield rel_dir, dir_path, files
+
+        # 逆序入栈，使子目录按名称顺序处理
+        for name in reversed(subdirs):
+            real_subdir = None
+            if excluded:
+                real_subdir = os.path.join(real_path, os.path.normcase(name))
+                if real_subdir == excluded:
+                    continue
+            stack.append((os.path.join(rel_dir, name) if rel_dir else name, os.path.join(dir_path, name),
+                          real_subdir))
+
+
+def scan_images(root, recursive=True, extensions=IMAGE_EXTENSIONS, exclude=None):
+    """流式扫描目录中的图片，发现一个产出一个 (不等待整棵目录树列完)
+
+    每个目录内按名称排序 (保证顺序配文的对应关系稳定)，先文件后子目录，深度优先。
+    只依赖 DirEntry 的类型信息，不额外 stat 文件。
+
+    Args:
+        exclude: 跳过的子目录 (输出目录位于输入目录内时传入，避免把输出当作输入再处理)
+    """
+    for rel_dir, _, files in _walk(root, recursive, extensions, exclude):
+        for entry in files:
+            yield ScannedFile(entry.path, rel_dir, entry)
+
+
+class DirectoryListings:
+    """反复扫描同一目录树 (监视目录轮询) 时只重新读取有变化的目录
+
+    每次遍历每个目录只 stat 一次：修改时间不变的目录 (没有新增、删除、改名的文件) 跳过读取，
+    只记住其子目录名称。只产出有变化的目录中的图片，已交付的文件由调用方过滤。
+    """
+
+    # 修改时间距今不足此秒数的目录每次仍重新读取
+    # (文件系统时间精度有限，同一时间刻度内新增的文件可能不改变目录的修改时间)
+    RECENT_SECONDS = 2.0
+
+    def __init__(self, root, recursive=True, extensions=IMAGE_EXTENSIONS, exclude=None):
+        self.root = root
+        self.recursive = recursive
+        self.extensions = extensions
+        self.exclude = exclude
+        self._dirs = {}     # 目录路径 -> (修改时间 ns, 子目录名称)
+        self._visited = set()
+        self.removed = []   # 上一次完整遍历时发现已删除 (或无法读取) 的目录
+
+    def _read_dir(self, dir_path):
+        stat = os.stat(dir_path)
+        self._visited.add(dir_path)
+        cached = self._dirs.get(dir_path)
+        if (cached is not None and cached[0] == stat.st_mtime_ns
+                and time.time() - stat.st_mtime > self.RECENT_SECONDS):
+            return None, cached[1]
+        files, subdirs = _list_dir(dir_path, self.recursive, self.extensions)
+        self._dirs[dir_path] = (stat.st_mtime_ns, subdirs)
+        return files, subdirs
+
+    def changed_dirs(self):
+        """遍历一次，产出有变化的目录 (首次遍历为全部目录): (目录路径, [图片 ScannedFile])
+
+        没有图片的目录同样产出 (调用方据此得知其中的文件已被删除)。
+        """
+        self._visited = set()
+        for rel_dir, dir_path, files in _walk(self.root, self.recursive, self.extensions, self.exclude,
+                                              self._read_dir):
+            yield dir_path, [ScannedFile(entry.path, rel_dir, entry) for entry in files]
+        # 完整遍历后清理已删除的目录
+        self.removed = [dir_path for dir_path in self._dirs if dir_path not in self._visited]
+        for dir_path in self.removed:
+            del self._dirs[dir_path]
+
+    def changed(self):
+        """遍历一次，产出有变化的目录中的图片 ScannedFile"""
+        for _, items in self.changed_dirs():
+            yield from items
+
+
+def from_paths(paths):
+    """把手动选择的文件路径列表包装为 ScannedFile (输出不分子目录)"""
+    for path in paths:
+        yield ScannedFile(path)
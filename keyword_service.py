@@ -0,0 +1,300 @@
+"""
+关键词服务模块 - 后台预热 jieba，异步提取关键词并缓存结果
+"""
+
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from app_log import log
+
+# jieba 词典序列化缓存目录 (避免每次启动重新构建前缀词典)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+# 批量预提取：少于该数量时直接在当前进程处理 (进程池启动需要每个进程加载词典)
+PARALLEL_MIN_TEXTS = 200
+PARALLEL_CHUNK_SIZE = 64
+
+
+def _text_key(text):
+    """文本哈希 (缓存键)"""
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def _pool_init():
+    """进程池初始化：每个工作进程加载一次 jieba"""
+    import jieba
+    jieba.setLogLevel(60)
+    try:
+        jieba.dt.tmp_dir = CACHE_DIR
+    except Exception:
+        pass
+    jieba.initialize()
+    import jieba.analyse
+
+
+def _extract_chunk(args):
+    """进程池任务：提取一组文本的关键词"""
+    texts, top_k = args
+    import jieba.analyse
+    return [jieba.analyse.extract_tags(t, topK=top_k, withWeight=False) for t in texts]
+
+
+class KeywordService:
+    """关键词提取服务
+
+    - warm_up(): 启动时在后台线程加载 jieba 词典和 TF-IDF 数据
+    - extract_tags(): 同步提取 (批量模式使用)，结果按文本缓存
+    - detect_keywords_async(): 防抖 + 后台提取，结果通过 dispatch 回到 UI 线程
+    """
+
+    def __init__(self, top_k=5, max_keywords=8, cache_size=512):
+        self.top_k = top_k
+        self.max_keywords = max_keywords
+        self.cache_size = cache_size
+
+        self._ready = threading.Event()
+        self._available = False
+        self._warm_thread = None
+        self._lock = threading.Lock()
+
+        # 缓存: (文本哈希, top_k) -> tags / 文本哈希 -> keywords
+        self._tags_cache = OrderedDict()
+        self._keywords_cache = OrderedDict()
+        # 当前批量任务预提取的结果 (不受 cache_size 限制，批量结束时由 release_batch 释放)
+        self._batch_tags = {}
+
+        # 防抖状态 (按请求通道分开，不同用途的检测互不取消): 通道 -> 定时器 / 请求序号
+        self._timers = {}
+        self._generations = {}
+
+    def warm_up(self):
+        """在后台线程中预热 jieba (可重复调用)"""
+        with self._lock:
+            if self._warm_thread is not None:
+                return
+            self._warm_thread = threading.Thread(target=self._load_jieba, daemon=True)
+        self._warm_thread.start()
+
+    def _load_jieba(self):
+        """工作线程：加载 jieba 词典"""
+        try:
+            import jieba
+            jieba.setLogLevel(60)  # 关闭 jieba 的加载日志
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                jieba.dt.tmp_dir = CACHE_DIR
+            except OSError:
+                pass  # 无法创建缓存目录时使用 jieba 默认的临时目录
+            jieba.initialize()
+            # 导入 analyse 时会加载 IDF 数据
+            import jieba.analyse
+            self._available = True
+        except ImportError:
+            pass  # jieba 未安装，仅使用正则规则
+        except Exception as e:
+            log.debug("jieba 预热失败: %s", e)
+        finally:
+            self._ready.set()
+
+    def is_ready(self):
+        """jieba 是否已加载完成 (无论成功与否)"""
+        return self._ready.is_set()
+
+    def _cache_get(self, cache, key):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        return None
+
+    def _cache_put(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def _batch_get(self, key):
+        with self._lock:
+            return self._batch_tags.get(key)
+
+    def extract_tags(self, text, top_k=None):
+        """使用 jieba TF-IDF 提取关键词 (同步，带缓存)"""
+        if not text:
+            return []
+        top_k = top_k or self.top_k
+        key = (_text_key(text), top_k)
+        cached = self._cache_get(self._tags_cache, key)
+        if cached is None:
+            cached = self._batch_get(key)
+        if cached is not None:
+            return list(cached)
+
+        # 确保词典已加载 (未预热时在当前线程加载)
+        self.warm_up()
+        self._ready.wait()
+        if not self._available:
+            return []
+
+        try:
+            import jieba.analyse
+            tags = jieba.analyse.extract_tags(text, topK=top_k, withWeight=False)
+        except Exception as e:
+            log.debug("jieba 关键词提取失败: %s", e)
+            tags = []
+
+        self._cache_put(self._tags_cache, key, tuple(tags))
+        return list(tags)
+
+    def extract_tags_batch(self, texts, top_k=None, workers=None, progress=None):
+        """批量预提取关键词 (进程池并行)，结果保存到本次批量的结果表供 extract_tags 直接命中
+
+        结果表替换上一次批量的结果，不占用 LRU 缓存；批量结束后调用 release_batch 释放。
+
+        Args:
+            texts: 文本列表 (可重复，按哈希去重)
+            top_k: 每条文本的关键词数量
+            workers: 进程数 (默认 CPU 核数 - 1)
+            progress: progress(done, total)，每完成一批文本后在调用线程中调用
+
+        Returns:
+            int: 本次实际提取的文本数 (不含缓存命中)
+        """
+        top_k = top_k or self.top_k
+        batch = {}
+        pending = {}
+        for text in texts:
+            if not text:
+                continue
+            key = (_text_key(text), top_k)
+            if key in batch or key in pending:
+                continue
+            cached = self._cache_get(self._tags_cache, key)
+            if cached is None:
+                cached = self._batch_get(key)
+            if cached is not None:
+                batch[key] = cached
+            else:
+                pending[key] = text
+        # 结果表在锁内替换和写入 (监视线程、界面的防抖检测同时读取)
+        with self._lock:
+            self._batch_tags = batch
+        if not pending:
+            return 0
+
+        keys = list(pending.keys())
+        values = [pending[k] for k in keys]
+        results = None
+
+        if len(values) >= PARALLEL_MIN_TEXTS:
+            if workers is None:
+                workers = max(1, (os.cpu_count() or 2) - 1)
+            chunks = [(values[i:i + PARALLEL_CHUNK_SIZE], top_k)
+                      for i in range(0, len(values), PARALLEL_CHUNK_SIZE)]
+            try:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_pool_init) as pool:
+                    results = []
+                    for chunk in pool.map(_extract_chunk, chunks):
+                        results.extend(chunk)
+                        if progress:
+                            progress(len(results), len(values))
+            except Exception as e:
+                log.debug("并行关键词提取失败，改为顺序处理: %s", e)
+                results = None
+
+        if results is None:
+            # 顺序处理 (少量文本或进程池不可用)
+            results = []
+            for text in values:
+                results.append(self.extract_tags(text, top_k))
+                if progress and len(results) % PARALLEL_CHUNK_SIZE == 0:
+                    progress(len(results), len(values))
+
+        with self._lock:
+            for key, tags in zip(keys, results):
+                batch[key] = tuple(tags)
+        return len(values)
+
+    def release_batch(self):
+        """释放批量预提取的结果 (批量任务结束时调用)"""
+        with self._lock:
+            self._batch_tags = {}
+
+    def detect_keywords(self, text):
+        """完整的关键词检测：jieba + 英文单词 + #标签 (同步，带缓存)"""
+        if not text or len(text.strip()) < 2:
+            return []
+        cached = self._cache_get(self._keywords_cache, _text_key(text))
+        if cached is not None:
+            return list(cached)
+
+        keywords = self.extract_tags(text)
+
+        # 检测英文单词 (中文中的英文通常是品牌/专有名词)
+        lowered = {k.lower() for k in keywords}
+        for word in re.findall(r'[a-zA-Z]{2,}', text):
+            if word.lower() not in lowered:
+                keywords.append(word)
+                lowered.add(word.lower())
+
+        # 检测 #标签
+        for tag in re.findall(r'#\w+', text):
+            cleaned = tag.lstrip('#')
+            if cleaned not in keywords:
+                keywords.append(cleaned)
+
+        result = list(dict.fromkeys(keywords))[:self.max_keywords]
+        self._cache_put(self._keywords_cache, _text_key(text), tuple(result))
+        return list(result)
+
+    def detect_keywords_async(self, text, callback, dispatch=None, delay=0.0, channel='default'):
+        """防抖后在后台线程检测关键词
+
+        Args:
+            text: 文字内容
+            callback: 回调 callback(keywords)，同一通道只有最新一次请求会被回调
+            dispatch: 将回调切回 UI 线程的函数，如 lambda fn: widget.after(0, fn)
+            delay: 防抖延迟 (秒)
+            channel: 请求通道，只取消同一通道中之前的请求 (如自动高亮和手动检测分开)
+        """
+        with self._lock:
+            generation = self._generations.get(channel, 0) + 1
+            self._generations[channel] = generation
+            timer = self._timers.pop(channel, None)
+            if timer is not None:
+                timer.cancel()
+
+        def current():
+            return self._generations.get(channel) == generation
+
+        def deliver(keywords):
+            # 丢弃过期结果
+            if not current():
+                return
+            if dispatch:
+                dispatch(lambda: callback(keywords) if current() else None)
+            else:
+                callback(keywords)
+
+        # 缓存命中直接返回，不启动线程
+        cached = self._cache_get(self._keywords_cache, _text_key(text))
+        if cached is not None:
+            deliver(list(cached))
+            return
+
+        def worker():
+            deliver(self.detect_keywords(text))
+
+        timer = threading.Timer(max(0.0, delay), worker)
+        timer.daemon = True
+        with self._lock:
+            self._timers[channel] = timer
+        timer.start()
+
+
+# 单例
+keyword_service = KeywordService()
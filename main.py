@@ -57,4 +57,7 @@ def main():
 
 
 if __name__ == '__main__':
+    # 打包后的程序使用进程池 (批量关键词提取) 时需要
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -13,12 +13,14 @@ import subprocess
 import platform
 from datetime import datetime
 import threading
+import time
+import itertools
 from queue import Queue
 
 from auth_manager import auth  # [AUTH] 导入授权管理器
 
 from canvas_widget import CanvasWidget
-from image_processor import ImageProcessor, CompositeImage, get_emoji_font
+from image_processor import ImageProcessor, TextLayer, pyramid_resize
 from constants import (SIZE_PRESETS, BORDER_STYLES, STICKER_LIST, COLORS, 
                       BORDER_STYLES_WITH_PREVIEW, BORDER_CATEGORIES, 
                       BORDER_COLORS, BORDER_STYLE_NAMES,
@@ -27,6 +29,32 @@ from constants import (SIZE_PRESETS, BORDER_STYLES, STICKER_LIST, COLORS,
                       QUICK_COLORS)
 from color_picker import ColorPicker
 from color_wheel_picker import ColorWheelPicker
+from keyword_service import keyword_service
+import text_sources
+import batch_manifest
+from render_cache import render_cache, image_hash
+from batch_renderer import BatchRenderer, unique_output_name
+from compositor import (LayerCompositor, Ref, freeze, scene_scale, scale_border, text_safe_margin,
+                        text_key, render_background, render_stickers, render_border, render_text)
+import tiled_render
+from tiled_render import TiledScene
+import batch_renderer
+from batch_pipeline import BatchPipeline, PipelineJob
+import image_encoder
+from batch_log import BatchLogSink
+import stage_timer
+from diagnostics import diagnostics
+import app_log
+from app_log import log
+import input_scanner
+import hot_folder
+
+# 单张导出的进度步数：背景、主图片、贴纸、边框、文字、合成、编码保存
+EXPORT_STEPS = 7
+
+
+class _ExportCancelled(Exception):
+    """后台导出被取消"""
 
 
 class Tooltip:
@@ -150,6 +178,10 @@ class MainWindow(tk.Tk):
         self.background_pattern_size = 10
         self.background_image = None
         
+        # 导出合成器 (按图层缓存，预览文字层与导出共用)
+        self.compositor = LayerCompositor()
+        self._export_job = None  # 后台导出的取消标志 (threading.Event)，无导出时为 None
+        
         # 颜色方块引用
         self.bg_color_canvases = {}
         self.border_color_canvas = None
@@ -170,8 +202,20 @@ class MainWindow(tk.Tk):
         
         # 批量处理配置
         self.batch_input_dir = ''  # 输入目录
+        self.batch_scan_root = ''  # 从输入目录加载时的扫描根目录 (批量导出时边扫描边处理)
+        self.batch_scan_count = 0  # 后台扫描到的图片数
+        self._scan_generation = 0
+        self.batch_recursive = tk.BooleanVar(value=True)  # 递归扫描子目录
+        self.batch_mirror_folders = tk.BooleanVar(value=True)  # 输出中保留子目录结构
+        self.hot_folder_watcher = None  # 监视目录模式
+        self._watch_manifest = None
         self.batch_output_dir = ''  # 输出目录
-        self.processed_images = set()  # 已处理的图片集合
+        self.batch_skip_unchanged = tk.BooleanVar(value=True)  # 跳过输入和参数都未变化的项 (清单记录在输出目录)
+        self.use_render_cache = tk.BooleanVar(value=True)  # 渲染结果缓存 (相同输入+相同参数直接复用输出)
+        self.batch_encoder_profile = tk.StringVar(value=image_encoder.DEFAULT_PROFILE)  # 批量输出编码档位
+        self.export_encoder_profile = tk.StringVar(value=image_encoder.DEFAULT_PROFILE)  # 单张导出编码档位
+        self.batch_output_format = tk.StringVar(value=image_encoder.DEFAULT_OUTPUT_FORMAT)  # 批量输出格式
+        self.batch_stage_timing = tk.BooleanVar(value=False)  # 统计各渲染阶段耗时 (关闭时无额外开销)
         # self.batch_regenerate_all = tk.BooleanVar(value=False) # 已废弃
         
         # 批量随机化选项
@@ -202,8 +246,8 @@ class MainWindow(tk.Tk):
         self.batch_text_dir = ''  # 文本目录
         self.batch_use_text_dir = tk.BooleanVar(value=False)  # 使用文本目录
         
-        # 自动高亮定时器
-        self._highlight_timer = None
+        # 后台预热 jieba，避免首次高亮检测卡住界面
+        keyword_service.warm_up()
         
         # 加载用户设置
         self.load_settings()
@@ -377,8 +421,14 @@ class MainWindow(tk.Tk):
                     self.batch_input_dir = settings.get('batch_input_dir', '')
                     self.batch_output_dir = settings.get('batch_output_dir', '')
                     self.batch_text_dir = settings.get('batch_text_dir', '') # NOW SAVED
-                    self.processed_images = set(settings.get('processed_images', []))
                     self.preset_themes = settings.get('preset_themes', [])
+                    self.use_render_cache.set(settings.get('render_cache_enabled', True))
+                    render_cache.max_bytes = int(settings.get('render_cache_max_mb', render_cache.max_bytes // (1024 * 1024))) * 1024 * 1024
+                    self.batch_encoder_profile.set(image_encoder.profile_from_name(settings.get('batch_encoder_profile')))
+                    self.export_encoder_profile.set(image_encoder.profile_from_name(settings.get('export_encoder_profile')))
+                    self.batch_output_format.set(image_encoder.output_format_from_name(settings.get('batch_output_format')))
+                    diagnostics.configure_from_settings(settings.get('diagnostics'))
+                    app_log.configure_from_settings(settings.get('log_level'))
                     print(f"✓ 已加载设置: 输入={self.batch_input_dir}, 输出={self.batch_output_dir}, 预设={len(self.preset_themes)}个")
         except Exception as e:
             print(f"加载设置失败: {e}")
@@ -393,8 +443,14 @@ class MainWindow(tk.Tk):
                 'batch_input_dir': self.batch_input_dir,
                 'batch_output_dir': self.batch_output_dir,
                 'batch_text_dir': self.batch_text_dir, # NOW SAVED
-                'processed_images': list(self.processed_images),
-                'preset_themes': self.preset_themes
+                'preset_themes': self.preset_themes,
+                'render_cache_enabled': self.use_render_cache.get(),
+                'render_cache_max_mb': render_cache.max_bytes // (1024 * 1024),
+                'batch_encoder_profile': self.batch_encoder_profile.get(),
+                'export_encoder_profile': self.export_encoder_profile.get(),
+                'batch_output_format': self.batch_output_format.get(),
+                'diagnostics': diagnostics.to_settings(),
+                'log_level': app_log.settings_level()
             }
             with open(settings_path, 'w', encoding='utf-8') as f:
                 json.dump(settings, f, ensure_ascii=False, indent=2)
@@ -402,13 +458,9 @@ class MainWindow(tk.Tk):
             print(f"保存设置失败: {e}")
     
     def batch_log(self, message):
-        """输出日志到批量处理日志框"""
-        if hasattr(self, 'batch_log_text'):
-            self.batch_log_text.config(state=tk.NORMAL)
-            self.batch_log_text.insert(tk.END, f"{message}\n")
-            self.batch_log_text.see(tk.END)  # 自动滚动到底部
-            self.batch_log_text.config(state=tk.DISABLED)
-            self.update_idletasks()  # 强制更新UI
+        """输出日志到批量处理日志框 (缓冲后定时刷新，见 batch_log.BatchLogSink)"""
+        if hasattr(self, 'batch_log_sink'):
+            self.batch_log_sink.write(message)
     
     def on_window_resize(self, event):
         """窗口大小改变时调整画布"""
@@ -951,6 +1003,22 @@ class MainWindow(tk.Tk):
         btn_delete.bind('<Enter>', lambda e: btn_delete.config(bg=COLORS['hover']))
         btn_delete.bind('<Leave>', lambda e: btn_delete.config(bg=COLORS['bg_tertiary']))
         
+        btn_zoom = tk.Label(
+            left_buttons,
+            text='🔍 1:1',
+            font=('SF Pro Text', 10),
+            bg=COLORS['bg_tertiary'],
+            fg=COLORS['text_primary'],
+            padx=12,
+            pady=6,
+            cursor='hand2'
+        )
+        btn_zoom.pack(side=tk.LEFT, padx=(4, 0))
+        btn_zoom.bind('<Button-1>', lambda e: self.toggle_zoom_preview())
+        btn_zoom.bind('<Enter>', lambda e: btn_zoom.config(bg=COLORS['hover']))
+        btn_zoom.bind('<Leave>', lambda e: btn_zoom.config(bg=COLORS['bg_tertiary']))
+        Tooltip(btn_zoom, '按导出尺寸查看细节：滚轮缩放，拖拽平移，双击切换 100% / 适应窗口，Esc 退出')
+        
         # 右侧导出按钮 - 使用Label替代Button
         right_buttons = tk.Frame(toolbar, bg=COLORS['bg_secondary'])
         right_buttons.pack(side=tk.RIGHT, padx=8, pady=6)
@@ -970,6 +1038,33 @@ class MainWindow(tk.Tk):
         btn_export.bind('<Enter>', lambda e: btn_export.config(bg='#28A745'))
         btn_export.bind('<Leave>', lambda e: btn_export.config(bg=COLORS['success']))
         
+        export_profile_combo = self._create_encoder_combo(right_buttons, self.export_encoder_profile)
+        export_profile_combo.pack(side=tk.RIGHT, padx=(0, 6))
+        Tooltip(export_profile_combo, '导出编码档位：快速 (压缩最少，保存最快) / 均衡 / 最小体积 (压缩最充分，保存较慢)')
+        
+        # 后台导出进度 (导出时显示)
+        self.export_progress_frame = tk.Frame(right_buttons, bg=COLORS['bg_secondary'])
+        self.export_progress_label = tk.Label(
+            self.export_progress_frame, text='', font=('SF Pro Text', 10),
+            bg=COLORS['bg_secondary'], fg=COLORS['text_primary']
+        )
+        self.export_progress_label.pack(side=tk.LEFT, padx=(0, 4))
+        self.export_progress = ttk.Progressbar(self.export_progress_frame, length=90, maximum=EXPORT_STEPS,
+                                               mode='determinate')
+        self.export_progress.pack(side=tk.LEFT)
+        btn_cancel_export = tk.Label(
+            self.export_progress_frame,
+            text='✕ 取消',
+            font=('SF Pro Text', 10),
+            bg=COLORS['bg_tertiary'],
+            fg=COLORS['danger'],
+            padx=8,
+            pady=4,
+            cursor='hand2'
+        )
+        btn_cancel_export.pack(side=tk.LEFT, padx=(4, 0))
+        btn_cancel_export.bind('<Button-1>', lambda e: self.cancel_export())
+        
         # 画布 - 按比例计算显示尺寸（占可用空间的90%）
         preset = self.current_size_preset
         # 获取窗口尺寸，计算可用空间（减去左右面板）
@@ -1941,11 +2036,9 @@ class MainWindow(tk.Tk):
             self.after_cancel(self._preview_timer)
         self._preview_timer = self.after(300, self._auto_apply_text)
         
-        # 如果启用了自动高亮，延时触发关键词检测 (Debounce 800ms)
+        # 如果启用了自动高亮，延时触发关键词检测 (Debounce 800ms，由关键词服务处理)
         if hasattr(self, 'highlight_enabled_var') and self.highlight_enabled_var.get():
-            if hasattr(self, '_highlight_timer') and self._highlight_timer:
-                self.after_cancel(self._highlight_timer)
-            self._highlight_timer = self.after(800, self._auto_detect_silent)
+            self._auto_detect_silent(delay=0.8)
     
     def _set_align(self, val):
         """设置对齐方式"""
@@ -1982,17 +2075,8 @@ class MainWindow(tk.Tk):
         self._auto_detect_silent()
         self.save_history("编辑文字内容")
     
-    def _on_highlight_toggle(self):
-        """切换自动高亮"""
-        # 如果启用了高亮，先检测关键词
-        if self.highlight_enabled_var.get():
-            self._auto_detect_silent()
-        self.update_text_preview()
-        self.save_history("编辑文字内容")
-    
-    def _auto_detect_silent(self):
-        """静默自动检测关键词并自动应用到画布"""
-        import re
+    def _auto_detect_silent(self, delay=0.0):
+        """静默自动检测关键词并自动应用到画布 (后台线程提取，不阻塞界面)"""
         if not hasattr(self, 'text_content_entry'):
             return
         
@@ -2001,31 +2085,14 @@ class MainWindow(tk.Tk):
             self._auto_keywords = []
             return
         
-        keywords = []
-        
-        # 使用 jieba 关键词提取
-        try:
-            import jieba.analyse
-            jieba_keywords = jieba.analyse.extract_tags(content, topK=5, withWeight=False)
-            keywords.extend(jieba_keywords)
-        except:
-            pass
-        
-        # 检测英文单词
-        english_words = re.findall(r'[a-zA-Z]{2,}', content)
-        for word in english_words:
-            if word.lower() not in [k.lower() for k in keywords]:
-                keywords.append(word)
-        
-        # 检测 #标签
-        hashtags = re.findall(r'#\w+', content)
-        for tag in hashtags:
-            cleaned = tag.lstrip('#')
-            if cleaned not in keywords:
-                keywords.append(cleaned)
-        
-        # 存储关键词并自动应用到画布
-        self._auto_keywords = list(dict.fromkeys(keywords))[:8]
+        keyword_service.detect_keywords_async(
+            content, self._on_keywords_detected,
+            dispatch=lambda fn: self.after(0, fn), delay=delay, channel='auto'
+        )
+    
+    def _on_keywords_detected(self, keywords):
+        """关键词检测完成 (在主线程中调用)：存储关键词并自动应用到画布"""
+        self._auto_keywords = keywords
         self._auto_apply_text()
     
     def _on_highlight_toggle(self):
@@ -2033,31 +2100,16 @@ class MainWindow(tk.Tk):
         # 1. 获取当前开关状态
         enabled = self.highlight_enabled_var.get()
         
-        # 2. 如果开启，立即执行一次完整的关键词检测 (不使用静默方法，确保拿到结果)
+        # 2. 如果开启，立即检测一次关键词 (后台线程提取，结果已缓存时立即回调；
+        #    jieba 尚在预热时不阻塞界面，检测完成后自动应用到画布)
         if enabled:
-            content = self.text_content_entry.get('1.0', 'end-1c')
-            keywords = []
-            if content and len(content.strip()) >= 1:
-                # 提取关键词
-                try:
-                    import jieba.analyse
-                    keywords.extend(jieba.analyse.extract_tags(content, topK=5))
-                except:
-                    pass
-                
-                # 英文和标签
-                import re
-                keywords.extend(re.findall(r'[a-zA-Z]{2,}', content))
-                keywords.extend([t.lstrip('#') for t in re.findall(r'#\w+', content)])
-            
-            # 去重并保存
-            self._auto_keywords = list(dict.fromkeys(keywords))[:8]
+            self._auto_detect_silent()
         else:
             # 关闭时清空
             self._auto_keywords = []
             
         # 3. 强制重新应用文字 (直接调用应用方法，不走 preview 的 timer 逻辑)
-        print(f"[DEBUG] Toggle Highlight: {enabled}, Keywords: {self._auto_keywords}")
+        log.debug("Toggle Highlight: %s, Keywords: %s", enabled, self._auto_keywords)
         self._auto_apply_text()
         self.save_history("切换自动高亮")
     
@@ -2133,42 +2185,18 @@ class MainWindow(tk.Tk):
         self.image_processor.clear_text_layers()
         
         # [WYSIWYG FIX] 预览应该模拟导出尺寸，然后缩小显示
-        # 直接使用当前选中的预设对象，确保与导出逻辑一致
+        # 直接使用当前选中的预设对象，文字层与导出共用合成器的同一图层
         preset_width = self.current_size_preset['width']
         preset_height = self.current_size_preset['height']
         
         # 画布显示尺寸
         cw = self.canvas_widget.width if self.canvas_widget.width > 10 else 800
-        ch = self.canvas_widget.height if self.canvas_widget.height > 10 else 600
-        
-        # 计算从画布到导出的缩放比例 (和 batch_export 相同)
-        preview_scale = preset_width / cw if cw > 0 else 1.0
-        
-        # 计算导出尺寸下的边框宽度
-        export_border_width = 0
-        if hasattr(self, 'border_config') and self.border_config.get('id') != 'none':
-            export_border_width = int(self.border_config.get('width', 0) * preview_scale)
-            # [FIX] 动态调整安全边距：横屏多留白，竖屏少留白
-            if preset_width > preset_height:
-                # 横屏 (16:9等): 增加更多边距 (30 -> 60) 以防止压边，并配合宽度限制
-                export_border_width += int(60 * preview_scale)
-            else:
-                # 竖屏 (9:16等): 恢复较小边距 (10) 避免内容偏左/过窄
-                export_border_width += int(10 * preview_scale)
-            
-        print(f"[DEBUG] PREVIEW: border_width_raw={self.border_config.get('width')}, export_border_width={export_border_width}")
-        
-        # 强制刷新关键词 (如果是高亮模式且关键词为空)
-        if self.highlight_enabled_var.get() and not self._auto_keywords:
-             pass
         
         # [关键] 使用导出尺寸渲染，和导出时完全一致
-        # [FIX] font_size 已经是预设尺寸下的像素值，所以 render 时 scale 应为 1.0
-        # 如果使用 preview_scale (>1)，会导致字号被再次放大
-        # [FIX] 传入 safe_margin_y，防止顶部/底部被遮挡
-        text_img, x, y = text_layer.render(preset_width, preset_height, scale=1.0, 
-                                          safe_margin_x=export_border_width, 
-                                          safe_margin_y=export_border_width)
+        # [FIX] font_size 已经是预设尺寸下的像素值，所以 render 时 scale 为 1.0
+        # [FIX] 安全边距同时用于左右和上下，防止被边框遮挡
+        self._update_text_layer(self.compositor, self._export_scene())
+        text_img, (x, y) = self.compositor.layer('text')
         
         if text_img:
             # 缩小回预览尺寸
@@ -2176,7 +2204,6 @@ class MainWindow(tk.Tk):
             new_w = int(text_img.width * display_scale)
             new_h = int(text_img.height * display_scale)
             if new_w > 0 and new_h > 0:
-                from PIL import Image
                 text_img = text_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
                 x = int(x * display_scale)
                 y = int(y * display_scale)
@@ -2243,7 +2270,6 @@ class MainWindow(tk.Tk):
     
     def auto_detect_keywords(self):
         """自动检测关键字 (使用 jieba 智能提取)"""
-        import re
         if not hasattr(self, 'text_content_entry'):
             return
         
@@ -2251,40 +2277,20 @@ class MainWindow(tk.Tk):
         if not content.strip():
             return
         
-        keywords = []
-        
-        # 尝试使用 jieba 关键词提取
-        try:
-            import jieba.analyse
-            # 使用 TF-IDF 提取关键词 (最多5个)
-            jieba_keywords = jieba.analyse.extract_tags(content, topK=5, withWeight=False)
-            keywords.extend(jieba_keywords)
-        except ImportError:
-            pass  # jieba 未安装，使用备用方案
-        except Exception as e:
-            print(f"[DEBUG] jieba 关键词提取失败: {e}")
-        
-        # 备用: 检测英文单词 (中文中的英文通常是品牌/专有名词)
-        english_words = re.findall(r'[a-zA-Z]{2,}', content)
-        for word in english_words:
-            if word.lower() not in [k.lower() for k in keywords]:
-                keywords.append(word)
-        
-        # 检测 #标签
-        hashtags = re.findall(r'#\w+', content)
-        for tag in hashtags:
-            cleaned = tag.lstrip('#')
-            if cleaned not in keywords:
-                keywords.append(cleaned)
-        
-        # 去重并更新输入框
-        unique_keywords = list(dict.fromkeys(keywords))[:8]  # 最多8个
+        keyword_service.detect_keywords_async(
+            content, self._on_manual_keywords_detected,
+            dispatch=lambda fn: self.after(0, fn), channel='manual'
+        )
+    
+    def _on_manual_keywords_detected(self, keywords):
+        """手动关键词检测完成 (在主线程中调用)"""
+        # 更新输入框
         if hasattr(self, 'highlight_keywords_entry'):
             self.highlight_keywords_entry.delete(0, 'end')
-            self.highlight_keywords_entry.insert(0, ','.join(unique_keywords))
+            self.highlight_keywords_entry.insert(0, ','.join(keywords))
             self.highlight_enabled_var.set(True)
             self._auto_apply_text()
-            self.show_toast(f'检测到 {len(unique_keywords)} 个关键词')
+            self.show_toast(f'检测到 {len(keywords)} 个关键词')
     
     def update_text_preview(self):
         """更新文字预览 (实时)"""
@@ -2495,6 +2501,16 @@ class MainWindow(tk.Tk):
         load_from_dir_btn.pack(anchor='w', padx=12, pady=4, ipadx=10)
         load_from_dir_btn.bind('<Button-1>', lambda e: self.load_from_input_dir())
         
+        # 监视目录按钮 (新文件写入完成后自动套用当前主题)
+        self.watch_btn = tk.Label(
+            batch_frame, text='👁 开始监视输入目录',
+            bg=COLORS['bg_tertiary'], fg=COLORS['text_primary'],
+            font=('SF Pro Text', 11, 'bold'), pady=10, cursor='hand2'
+        )
+        self.watch_btn.pack(anchor='w', padx=12, pady=4, ipadx=10)
+        self.watch_btn.bind('<Button-1>', lambda e: self.toggle_watch_mode())
+        Tooltip(self.watch_btn, '持续监视输入目录，新图片写入完成后立即按当前主题处理到输出目录 (未变化的图片会跳过)')
+        
         # 4. 状态和选项区域
         status_frame = tk.Frame(batch_frame, bg=COLORS['panel_bg'])
         status_frame.pack(fill=tk.X, padx=12, pady=12)
@@ -2514,7 +2530,80 @@ class MainWindow(tk.Tk):
         )
         self.batch_status_label.pack(fill=tk.X, pady=(2, 8))
         
-        # 已移除强制重新处理选项 (默认不覆盖，因文件名已唯一)
+        # 子目录选项
+        recursive_check = tk.Checkbutton(
+            status_frame, text='包含子目录', variable=self.batch_recursive,
+            bg=COLORS['panel_bg'], fg=COLORS['text_primary'],
+            font=('SF Pro Text', 10), selectcolor=COLORS['bg_secondary'],
+            activebackground=COLORS['panel_bg']
+        )
+        recursive_check.pack(anchor='w')
+        Tooltip(recursive_check, '从输入目录加载时递归扫描所有子目录 (如按日期分的文件夹)')
+        
+        mirror_check = tk.Checkbutton(
+            status_frame, text='输出保留子目录结构', variable=self.batch_mirror_folders,
+            bg=COLORS['panel_bg'], fg=COLORS['text_primary'],
+            font=('SF Pro Text', 10), selectcolor=COLORS['bg_secondary'],
+            activebackground=COLORS['panel_bg']
+        )
+        mirror_check.pack(anchor='w')
+        Tooltip(mirror_check, '子目录中的图片输出到输出目录下的同名子目录')
+        
+        # 增量处理选项 (清单保存在输出目录的 .batch_manifest.sqlite)
+        skip_unchanged_check = tk.Checkbutton(
+            status_frame, text='跳过未变化的图片 (断点续跑)', variable=self.batch_skip_unchanged,
+            bg=COLORS['panel_bg'], fg=COLORS['text_primary'],
+            font=('SF Pro Text', 10), selectcolor=COLORS['bg_secondary'],
+            activebackground=COLORS['panel_bg']
+        )
+        skip_unchanged_check.pack(anchor='w')
+        Tooltip(skip_unchanged_check, '图片内容和批量参数都与上次相同、且输出文件仍存在时跳过；中断后重新运行会从未完成的项继续')
+        
+        render_cache_check = tk.Checkbutton(
+            status_frame, text='使用渲染缓存', variable=self.use_render_cache,
+            command=self.save_settings,
+            bg=COLORS['panel_bg'], fg=COLORS['text_primary'],
+            font=('SF Pro Text', 10), selectcolor=COLORS['bg_secondary'],
+            activebackground=COLORS['panel_bg']
+        )
+        render_cache_check.pack(anchor='w')
+        Tooltip(render_cache_check, '相同图片 + 相同主题参数的结果会被缓存，再次导出时直接复制，不再重新合成 (启用随机化选项时不使用)')
+        
+        # 输出编码档位
+        encoder_frame = tk.Frame(status_frame, bg=COLORS['panel_bg'])
+        encoder_frame.pack(fill=tk.X, pady=(2, 0))
+        tk.Label(
+            encoder_frame, text='输出编码:',
+            bg=COLORS['panel_bg'], fg=COLORS['text_primary'],
+            font=('SF Pro Text', 10)
+        ).pack(side=tk.LEFT)
+        batch_profile_combo = self._create_encoder_combo(encoder_frame, self.batch_encoder_profile)
+        batch_profile_combo.pack(side=tk.LEFT, padx=4)
+        Tooltip(batch_profile_combo, '快速：保存最快、文件较大；均衡：默认；最小体积：PNG 充分压缩、JPEG 渐进式，保存较慢。日志中会显示每张的输出大小')
+        
+        format_frame = tk.Frame(status_frame, bg=COLORS['panel_bg'])
+        format_frame.pack(fill=tk.X, pady=(2, 0))
+        tk.Label(
+            format_frame, text='输出格式:',
+            bg=COLORS['panel_bg'], fg=COLORS['text_primary'],
+            font=('SF Pro Text', 10)
+        ).pack(side=tk.LEFT)
+        batch_format_combo = self._create_encoder_combo(
+            format_frame, self.batch_output_format,
+            names=image_encoder.OUTPUT_FORMATS, from_name=image_encoder.output_format_from_name, width=14)
+        batch_format_combo.pack(side=tk.LEFT, padx=4)
+        Tooltip(batch_format_combo, 'PNG 调色板：颜色少时 (纯文字卡片、纯色背景) 体积可小几倍，量化后画质不达标时自动保存完整 PNG；'
+                                    '自动：在画质阈值内从 PNG / 调色板 PNG / WebP / JPEG 中选最小的 (较慢)')
+        
+        stage_timing_check = tk.Checkbutton(
+            status_frame, text='统计各阶段耗时', variable=self.batch_stage_timing,
+            bg=COLORS['panel_bg'], fg=COLORS['text_primary'],
+            font=('SF Pro Text', 10), selectcolor=COLORS['bg_secondary'],
+            activebackground=COLORS['panel_bg']
+        )
+        stage_timing_check.pack(anchor='w', pady=(2, 0))
+        Tooltip(stage_timing_check, f'记录解码、缩放、背景、边框、贴纸、文字、保存等阶段的耗时，'
+                                    f'完成后在日志末尾显示并导出到输出目录的 {stage_timer.TIMING_FILENAME}')
 
         # 参考示例位置选项
         match_canvas_check = tk.Checkbutton(
@@ -2538,13 +2627,13 @@ class MainWindow(tk.Tk):
                       bg=COLORS['panel_bg'], fg=COLORS['text_primary'], font=('SF Pro Text', 10),
                       selectcolor=COLORS['accent'], activebackground=COLORS['panel_bg'])
         text_dir_check.pack(anchor='w')
-        Tooltip(text_dir_check, '勾选后将尝试为每张图片添加文字 (源自Excel文件)；若未找到对应文字，则使用当前编辑器内容')
+        Tooltip(text_dir_check, '勾选后将尝试为每张图片添加文字 (源自Excel/CSV/JSONL文件)；若未找到对应文字，则使用当前编辑器内容')
         
         # 文字目录选择
         text_dir_select_frame = tk.Frame(text_dir_frame, bg=COLORS['panel_bg'])
         text_dir_select_frame.pack(fill=tk.X, pady=(4, 0))
         
-        text_dir_btn = tk.Label(text_dir_select_frame, text='选择 Excel 数据表', font=('SF Pro Text', 10),
+        text_dir_btn = tk.Label(text_dir_select_frame, text='选择数据表', font=('SF Pro Text', 10),
                                bg=COLORS['bg_tertiary'], fg=COLORS['text_primary'], padx=8, pady=4, cursor='hand2')
         text_dir_btn.pack(side=tk.LEFT)
         text_dir_btn.bind('<Button-1>', lambda e: self.select_excel_file())
@@ -2565,7 +2654,7 @@ class MainWindow(tk.Tk):
                                        fg=COLORS['text_secondary'], anchor='w', padx=8, pady=4)
         self.text_dir_label.pack(fill=tk.X, pady=(4, 0))
         
-        tk.Label(text_dir_frame, text='提示: 使用模版配置文案，程序将自动更新读取时间',
+        tk.Label(text_dir_frame, text='提示: 使用模版配置文案，读取时间记录在同目录的 .readlog.jsonl',
                 font=('SF Pro Text', 8), bg=COLORS['panel_bg'], fg=COLORS['text_tertiary']
                 ).pack(anchor='w', pady=(4, 0))
 
@@ -2644,6 +2733,7 @@ class MainWindow(tk.Tk):
         
         log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.batch_log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.batch_log_sink = BatchLogSink(self.batch_log_text)
 
         # 7. 底部说明
         tip_text = "支持格式：JPG, JPEG, PNG, BMP, GIF"
@@ -2654,6 +2744,7 @@ class MainWindow(tk.Tk):
     def copy_batch_log(self):
         """复制批量处理日志到剪贴板"""
         if hasattr(self, 'batch_log_text'):
+            self.batch_log_sink.flush()
             content = self.batch_log_text.get('1.0', tk.END).strip()
             if content:
                 self.title_bar.clipboard_clear()
@@ -2665,12 +2756,14 @@ class MainWindow(tk.Tk):
 
     def update_batch_status_text(self):
         """更新批量处理状态文本"""
-        if not hasattr(self, 'batch_images') or not self.batch_images:
+        if self.batch_images:
+            # Since we always process provided images (unique filenames), pending is just the total count
+            pending = len(self.batch_images)
+        elif self.batch_scan_root:
+            pending = self.batch_scan_count
+        else:
             return
             
-        # Since we always process provided images (unique filenames), pending is just the total count
-        pending = len(self.batch_images)
-            
         # 本次已处理保持不变，或者如果不希望跟“重新生成”状态挂钩也可以
         processed_text = getattr(self, 'current_session_processed', 0)
         
@@ -3087,6 +3180,9 @@ class MainWindow(tk.Tk):
     def export_image(self):
         """导出图片 (支持无图片导出，仅背景+文字)"""
         # 不再强制要求上传图片
+        if self._export_job is not None:
+            self.show_toast('正在导出，请稍候...')
+            return
         
         # 生成默认文件名
         default_name = f"tupian_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
@@ -3098,204 +3194,316 @@ class MainWindow(tk.Tk):
             filetypes=[
                 ('PNG图片', '*.png'),
                 ('JPEG图片', '*.jpg'),
+                ('WebP图片', '*.webp'),
                 ('所有文件', '*.*')
             ]
         )
         
         if file_path:
-            # 获取导出参数
-            preset_width = self.current_size_preset['width']
-            preset_height = self.current_size_preset['height']
-            display_width = self.canvas_widget.width
-            display_height = self.canvas_widget.height
-            
-            # 使用独立的缩放比例（避免比例失真）
-            scale_x = preset_width / display_width
-            scale_y = preset_height / display_height
-            
-            print(f"[DEBUG] Export: preset={preset_width}x{preset_height}, display={display_width}x{display_height}")
-            print(f"[DEBUG] Export: scale_x={scale_x:.2f}, scale_y={scale_y:.2f}")
-            print(f"[DEBUG] Border config: {self.border_config}")
-            
-            # 1. 创建背景图层
-            final_img = Image.new('RGB', (preset_width, preset_height), self.background_color)
-            draw = ImageDraw.Draw(final_img)
-            
-            # 2. 绘制背景图案
-            if self.background_pattern and self.background_pattern != 'none':
-                # 这里简单重构图案绘制逻辑，或调用专门的 helper
-                scaled_pattern_size = int(self.background_pattern_size * max(scale_x, scale_y))
-                # 使用临时处理器来绘制图案以免影响主状态
-                temp_proc = ImageProcessor()
-                temp_proc.current_image = final_img
-                temp_proc.draw_background_pattern(
-                    self.background_pattern,
-                    self.background_pattern_color,
-                    scaled_pattern_size
-                )
-                final_img = temp_proc.current_image
-            
-            # 3. 绘制主图片
-            if self.image_processor.current_image:
-                # 首先获取图片在画布上的实际位置
-                main_img_id = self.canvas_widget.main_image_id
-                if main_img_id:
-                    coords = self.canvas_widget.canvas.coords(main_img_id)
-                    if coords:
-                        cx, cy = coords
-                        # 获取图片渲染大小
-                        # 注意：Tkinter 里的图片坐标是中心点
-                        main_pil = self.image_processor.current_image
-                        
-                        # 按比例缩放并粘贴 (使用独立的scale_x/scale_y保持比例)
-                        scaled_main_w = int(main_pil.width * scale_x)
-                        scaled_main_h = int(main_pil.height * scale_y)
-                        scaled_main_pil = main_pil.resize((scaled_main_w, scaled_main_h), Image.Resampling.LANCZOS)
-                        
-                        # 计算粘贴位置
-                        paste_x = int(cx * scale_x - scaled_main_w / 2)
-                        paste_y = int(cy * scale_y - scaled_main_h / 2)
-                        final_img.paste(scaled_main_pil, (paste_x, paste_y), scaled_main_pil if scaled_main_pil.mode == 'RGBA' else None)
-            
-            # 4. 绘制贴纸
-            for sticker in self.canvas_widget.get_stickers():
-                scaled_x = int(sticker['x'] * scale_x)
-                scaled_y = int(sticker['y'] * scale_y)
-                scaled_size = int(sticker['size'] * max(scale_x, scale_y))
-                
-                print(f"[DEBUG] Sticker: orig=({sticker['x']}, {sticker['y']}), scaled=({scaled_x}, {scaled_y}), size={scaled_size}")
-                
-                # 使用跨平台的 emoji 渲染
-                try:
-                    base_size = max(160, scaled_size * 2)  # 使用更大的基础尺寸以获得更好的质量
-                    font = get_emoji_font(base_size)
-                    
-                    if font:
-                        # 创建临时图层渲染 emoji
-                        temp_size = base_size * 2  # 留足够边距
-                        emoji_temp = Image.new('RGBA', (temp_size, temp_size), (0, 0, 0, 0))
-                        emoji_draw = ImageDraw.Draw(emoji_temp)
-                        emoji_draw.text((temp_size // 2, temp_size // 2), sticker['text'], 
-                                      font=font, anchor="mm", embedded_color=True)
-                        
-                        # 裁剪掉透明边距
-                        bbox = emoji_temp.getbbox()
-                        if bbox:
-                            emoji_cropped = emoji_temp.crop(bbox)
-                            # 缩放到目标尺寸
-                            emoji_resized = emoji_cropped.resize((scaled_size, scaled_size), Image.Resampling.LANCZOS)
-                            
-                            # 计算粘贴位置（中心对齐）
-                            paste_x = scaled_x - scaled_size // 2
-                            paste_y = scaled_y - scaled_size // 2
-                            
-                            # 合成到最终图片
-                            if final_img.mode != 'RGBA':
-                                final_img = final_img.convert('RGBA')
-                            final_img.paste(emoji_resized, (paste_x, paste_y), emoji_resized)
-                        else:
-                            print(f"[DEBUG] Emoji bbox is None for {sticker['text']}")
-                    else:
-                        print(f"[DEBUG] 无法加载 emoji 字体，使用降级方案")
-                        # 降级方案：使用文本
-                except Exception as e:
-                    print(f"[DEBUG] Emoji rendering error: {e}")
-                    # 降级方案：使用文本
-                    sticker_draw = ImageDraw.Draw(final_img)
-                    try:
-                        font = ImageFont.truetype("/System/Library/Fonts/STHeiti Light.ttc", scaled_size)
-                    except:
-                        font = ImageFont.load_default()
-                    sticker_draw.text((scaled_x, scaled_y), sticker['text'], fill='black', font=font, anchor="mm")
-            
-            # 4.5 绘制文字层 (NEW)
+            self._start_export(file_path)
+    
+    def _start_export(self, file_path):
+        """在后台线程合成并保存 (界面线程只读取画布参数)，完成后回到界面线程提示"""
+        out_ext = os.path.splitext(file_path)[1]
+        cache_spec = self._export_cache_spec() if self.use_render_cache.get() else None
+        main_pil = self.image_processor.current_image
+        scene = self._export_scene()
+        profile = self.export_encoder_profile.get()
+        # 合成器的副本共享已渲染的图层，后台更新图层时不影响界面线程的预览
+        comp = self.compositor.fork()
+        base_revision = self.compositor.revision
+        cancel = threading.Event()
+        self._export_job = cancel
+        self._show_export_progress(0, '准备导出...')
+        
+        def progress(step, text):
+            if cancel.is_set():
+                raise _ExportCancelled()
+            self.after(0, lambda: self._show_export_progress(step, text))
+        
+        def worker():
+            error = None
+            saved = False
+            try:
+                cache_key = self._export_cache_key(main_pil, cache_spec, out_ext) if cache_spec else None
+                # [DIAG] 开启诊断时记录渲染 + 保存的 CPU 分析和内存分配 (不包括对话框)
+                with diagnostics.session('export_image'):
+                    saved = self._export_to(file_path, scene, comp, profile, cache_key, progress)
+            except _ExportCancelled:
+                pass
+            except Exception as e:
+                error = e
+            self.after(0, lambda: self._on_export_done(file_path, saved, error, comp, base_revision))
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def _on_export_done(self, file_path, saved, error, comp, base_revision):
+        """后台导出结束 (界面线程)"""
+        self._export_job = None
+        self._hide_export_progress()
+        # 导出期间画布没有变化时沿用导出更新过的图层
+        if self.compositor.revision == base_revision:
+            self.compositor = comp
+        if error is not None:
+            messagebox.showerror('错误', f'保存失败: {error}')
+        elif saved:
+            self._after_export_saved(file_path)
+        else:
+            self.show_toast('已取消导出')
+    
+    def cancel_export(self):
+        """取消正在进行的导出 (当前步骤结束后停止，不留下未写完的文件)"""
+        if self._export_job is not None:
+            self._export_job.set()
+            self.export_progress_label.config(text='正在取消...')
+    
+    def _show_export_progress(self, step, text):
+        if self._export_job is None:
+            return
+        self.export_progress['value'] = step
+        self.export_progress_label.config(text=text)
+        if not self.export_progress_frame.winfo_ismapped():
+            self.export_progress_frame.pack(side=tk.RIGHT, padx=(0, 6))
+    
+    def _hide_export_progress(self):
+        self.export_progress_frame.pack_forget()
+        self.export_progress['value'] = 0
+    
+    def _export_to(self, file_path, scene, comp, profile, cache_key=None, progress=None):
+        """按画布参数快照合成并保存到 file_path (可在后台线程调用)，返回是否保存
 
-            
-            # 5. 绘制边框 (在最上层)
-            from image_processor import CompositeImage
-            
-            # 使用 border_config 而非 current_border
-            border_config = self.border_config.copy()
-            print(f"[DEBUG] Exporting with border config: {border_config}")  # 调试
-            
-            # 只检查 width > 0 即可应用边框（移除对 id 的检查）
-            uniform_scale = max(scale_x, scale_y)
-            if border_config.get('width', 0) > 0:
-                # 缩放边框宽度和圆角
-                border_config['width'] = int(border_config.get('width', 10) * uniform_scale)
-                if 'radius' in border_config:
-                    border_config['radius'] = int(border_config['radius'] * uniform_scale)
-                # 缩放图案大小
-                if 'pattern_size' in border_config:
-                    border_config['pattern_size'] = int(border_config['pattern_size'] * uniform_scale)
+        Args:
+            scene: _export_scene() 的快照
+            comp: 使用的合成器 (后台调用时为副本)
+            progress: progress(step, text)，step 为已完成的步数，取消时抛出 _ExportCancelled
+        """
+        progress = progress or (lambda step, text: None)
+        # [CACHE] 相同图片 + 相同参数已导出过时直接复用结果，不再合成
+        out_ext = os.path.splitext(file_path)[1]
+        if cache_key and render_cache.fetch(cache_key, out_ext, file_path):
+            log.debug("Export: render cache hit -> %s", file_path)
+            return True
+        
+        # 保存：先写入临时文件再替换，取消或失败时不留下半个文件；
+        # 目标文件可能是缓存的硬链接，替换而不是改写，避免改动缓存内容
+        root, ext = os.path.splitext(file_path)
+        tmp_path = f"{root}.exporting{ext}"
+        try:
+            if tiled_render.should_tile(*scene['size']):
+                # 打印海报等大尺寸：按条带合成并写入，不整幅渲染各图层
+                progress(0, '文字...')
+                tiled = self._tiled_scene(comp, scene)
                 
-                composite = CompositeImage(preset_width, preset_height)
-                composite.canvas = final_img.copy()
-                composite.draw = ImageDraw.Draw(composite.canvas)
+                def strip_progress(done, total):
+                    progress(1 + (EXPORT_STEPS - 2) * done / total, f'分块合成 {done + 1}/{total}...')
                 
-                if border_config.get('radius', 0) > 0:
-                    composite.add_rounded_border(border_config)
-                else:
-                    composite.add_border(border_config)
-                final_img = composite.canvas
-                print(f"[DEBUG] Border applied successfully")
+                encoded_bytes = tiled_render.render_to_file(tiled, tmp_path, profile, scene['dpi'], strip_progress)
             else:
-                print(f"[DEBUG] Skipping border - width={border_config.get('width')}")
+                self._update_export_layers(comp, scene, progress)
+                progress(5, '合成...')
+                final_img = comp.compose()
+                progress(6, '编码保存...')
+                encoded_bytes = image_encoder.encode_image(final_img, tmp_path, profile, scene['dpi'])
+            progress(EXPORT_STEPS, '完成')
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        log.debug("Export: profile=%s, %s", profile, image_encoder.format_bytes(encoded_bytes))
+        if cache_key:
+            render_cache.store(cache_key, out_ext, file_path)
+        return True
+    
+    def _export_scene(self):
+        """导出所需的画布参数快照 (界面线程读取，之后的合成不再访问界面)"""
+        import copy
+        main_pil = self.image_processor.current_image
+        main_img_id = self.canvas_widget.main_image_id
+        coords = self.canvas_widget.canvas.coords(main_img_id) if main_pil and main_img_id else None
+        text_layer = getattr(self, 'current_text_layer', None)
+        return {
+            'size': (self.current_size_preset['width'], self.current_size_preset['height']),
+            'dpi': self.current_size_preset.get('dpi'),
+            'display': (self.canvas_widget.width, self.canvas_widget.height),
+            'background': (self.background_color, self.background_pattern,
+                           self.background_pattern_color, self.background_pattern_size),
+            'main_image': main_pil if coords else None,
+            'main_center': tuple(coords[:2]) if coords else None,
+            'stickers': [(st['text'], st['x'], st['y'], st['size']) for st in self.canvas_widget.get_stickers()],
+            'border': copy.deepcopy(self.border_config),
+            'text_layer': TextLayer.from_dict(copy.deepcopy(text_layer.to_dict())) if text_layer else None,
+        }
+    
+    @staticmethod
+    def _text_safe_margin(scene):
+        """导出尺寸下文字的安全边距 (预览与导出一致)"""
+        preset_width, preset_height = scene['size']
+        scale_x, scale_y, uniform_scale = scene_scale(preset_width, preset_height, *scene['display'])
+        return text_safe_margin(scale_border(scene['border'], uniform_scale), preset_width, preset_height, scale_x)
+    
+    def _update_text_layer(self, comp, scene):
+        """按导出尺寸更新合成器的文字图层 (预览渲染的文字层导出时直接复用)"""
+        preset_width, preset_height = scene['size']
+        comp.set_size(preset_width, preset_height)
+        text_layer = scene['text_layer']
+        if not text_layer:
+            comp.remove('text')
+            return
+        margin = self._text_safe_margin(scene)
+        log.debug("Text layer: %s..., safe_margin=%s", text_layer.content[:10], margin)
+        comp.update('text', text_key(text_layer, preset_width, preset_height, margin),
+                    lambda: render_text(text_layer, preset_width, preset_height, margin))
+    
+    def _export_layers(self, scene):
+        """各图层按导出尺寸换算后的参数 (合成器和分块渲染共用)"""
+        preset_width, preset_height = scene['size']
+        display_width, display_height = scene['display']
+        
+        # 使用独立的缩放比例（避免比例失真），边框、图案、贴纸大小等用统一比例
+        scale_x, scale_y, uniform_scale = scene_scale(preset_width, preset_height, display_width, display_height)
+        
+        log.debug("Export: preset=%sx%s, display=%sx%s", preset_width, preset_height, display_width, display_height)
+        log.debug("Export: scale_x=%.2f, scale_y=%.2f", scale_x, scale_y)
+        log.debug("Border config: %s", scene['border'])
+        
+        color, pattern, pattern_color, pattern_size = scene['background']
+        
+        # 主图片：按画布上的位置 (Tkinter 图片坐标是中心点) 换算到导出尺寸
+        main = None
+        main_pil = scene['main_image']
+        if main_pil is not None:
+            cx, cy = scene['main_center']
+            scaled_main_w = int(main_pil.width * scale_x)
+            scaled_main_h = int(main_pil.height * scale_y)
+            if scaled_main_w > 0 and scaled_main_h > 0:
+                main = (main_pil, (scaled_main_w, scaled_main_h),
+                        (int(cx * scale_x - scaled_main_w / 2), int(cy * scale_y - scaled_main_h / 2)))
+        
+        return {
+            'background': (color, pattern, pattern_color, int(pattern_size * uniform_scale)),
+            'main': main,
+            # PNG 图片贴纸没有文本，不参与导出
+            'stickers': tuple((text, int(x * scale_x), int(y * scale_y), int(size * uniform_scale))
+                              for text, x, y, size in scene['stickers'] if text),
+            # 宽度、圆角、图案大小按统一比例缩放
+            'border': scale_border(scene['border'], uniform_scale),
+        }
+    
+    def _update_export_layers(self, comp, scene, progress=None):
+        """按画布参数快照更新合成器的各图层 (只重绘参数变化的图层)"""
+        progress = progress or (lambda step, text: None)
+        preset_width, preset_height = scene['size']
+        layers = self._export_layers(scene)
+        comp.set_size(preset_width, preset_height)
+        
+        # 1. 背景图层 (底色 + 图案)
+        progress(0, '背景...')
+        bg = layers['background']
+        comp.update('background', bg, lambda: render_background(preset_width, preset_height, *bg))
+        
+        # 2. 主图片
+        progress(1, '主图片...')
+        main = layers['main']
+        if main is not None:
+            main_pil, size, pos = main
+            comp.update('main_image', (Ref(main_pil), size, pos), lambda: (pyramid_resize(main_pil, size), pos))
+        else:
+            comp.remove('main_image')
+        
+        # 3. 贴纸
+        progress(2, '贴纸...')
+        stickers = layers['stickers']
+        comp.update('stickers', stickers, lambda: render_stickers(preset_width, preset_height, stickers))
+        
+        # 4. 边框
+        progress(3, '边框...')
+        scaled_border_config = layers['border']
+        comp.update('border', freeze(scaled_border_config),
+                    lambda: render_border(preset_width, preset_height, scaled_border_config))
+        
+        # 5. 文字层 (在边框之上，避免被遮挡)
+        progress(4, '文字...')
+        self._update_text_layer(comp, scene)
+    
+    def _tiled_scene(self, comp, scene):
+        """大尺寸输出的分块场景 (只有文字层由合成器渲染并缓存，其余图层按区域合成)"""
+        self._update_text_layer(comp, scene)
+        layers = self._export_layers(scene)
+        return TiledScene(*scene['size'], layers['background'], layers['main'], layers['stickers'],
+                          layers['border'], comp.layer('text'))
+    
+    def toggle_zoom_preview(self):
+        """打开/关闭导出尺寸的缩放预览 (默认 100%，只渲染可见区域)"""
+        if self.canvas_widget.zoom_preview:
+            self.canvas_widget.exit_zoom_preview()
+            return
+        comp = self.compositor
+        scene = self._export_scene()
+        # 预览固定为打开时的画面：之后的编辑 (如拖动文字时更新合成器的文字层) 不影响按需渲染的分块，
+        # 不会出现新旧分块混在一起
+        if tiled_render.should_tile(*scene['size']):
+            # 大尺寸不整幅渲染各图层，可见分块直接按区域合成 (TiledScene 只持有打开时的参数和文字层)
+            tiled = self._tiled_scene(comp, scene)
+            self.canvas_widget.enter_zoom_preview(tiled.size, tiled.render_region, comp.revision)
+        else:
+            self._update_export_layers(comp, scene)
+            snapshot = comp.fork()
+            self.canvas_widget.enter_zoom_preview((snapshot.width, snapshot.height), snapshot.compose_region,
+                                                  snapshot.revision)
+        self.canvas_widget.zoom_preview.zoom_to(1.0)
+    
+    def _export_cache_spec(self):
+        """单张导出的渲染缓存参数哈希 (画布上的全部参数，界面线程读取)"""
+        main_coords = None
+        main_pil = self.image_processor.current_image
+        if main_pil and self.canvas_widget.main_image_id:
+            main_coords = self.canvas_widget.canvas.coords(self.canvas_widget.main_image_id)
+        text_layer = None
+        if hasattr(self, 'current_text_layer') and self.current_text_layer:
+            text_layer = self.current_text_layer.to_dict()
+        spec = {
+            'size': (self.current_size_preset['width'], self.current_size_preset['height']),
+            'dpi': self.current_size_preset.get('dpi'),
+            'display': (self.canvas_widget.width, self.canvas_widget.height),
+            'border': self.border_config,
+            'background': (self.background_color, self.background_pattern,
+                           self.background_pattern_color, self.background_pattern_size),
+            # 只取贴纸内容和位置 (画布项 id、预览图片对象每次不同，不参与缓存键)
+            'stickers': [(st['text'], st['x'], st['y'], st['size']) for st in self.canvas_widget.get_stickers()],
+            'main_coords': main_coords,
+            'text_layer': text_layer,
+            'encoder': self.export_encoder_profile.get(),
+        }
+        return batch_manifest.spec_hash(spec)
+    
+    @staticmethod
+    def _export_cache_key(main_pil, cache_spec, out_ext):
+        """单张导出的渲染缓存键 (当前图片内容 + 参数哈希)
 
-            # 6. 绘制文字层 (Moved to be AFTER border to avoid being covered)
-            if hasattr(self, 'current_text_layer') and self.current_text_layer:
-                # [FIX] 使用 scale=1 因为直接传入 preset_width/preset_height
-                # 与预览逻辑保持一致：预览时先用 preset 尺寸渲染，再缩小显示
-                text_scale = 1.0
-                
-                # 计算有效边框宽度 (与预览一致)
-                effective_border_width = 0
-                if border_config.get('width', 0) > 0:
-                    # 边框宽度需要按画布到预设的比例缩放
-                    effective_border_width = int(border_config.get('width', 0) * scale_x)
-                    
-                    # [FIX] 动态调整批量导出的安全边距
-                    if preset_width > preset_height:
-                        effective_border_width += int(60 * scale_x) # 横屏大边距
-                    else:
-                        effective_border_width += int(10 * scale_x) # 竖屏小边距
-                
-                # 渲染文字到独立图层 (使用 preset 尺寸，scale=1)
-                print(f"[DEBUG] Exporting text layer: {self.current_text_layer.content[:10]}..., scale={text_scale}, safe_margin={effective_border_width}")
-                text_img, tx, ty = self.current_text_layer.render(preset_width, preset_height, scale=text_scale, 
-                                                                  safe_margin_x=effective_border_width,
-                                                                  safe_margin_y=effective_border_width)
-                
-                if text_img:
-                    # 合成到最终图片
-                    if final_img.mode != 'RGBA':
-                        final_img = final_img.convert('RGBA')
-                    
-                    # 确保 text_img 也是 RGBA
-                    if text_img.mode != 'RGBA':
-                        text_img = text_img.convert('RGBA')
-                        
-                    final_img.paste(text_img, (tx, ty), text_img)
-            
-            # 6. 保存
+        图片内容哈希要读取全部像素 (大图需要数百毫秒)，在导出的后台线程中计算。
+        """
+        content_hash = image_hash(main_pil) if main_pil else 'none'
+        return render_cache.make_key(content_hash, cache_spec, out_ext)
+    
+    def _after_export_saved(self, file_path):
+        """导出成功后的提示 (自动保存预设、打开目录)"""
+        # 根据勾选框状态决定是否自动保存预设
+        save_msg = f'图片已保存到:\n{file_path}'
+        try:
+            save_msg += f'\n大小: {image_encoder.format_bytes(os.path.getsize(file_path))}'
+        except OSError:
+            pass
+        if hasattr(self, 'auto_save_preset_var') and self.auto_save_preset_var.get():
+            self.save_preset_theme(silent=True)
+            save_msg += '\n\n✓ 主题预设已自动保存'
+        
+        # 询问是否打开目录
+        if messagebox.askyesno('导出成功', save_msg + '\n\n是否打开所在目录？'):
             try:
-                final_img.save(file_path)
-                
-                # 根据勾选框状态决定是否自动保存预设
-                save_msg = f'图片已保存到:\n{file_path}'
-                if hasattr(self, 'auto_save_preset_var') and self.auto_save_preset_var.get():
-                    self.save_preset_theme(silent=True)
-                    save_msg += '\n\n✓ 主题预设已自动保存'
-                
-                # 询问是否打开目录
-                if messagebox.askyesno('导出成功', save_msg + '\n\n是否打开所在目录？'):
-                    try:
-                        folder_path = os.path.dirname(file_path)
-                        self.open_directory(folder_path, select_file=file_path)
-                    except Exception as e:
-                        print(f"打开目录失败: {e}")
+                folder_path = os.path.dirname(file_path)
+                self.open_directory(folder_path, select_file=file_path)
             except Exception as e:
-                messagebox.showerror('错误', f'保存失败: {e}')
+                print(f"打开目录失败: {e}")
     
     def select_input_dir(self):
         """选择输入目录"""
@@ -3346,10 +3554,12 @@ class MainWindow(tk.Tk):
                 messagebox.showerror('错误', f'保存模板失败: {e}')
 
     def select_excel_file(self):
-        """选择 Excel 文件"""
+        """选择配文数据文件 (Excel / CSV / JSONL)"""
         file_path = filedialog.askopenfilename(
-            title='选择 Excel 数据表',
-            filetypes=[('Excel 文件', '*.xlsx'), ('Excel 97-2003', '*.xls')],
+            title='选择配文数据表',
+            filetypes=[('配文数据', '*.xlsx *.csv *.tsv *.jsonl *.ndjson'),
+                       ('Excel 文件', '*.xlsx'), ('CSV 文件', '*.csv *.tsv'),
+                       ('JSONL 文件', '*.jsonl *.ndjson')],
             initialdir=os.path.dirname(self.batch_text_dir) if self.batch_text_dir else None
         )
         if file_path:
@@ -3400,7 +3610,11 @@ class MainWindow(tk.Tk):
         toast.after(duration, toast.destroy)
 
     def load_from_input_dir(self):
-        """从输入目录加载图片"""
+        """从输入目录加载图片
+
+        不再预先列出全部文件：记录扫描根目录，批量导出时边扫描边处理；
+        这里只在后台线程中统计数量，逐步刷新界面。
+        """
         if not self.batch_input_dir:
             self.show_toast('请先设置输入目录')
             return
@@ -3409,30 +3623,61 @@ class MainWindow(tk.Tk):
             messagebox.showerror('错误', '输入目录不存在')
             return
         
-        # 获取目录中所有图片
-        extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
-        all_images = []
-        for f in os.listdir(self.batch_input_dir):
-            if f.lower().endswith(extensions):
-                all_images.append(os.path.join(self.batch_input_dir, f))
-        
-        self.batch_images = all_images
-        
-        # 统计已处理（历史）和未处理
-        # 注意：这里的 pending 是基于历史记录的，用于增量处理
-        pending = [p for p in all_images if os.path.basename(p) not in self.processed_images]
+        self.batch_images = []
+        self.batch_scan_root = self.batch_input_dir
+        self.batch_scan_count = 0
         
         # 重置当前会话的“本次已处理”计数
         self.current_session_processed = 0
         
-        self.batch_count_label.config(text=f'已加载: {len(all_images)} 张图片')
+        self._scan_generation += 1
+        generation = self._scan_generation
+        scan_root = self.batch_scan_root
+        recursive = self.batch_recursive.get()
+        output_dir = self.batch_output_dir
+        self.batch_count_label.config(text='正在扫描输入目录...')
+        
+        def worker():
+            # 统计已处理（历史）和未处理
+            # 注意：这里的 pending 基于输出目录中的批量清单 (仅比较文件大小和修改时间)，用于增量处理
+            done = {}
+            manifest = batch_manifest.open_manifest(output_dir)
+            if manifest:
+                try:
+                    done = manifest.done_records()
+                finally:
+                    manifest.close()
+            
+            total = pending = 0
+            for item in input_scanner.scan_images(scan_root, recursive=recursive, exclude=output_dir):
+                if generation != self._scan_generation:
+                    return  # 已重新加载，放弃本次统计
+                total += 1
+                if batch_manifest.is_pending(item, done):
+                    pending += 1
+                if total % 1000 == 0:
+                    self.after(0, lambda t=total, p=pending: self._on_input_scan_progress(generation, t, p, False))
+            self.after(0, lambda: self._on_input_scan_progress(generation, total, pending, True))
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def _on_input_scan_progress(self, generation, total, pending, finished):
+        """后台扫描进度 (UI 线程)"""
+        if generation != self._scan_generation:
+            return
+        self.batch_scan_count = total
+        suffix = '' if finished else ' (扫描中...)'
+        self.batch_count_label.config(text=f'已加载: {total} 张图片{suffix}')
         if hasattr(self, 'batch_status_label'):
              # UI显示：待处理(增量) | 本次已处理
-             self.batch_status_label.config(text=f'待处理: {len(pending)} 张 | 本次已处理: 0 张')
+             self.batch_status_label.config(text=f'待处理: {pending} 张 | 本次已处理: 0 张')
         
-        if all_images:
-            self.show_toast(f'成功加载 {len(all_images)} 张图片')
+        if not finished:
+            return
+        if total:
+            self.show_toast(f'成功加载 {total} 张图片')
         else:
+            self.batch_scan_root = ''
             messagebox.showwarning('提示', '目录中没有图片文件')
     
     def batch_upload(self):
@@ -3447,14 +3692,14 @@ class MainWindow(tk.Tk):
         
         if file_paths:
             self.batch_images = list(file_paths)
+            self.batch_scan_root = ''
+            self._scan_generation += 1
             self.batch_count_label.config(text=f'已选择: {len(self.batch_images)} 张图片')
             messagebox.showinfo('成功', f'已选择 {len(self.batch_images)} 张图片')
     
     def get_random_color(self):
         """随机获取颜色 (马卡龙 + 多巴胺色系)"""
-        import random
-        from constants import MACARON_COLORS, DOPAMINE_COLORS
-        return random.choice(MACARON_COLORS + DOPAMINE_COLORS)
+        return batch_renderer.random_color()
     
     def get_random_highlight_color(self):
         """随机获取高亮颜色 (仅限亮色)"""
@@ -3464,17 +3709,11 @@ class MainWindow(tk.Tk):
 
     def get_random_line_style(self):
         """随机获取线条样式"""
-        import random
-        from constants import LINE_STYLES
-        return random.choice(LINE_STYLES)['id']
+        return batch_renderer.random_line_style()
 
     def get_random_pattern(self):
         """随机获取边框图案"""
-        import random
-        from constants import BORDER_PATTERNS
-        # 排除 'none'
-        patterns = [p['id'] for p in BORDER_PATTERNS if p['id'] != 'none']
-        return random.choice(patterns) if patterns else 'dots'
+        return batch_renderer.random_pattern()
 
 
     def open_directory(self, path, select_file=None):
@@ -3505,95 +3744,203 @@ class MainWindow(tk.Tk):
             print(f"Open directory error: {e}")
             messagebox.showerror('错误', f'无法打开目录: {e}')
 
-    def _load_text_mapping(self, source_path):
-        """加载文字映射 (仅 Excel)，并回写更新时间"""
-        mapping = {}
-        sequential_list = []
-        
+    def _load_text_source(self, source_path):
+        """加载配文数据源 (Excel / CSV / JSONL，流式只读)，并在旁路文件中记录读取时间"""
         if not source_path or not os.path.isfile(source_path):
-            return None, []
+            return text_sources.TextSource()
             
-        # Excel 模式
+        source = text_sources.TextSource()
         try:
-            import openpyxl
-            from datetime import datetime
-            
-            # 必须用 load_workbook 加载，不能只读，因为要回写
-            wb = openpyxl.load_workbook(source_path, data_only=False)
-            ws = wb.active
+            source = text_sources.load_text_source(source_path)
             
-            # 标记是否有修改
-            has_update = False
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            # 遍历所有行 (跳过 header? 假设第一行可能是 Header)
-            # 为了确保准确，我们读取所有行，但通常第一行是标题。
-            # 如果第一行是 "文件名" "内容"，我们一般跳过。
-            # 简单策略：遍历所有，如果匹配特定特征才处理
-            
-            rows = list(ws.iter_rows(min_row=1)) # 获取所有行对象
-            
-            for row_idx, row in enumerate(rows):
-                # 获取值 (注意: row是单元格对象，不是值，因为 data_only=False)
-                # 使用 value 属性
-                val1 = row[0].value
-                val2 = row[1].value if len(row) > 1 else None
-                
-                col1 = str(val1).strip() if val1 is not None else ""
-                col2 = str(val2).strip() if val2 is not None else ""
+            # 读取时间写入同目录的 .readlog.jsonl，不再改写数据表
+            if source:
+                if not text_sources.record_read(source_path, len(source.mapping), source.sequence_count):
+                    self.show_toast("无法写入读取记录")
+        except Exception as e:
+            print(f"读取配文数据失败: {e}")
+            self.show_toast(f"读取配文数据失败: {e}")
                 
-                # 跳过空行
-                if not col1 and not col2:
-                    continue
-                    
-                # 检查是否是标题行 (简单的关键词检查)
-                if row_idx == 0:
-                     if '文件名' in col1 or '内容' in col2 or 'Filename' in col1:
-                         # 这里的标题行可以写入 "更新时间" 到第三列
-                         if len(row) > 2:
-                             row[2].value = "最后读取时间"
-                             has_update = True
-                         else:
-                             # 只有两列，无法写标题到第三列? openpyxl 会自动扩展吗？可以
-                             ws.cell(row=row_idx+1, column=3, value="最后读取时间")
-                             has_update = True
-                         continue
+        return source
 
-                # 提取数据
-                content = ""
-                # 逻辑复用：
-                if '.' in col1 and len(col1) > 3:
-                     # A=Filename, B=Content
-                     content = col2
-                     mapping[col1] = content
-                else:
-                     # Sequence
-                     content = col2 if col2 else col1
-                     sequential_list.append(content)
-                
-                # 回写时间到第3列 (Column C)
-                # 只有当确实读取了这一行数据时才写
-                if content:
-                    ws.cell(row=row_idx+1, column=3, value=current_time)
-                    has_update = True
+    def toggle_watch_mode(self):
+        """开始/停止监视输入目录"""
+        if self.hot_folder_watcher:
+            self.stop_watch_mode()
+        else:
+            self.start_watch_mode()
 
-            if has_update:
-                try:
-                    wb.save(source_path)
-                    print(f"[INFO] 已更新 Excel 时间戳: {source_path}")
-                except Exception as e:
-                    print(f"[ERROR] 无法回写 Excel: {e} (可能文件被占用)")
-                    self.show_toast(f"无法更新Excel时间: 文件被占用?")
-                    
+    def start_watch_mode(self):
+        """监视输入目录：新文件写入完成后在后台线程中按当前主题处理"""
+        if not self.batch_input_dir or not os.path.isdir(self.batch_input_dir):
+            messagebox.showwarning('提示', '请先设置输入目录')
+            return
+        output_dir = self.batch_output_dir
+        if not output_dir or not os.path.isdir(output_dir):
+            messagebox.showwarning('提示', '请先设置输出目录')
+            return
+        if input_scanner.same_directory(output_dir, self.batch_input_dir):
+            # 输出会出现在监视的目录中并被再次处理 (输入目录的子目录可以，监视时会跳过)
+            messagebox.showwarning('提示', '监视模式的输出目录不能与输入目录相同')
+            return
+
+        text_mapping = {}
+        if self.batch_use_text_dir.get() and self.batch_text_dir and os.path.exists(self.batch_text_dir):
+            text_mapping = self._load_text_source(self.batch_text_dir).mapping
+        editor_content = None
+        if hasattr(self, 'current_text_layer') and self.current_text_layer:
+            editor_content = self.current_text_layer.content
+        use_text = self.batch_use_text_dir.get()
+
+        # 主题参数在开始时固定；渲染器在整个监视期间复用 (字体/贴纸/边框遮罩保持预热)
+        spec = self._batch_job_spec(self.current_size_preset['width'], self.current_size_preset['height'])
+        try:
+            hot_folder.write_job_spec(spec, output_dir)
         except Exception as e:
-            print(f"读取 Excel 失败: {e}")
-            self.show_toast(f"读取 Excel 失败: {e}")
-                
-        return mapping, sequential_list
+            log.debug("保存任务参数失败: %s", e)
+        renderer = BatchRenderer(spec)
+        manifest = batch_manifest.open_manifest(output_dir)
+        mirror = self.batch_mirror_folders.get()
+
+        def log_line(message):
+            self.after(0, lambda: self.batch_log(message))
+
+        def count_processed():
+            # 界面线程中计数 (与批量导出共用的计数只在界面线程修改)
+            self.current_session_processed = getattr(self, 'current_session_processed', 0) + 1
+            self.update_batch_status_text()
+
+        def on_ready(item):
+            # 监视线程中执行 (逐个处理，不阻塞界面)
+            if watcher is not self.hot_folder_watcher:
+                return
+            text_content = None
+            if use_text:
+                text_content = text_mapping.get(os.path.basename(item.path)) or editor_content
+            log_line(f"[监视] 处理: {os.path.join(item.rel_dir, os.path.basename(item.path))}")
+            status, _ = hot_folder.process_file(renderer, item, output_dir, text_content,
+                                                manifest=manifest, mirror=mirror, log=log_line)
+            if status != 'done':
+                return
+            self.after(0, count_processed)
+            # [AUTH] 扣除使用次数
+            allowed, msg = auth.increment_usage(1)
+            if not allowed:
+                log_line(f"  [STOP] {msg}")
+                self.after(0, self.stop_watch_mode)
+
+        watcher = hot_folder.HotFolderWatcher(self.batch_input_dir, on_ready,
+                                              recursive=self.batch_recursive.get(), exclude=output_dir)
+        self.hot_folder_watcher = watcher
+        self._watch_manifest = manifest
+        watcher.start()
+
+        self.watch_btn.config(text='⏹ 停止监视', bg=COLORS['accent'], fg='white')
+        self.batch_log(f"═══ 开始监视: {self.batch_input_dir} ═══")
+        self.batch_log(f"输出目录: {output_dir}")
+        if use_text and self.batch_text_dir:
+            self.batch_log(f"配文: 按文件名匹配 {len(text_mapping)} 条 (监视模式不使用顺序配文)")
+
+    def stop_watch_mode(self):
+        """停止监视 (正在处理的文件处理完后退出)"""
+        watcher = self.hot_folder_watcher
+        if not watcher:
+            return
+        manifest = self._watch_manifest
+        self.hot_folder_watcher = None
+        self._watch_manifest = None
+        watcher.stop()
+
+        def close_when_idle():
+            watcher.join()
+            if manifest:
+                manifest.close()
+        threading.Thread(target=close_when_idle, daemon=True).start()
+
+        self.watch_btn.config(text='👁 开始监视输入目录', bg=COLORS['bg_tertiary'], fg=COLORS['text_primary'])
+        self.batch_log("═══ 已停止监视 ═══")
+
+    def _batch_job_spec(self, preset_width, preset_height):
+        """批量任务参数 (用于清单中的参数哈希，任一项变化都会重新处理)"""
+        text_layer = None
+        if hasattr(self, 'current_text_layer') and self.current_text_layer:
+            text_layer = self.current_text_layer.to_dict()
+        return {
+            'size': (preset_width, preset_height),
+            'display': (self.canvas_widget.width, self.canvas_widget.height),
+            'border': dict(self.border_config),
+            'background': (self.background_color, self.background_pattern,
+                           self.background_pattern_color, self.background_pattern_size),
+            # 只保留渲染需要的字段 (画布对象 id 每次启动都不同)
+            'stickers': [{'text': st['text'], 'x': st['x'], 'y': st['y'], 'size': st['size']}
+                         for st in self.canvas_widget.get_stickers()],
+            'match_canvas': self.batch_match_canvas.get(),
+            'geometry': self.canvas_widget.get_main_image_geometry() if self.batch_match_canvas.get() else None,
+            'text_layer': text_layer,
+            'text_config': None if text_layer else dict(self.current_text_config),
+            'use_text': self.batch_use_text_dir.get(),
+            'random': (self.batch_random_color.get(), self.batch_random_style.get(),
+                       self.batch_random_pattern.get(), self.batch_random_highlight.get(),
+                       self.batch_random_font_style.get(), self.batch_random_background_style.get()),
+            'encoder': self.batch_encoder_profile.get(),
+            'output_format': self.batch_output_format.get(),
+            # 打印尺寸写入预设的分辨率 (与单张导出一致)
+            'dpi': self.current_size_preset.get('dpi'),
+        }
+    
+    def _create_encoder_combo(self, parent, variable, names=None, from_name=None, width=10):
+        """编码档位 / 输出格式下拉框 (显示友好名称，variable 中保存档位名或格式名)"""
+        names = names or image_encoder.PROFILE_NAMES
+        from_name = from_name or image_encoder.profile_from_name
+        display_var = tk.StringVar(value=names.get(variable.get(), next(iter(names.values()))))
+        combo = ttk.Combobox(parent, textvariable=display_var, values=list(names.values()),
+                             state='readonly', width=width)
+        
+        def on_select(event):
+            variable.set(from_name(display_var.get()))
+            self.save_settings()
+        
+        combo.bind('<<ComboboxSelected>>', on_select)
+        # 设置加载后同步显示
+        variable.trace_add('write', lambda *args: display_var.set(names.get(variable.get(), display_var.get())))
+        return combo
+
+    def _extract_tags_in_background(self, captions):
+        """在后台线程批量预提取关键词，等待期间界面照常刷新 (进度按 10% 写入日志)
+
+        Returns:
+            新提取的条数，失败时为 None
+        """
+        done = threading.Event()
+        outcome = {}
+        reported = [0]
+
+        def progress(count, total):
+            step = count * 10 // total
+            if step > reported[0]:
+                reported[0] = step
+                self.after(0, lambda: self.batch_log(f"  关键词: {count}/{total}"))
+
+        def worker():
+            try:
+                outcome['count'] = keyword_service.extract_tags_batch(captions, top_k=5, progress=progress)
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=worker, daemon=True).start()
+        while not done.wait(0.05):
+            self.update()
+        self.update()
+        if 'error' in outcome:
+            self.batch_log(f"预提取关键词失败: {outcome['error']}")
+            return None
+        return outcome['count']
 
     def batch_export(self):
         """批量导出图片"""
-        if not self.batch_images and not (self.batch_use_text_dir.get() and self.batch_text_dir):
+        if not self.batch_images and not self.batch_scan_root and not (self.batch_use_text_dir.get() and self.batch_text_dir):
             messagebox.showwarning('提示', '请先加载图片 或 启用批量文字！')
             return
         
@@ -3611,508 +3958,342 @@ class MainWindow(tk.Tk):
             return
 
         # [EXCEL] 预加载文字映射 (Moved Up)
-        text_mapping = {}
-        text_sequence = []
+        # 文件名映射常驻内存；顺序配文随解析一并保存 (过大时处理时按序号流式读取)，整批只解析一次文件
+        text_source = text_sources.TextSource()
         # 注意：先初始化为空，如果有配置再加载
         if self.batch_use_text_dir.get() and self.batch_text_dir and os.path.exists(self.batch_text_dir):
             try:
                 # 临时静默日志或允许在此处日志
-                text_mapping, text_sequence = self._load_text_mapping(self.batch_text_dir)
+                text_source = self._load_text_source(self.batch_text_dir)
             except Exception as e:
                 self.batch_log(f"预加载 Excel 失败: {e}")
+        text_mapping = text_source.mapping
+        sequence_count = text_source.sequence_count
 
-        # 确定循环目标
+        # 确定循环目标 (输入目录模式下边扫描边处理，总数未知)
         if self.batch_images:
-            images_to_process = self.batch_images
+            images_to_process = input_scanner.from_paths(self.batch_images)
+            total_count = len(self.batch_images)
+            source_type = 'image'
+        elif self.batch_scan_root and os.path.isdir(self.batch_scan_root):
+            # 输出目录在输入目录内时跳过，边扫描边输出不会把结果再当作输入
+            images_to_process = input_scanner.scan_images(self.batch_scan_root, recursive=self.batch_recursive.get(),
+                                                          exclude=output_dir)
+            total_count = None
             source_type = 'image'
-        elif text_sequence:
+        elif sequence_count:
             # 纯文字模式：根据 Excel 行数生成 N 个任务
-            images_to_process = [None] * len(text_sequence)
+            images_to_process = itertools.repeat(None, sequence_count)
+            total_count = sequence_count
             source_type = 'text_only'
         else:
              messagebox.showwarning('提示', '未找到有效的图片或文字数据！')
              return
+        total_label = str(total_count) if total_count is not None else '?'
 
         
         success_count = 0
         preset_width = self.current_size_preset['width']
         preset_height = self.current_size_preset['height']
         
+        # 完整日志 (含每项耗时) 写入输出目录，日志框只保留最近的行
+        sink = self.batch_log_sink
+        sink.open_file(output_dir)
+        started_at = time.perf_counter()
+        sink.record('start', output_dir=output_dir, total=total_count, size=(preset_width, preset_height))
+        
         # 开始日志
         self.batch_log(f"═══ 开始批量处理 ═══")
         self.batch_log(f"模式: {'图片处理' if source_type == 'image' else '纯文字生成'}")
-        self.batch_log(f"待处理: {len(images_to_process)} 项")
+        if total_count is not None:
+            self.batch_log(f"待处理: {total_count} 项")
+        else:
+            self.batch_log(f"待处理: 边扫描边处理 {self.batch_scan_root}")
         
         if text_mapping:
              self.batch_log(f"已加载 Excel 映射: {len(text_mapping)} 条记录")
-        if text_sequence:
-             self.batch_log(f"已加载 Excel 列表: {len(text_sequence)} 条记录")
+        if sequence_count:
+             self.batch_log(f"已加载 Excel 列表: {sequence_count} 条记录")
 
         self.batch_log(f"输出目录: {output_dir}")
         self.batch_log(f"输出尺寸: {preset_width}x{preset_height}")
         
+        # [NLP] 随机高亮：预先并行提取所有配文的关键词 (逐项处理时直接命中缓存)
+        if self.batch_random_highlight.get() and self.batch_use_text_dir.get():
+            caption_count = len(text_mapping) + sequence_count
+            captions = itertools.chain(text_mapping.values(), text_source.iter_sequence())
+            if hasattr(self, 'current_text_layer') and self.current_text_layer:
+                captions = itertools.chain(captions, [self.current_text_layer.content])
+                caption_count += 1
+            if caption_count:
+                self.batch_log(f"预提取关键词: {caption_count} 条配文...")
+                extracted_count = self._extract_tags_in_background(captions)
+                if extracted_count is not None:
+                    self.batch_log(f"预提取完成: 新提取 {extracted_count} 条")
+        
         # 记录本次会话处理数
         self.current_session_processed = 0
         
-        # (Deleted duplicate load_text_mapping code block here)
+        # [MANIFEST] 批量清单：跳过未变化的项，中断后可续跑
+        manifest = batch_manifest.open_manifest(output_dir)
+        base_spec = self._batch_job_spec(preset_width, preset_height)
+        renderer = BatchRenderer(base_spec)
+        try:
+            # 保存任务参数，命令行 (batch_cli.py) 可直接复用当前主题
+            hot_folder.write_job_spec(base_spec, output_dir)
+        except Exception as e:
+            log.debug("保存任务参数失败: %s", e)
         
-        for idx, img_path in enumerate(images_to_process):
+        # 获取当前编辑器中的文字内容作为基础/兜底
+        editor_content = None
+        if hasattr(self, 'current_text_layer') and self.current_text_layer:
+            editor_content = self.current_text_layer.content
+        skipped_count = 0
+        
+        # [CACHE] 随机化选项会让每次结果不同，此时不使用渲染缓存
+        use_cache = self.use_render_cache.get() and not any(base_spec['random'])
+        cached_count = 0
+        if self.use_render_cache.get() and not use_cache:
+            self.batch_log("渲染缓存: 已启用随机化选项，本次不使用缓存")
+        
+        processed_count = 0
+        # [PIPELINE] 读取/解码、合成、编码并行；界面线程只负责决策、提交和收尾
+        # [TIMING] 各阶段计时 (只在勾选时替换被计时的方法)
+        stage_timing = self.batch_stage_timing.get()
+        if stage_timing:
+            stage_timer.reset()
+            stage_timer.enable()
+        # [DIAG] 开启诊断时记录整批的内存分配；每 N 项由流水线做一次 CPU 分析
+        # (各项在流水线线程中处理，界面线程的 CPU 分析没有意义，这里只记录内存)
+        diag_session = diagnostics.session('batch_export', cpu=False).start()
+        if diagnostics.enabled:
+            self.batch_log(f"诊断: 每 {diagnostics.sample_every} 项采样一次，报告目录 {diagnostics.output_dir}")
+        
+        pipeline = BatchPipeline(renderer)
+        encoded_bytes = 0
+        self.batch_log(f"输出编码: {image_encoder.PROFILE_NAMES.get(base_spec['encoder'], base_spec['encoder'])}, "
+                       f"格式: {image_encoder.OUTPUT_FORMATS.get(base_spec['output_format'], base_spec['output_format'])}")
+        stop_requested = False
+        last_pump = 0.0
+        
+        def pump():
+            """处理界面事件 (限频，避免界面刷新比渲染还耗时)"""
+            nonlocal last_pump
+            now = time.monotonic()
+            if now - last_pump >= 0.05:
+                last_pump = now
+                self.update()
+        
+        def finish(job):
+            """处理一项流水线结果 (在界面线程中调用)"""
+            nonlocal success_count, stop_requested, encoded_bytes
+            ctx = job.context
+            durations = {k: round(v, 4) for k, v in job.timings.items()}
+            if stage_timing:
+                for stage, seconds in job.timings.items():
+                    stage_timer.add(f'pipeline.{stage}', seconds)
+            for line in job.logs:
+                self.batch_log(line)
+            if not job.ok:
+                self.batch_log(f"  └─ 错误: {job.error}")
+                sink.record('item', item=ctx['item_id'], stage='failed', error=job.error, durations=durations)
+                if ctx['item_key']:
+                    manifest.mark_failed(ctx['item_key'], job.error)
+                return
+            self.batch_log(f"  └─ 成功: {os.path.basename(job.save_path)} ({image_encoder.format_bytes(job.encoded_bytes)})")
+            sink.record('item', item=ctx['item_id'], stage='done', output=job.save_path,
+                        bytes=job.encoded_bytes, durations=durations)
+            encoded_bytes += job.encoded_bytes
+            success_count += 1
+            self.current_session_processed += 1
+            if ctx['item_key']:
+                manifest.mark_done(ctx['item_key'], job.save_path)
+            if ctx['cache_key']:
+                render_cache.store(ctx['cache_key'], os.path.splitext(job.save_path)[1], job.save_path)
+            if stop_requested:
+                return
+            # [AUTH] 扣除使用次数
+            allowed, msg = auth.increment_usage(1)
+            if not allowed:
+                self.batch_log(f"  [STOP] {msg}")
+                messagebox.showwarning("限制提示", msg)
+                stop_requested = True
+                pipeline.cancel()
+        
+        def drain():
+            for job in pipeline.results():
+                finish(job)
+        
+        text_sequence = text_source.sequence_cursor()
+        for idx, item in enumerate(images_to_process):
+            if stop_requested:
+                break
+            processed_count = idx + 1
+            img_path = item.path if item else None
             if img_path:
                 filename = os.path.basename(img_path)
             else:
                 filename = f"text_{idx+1:04d}.png"
-                
-            self.batch_log(f"[{idx+1}/{len(images_to_process)}] 处理: {filename}")
-            self.update() # 刷新UI
             
+            # [MIRROR] 子目录中的图片输出到同名子目录
+            item_output_dir = output_dir
+            if item and item.rel_dir and self.batch_mirror_folders.get():
+                item_output_dir = os.path.join(output_dir, item.rel_dir)
+                os.makedirs(item_output_dir, exist_ok=True)
+            
+            # 本项日志先缓存，完成时整段输出，避免并行时各项日志交错
+            item_logs = [f"[{idx+1}/{total_label}] 处理: {os.path.join(item.rel_dir, filename) if item else filename}"]
+            item_log = item_logs.append
+            
+            item_id = img_path if img_path else f"text:{idx+1:04d}"
+            item_key = None
+            cache_key = None
             try:
-                # 1. 加载图片 (如果有)
-                processor = ImageProcessor()
-                if img_path:
-                    processor.load_image(img_path)
-                    processor.set_canvas_size(preset_width, preset_height)
-                    processor.resize_to_canvas(maintain_ratio=True)
-                
-                # 2. 准备边框配置 (支持随机化)
-                border_config = self.border_config.copy()
-                
-                if self.batch_random_color.get():
-                    new_color = self.get_random_color()
-                    border_config['color'] = new_color
-                    # 如果启用了图案且其颜色也是白色/默认，可能也需要随机？
-                    # 简单策略：如果随机颜色，且有图案，图案也用这个色？或者图案颜色保持？
-                    # 用户需求：Random Border Color. 
-                
-                if self.batch_random_style.get():
-                    border_config['line_style'] = self.get_random_line_style()
-                    
-                if self.batch_random_pattern.get():
-                    border_config['pattern'] = self.get_random_pattern()
-                    # 自动调整图案大小
-                    border_config['pattern_size'] = max(4, int(border_config['width'] * 0.6))
-                
-                
-                # [SCALE FIX] 提前计算分辨率缩放比例
-                # 所有的视觉元素（背景图案、边框宽度、文字大小）都需要基于预览比例进行缩放
-                display_width = self.canvas_widget.width
-                preview_scale = 1.0
-                if display_width > 0:
-                    preview_scale = preset_width / display_width
-
-                # [RANDOM BACKGROUND] 随机背景样式
-                current_bg_color = self.background_color
-                current_bg_pattern = self.background_pattern
-                current_bg_pattern_color = self.background_pattern_color
-                current_bg_pattern_size = self.background_pattern_size
-                
-                if self.batch_random_background_style.get():
-                    import random
-                    from constants import MACARON_COLORS, BORDER_PATTERNS
-                    
-                    # 1. 随机背景颜色 (选择柔和的马卡龙色系，保证和深色文字有对比度)
-                    current_bg_color = random.choice(MACARON_COLORS)
-                    
-                    # 2. 随机背景图案
-                    pattern_ids = [p['id'] for p in BORDER_PATTERNS]
-                    current_bg_pattern = random.choice(pattern_ids)
-                    
-                    # 3. 图案颜色：比背景色稍深/浅，增加层次感
-                    try:
-                        bg_rgb = tuple(int(current_bg_color.lstrip('#')[i:i+2], 16) for i in (0,2,4))
-                        # 调暗背景色作为图案色 (乘以 0.7)
-                        pattern_rgb = tuple(max(0, int(c * 0.7)) for c in bg_rgb)
-                        current_bg_pattern_color = '#{:02X}{:02X}{:02X}'.format(*pattern_rgb)
-                    except:
-                        current_bg_pattern_color = '#CCCCCC'
-                    
-                    # 4. 随机图案大小
-                    current_bg_pattern_size = random.randint(8, 20)
-
-                # 3. 生成复合图片 (背景)
-                composite = CompositeImage(
-                    preset_width,
-                    preset_height,
-                    bg_color=current_bg_color
-                )
-                
-                # 绘制背景图案 (应用缩放)
-                scaled_pattern_size = int(current_bg_pattern_size * preview_scale)
-                composite.draw_background_pattern(
-                    current_bg_pattern,
-                    current_bg_pattern_color,
-                    scaled_pattern_size
-                )
-                
-                # [LOGGING] 记录参考参数
-                log_details = []
-                
-                # 4. 添加主图片
-                # 4. 添加主图片 (仅在有图片时)
-                if img_path:
-                    if self.batch_match_canvas.get():
-                        # 获取示例图的相对几何信息
-                        geom = self.canvas_widget.get_main_image_geometry()
-                        if geom:
-                            rel_x, rel_y, rel_w, rel_h = geom
-                            # 计算当前预设下的目标区域
-                            target_x = rel_x * preset_width
-                            target_y = rel_y * preset_height
-                            target_w = rel_w * preset_width
-                            target_h = rel_h * preset_height
-                            
-                            # [ENHANCED] 计算比例与缩放
-                            cur_img = processor.get_current_image()
-                            img_ratio = cur_img.width / cur_img.height if cur_img.height > 0 else 1.0
-                            box_ratio = target_w / target_h if target_h > 0 else 1.0
-                            
-                            # 估算相对画布的缩放比例 (以宽为例)
-                            # 假设原始 fit 是 contain 满画布
-                            default_fit_w = preset_width if img_ratio > (preset_width/preset_height) else (preset_height * img_ratio)
-                            scale_factor = target_w / default_fit_w if default_fit_w > 0 else 1.0
-                            
-                            # [SMART ALIGN] 智能对齐判断
-                            # 如果参考位置非常靠上 (比如前 5%)，则判定为顶部对齐
-                            # 如果参考位置非常靠下 (底部 5%)，则判定为底部对齐
-                            anchor = 'center'
-                            if rel_y < 0.05:
-                                anchor = 'n'
-                            elif (rel_y + rel_h) > 0.95:
-                                anchor = 's'
-                                
-                            # 如果高度非常接近 (Full Height)，对齐方式影响不大，但保持 Default
-                            
-                            composite.add_main_image_with_geometry(
-                                cur_img, 
-                                target_x, target_y, target_w, target_h,
-                                anchor=anchor
-                            )
-                            
-                            anchor_map = {'n': '顶部', 's': '底部', 'center': '居中'}
-                            log_details.append(f"参考位置: {rel_x:.2f},{rel_y:.2f} 尺寸: {rel_w:.2f}x{rel_h:.2f} => 目标: {int(target_x)},{int(target_y)} {int(target_w)}x{int(target_h)}")
-                            log_details.append(f"比例检查: 图片{img_ratio:.2f} vs 目标框{box_ratio:.2f} | 缩放倍率: {scale_factor:.2f}x | 对齐: {anchor_map.get(anchor)}")
-                        else:
-                            # 获取失败回退到默认
-                            composite.add_main_image(processor.get_current_image(), fit_mode='contain')
-                            log_details.append("参考位置获取失败，已回退到默认")
-                    else:
-                        composite.add_main_image(processor.get_current_image(), fit_mode='contain')
-                        log_details.append("位置模式: 默认(适应画布)")
-                else:
-                    log_details.append("模式: 纯背景/文字 (无源图片)")
-                
-                # 记录边框随机化结果
-                if self.batch_random_color.get():
-                    log_details.append(f"随机颜色: {border_config.get('color')}")
-                if self.batch_random_style.get():
-                    log_details.append(f"随机样式: {border_config.get('line_style')}")
-                if self.batch_random_pattern.get():
-                    log_details.append(f"随机图案: {border_config.get('pattern')}")
-                
-                # 打印日志
-                if log_details:
-                    self.batch_log(f"  参数: {'; '.join(log_details)}")
-
-                # 5. 应用边框到复合图片
-                
-                # 复制配置并应用缩放
-                scaled_border_config = border_config.copy()
-                if preview_scale != 1.0:
-                    scaled_border_config['width'] = int(border_config.get('width', 0) * preview_scale)
-                    scaled_border_config['radius'] = int(border_config.get('radius', 0) * preview_scale)
-                    
-                    # 只有在 random pattern 未覆盖时才缩放，或者统一缩放
-                    # 如果 random pattern 已经被设置为 width * 0.6，那 width 已经是原始的了，这里应该缩放
-                    # 但如果在 random 块里是用原始 width 计算的 size，那这里也要缩放 size
-                    scaled_border_config['pattern_size'] = int(border_config.get('pattern_size', 0) * preview_scale)
-                    
-                # 根据形状判断调用哪个方法
-                if scaled_border_config.get('shape') in ('rounded_rect', 'circle', 'ellipse') or scaled_border_config.get('radius', 0) > 0:
-                    composite.add_rounded_border(scaled_border_config)
-                else:
-                    composite.add_border(scaled_border_config)
-                
-                # 添加贴纸 (需要在新尺寸下重新计算坐标)
-                display_width = self.canvas_widget.width
-                display_height = self.canvas_widget.height
-                # 避免除以零
-                if display_width > 0 and display_height > 0:
-                    scale = max(preset_width / display_width, preset_height / display_height)
-                else:
-                    scale = 1.0
-                
-                for sticker in self.canvas_widget.get_stickers():
-                    # 计算缩放后的位置和大小
-                    scaled_x = int(sticker['x'] * scale)
-                    scaled_y = int(sticker['y'] * scale)
-                    scaled_size = int(sticker['size'] * scale)
-                    
-                    # 使用跨平台的 emoji 渲染（已在 CompositeImage.add_sticker 中实现）
-                    composite.add_sticker(sticker['text'], scaled_x, scaled_y, scaled_size)
-                
-                # 6. 添加文字层
-                text_content = None
-                
-                # 获取当前编辑器中的文字内容作为基础/兜底
-                editor_content = None
-                if hasattr(self, 'current_text_layer') and self.current_text_layer:
-                    editor_content = self.current_text_layer.content
-
+                # 1. 确定本项配文
                 # 只要勾选了"批量文字" (batch_use_text_dir)，就尝试添加文字
-                # 逻辑：Excel映射 -> Excel顺序 -> .txt 文件 -> default.txt -> 编辑器文字
+                # 逻辑：Excel映射 -> Excel顺序 -> 编辑器文字
+                text_content = None
                 if self.batch_use_text_dir.get():
-                    
-                    # 1. 尝试 Excel/列表 映射
                     if text_mapping and filename in text_mapping:
                         text_content = text_mapping[filename]
-                        self.batch_log(f"  文字: Excel 匹配 ({filename})")
-                    elif text_sequence and idx < len(text_sequence):
-                        text_content = text_sequence[idx]
-                        self.batch_log(f"  文字: Excel 顺序 (第{idx+1}行)")
-                    
-                    # 2. 尝试从文件读取 (目录模式 - 已移除)
-                    # elif self.batch_text_dir and os.path.isdir(self.batch_text_dir):
-                    #    pass
+                        item_log(f"  文字: Excel 匹配 ({filename})")
+                    elif idx < sequence_count:
+                        text_content = text_sequence.get(idx)
+                        item_log(f"  文字: Excel 顺序 (第{idx+1}行)")
                     
-                    # 3. Fallback: 使用编辑器文字
+                    # Fallback: 使用编辑器文字
                     if not text_content and editor_content:
                         text_content = editor_content
-                        self.batch_log(f"  文字: 使用编辑器配置")
+                        item_log(f"  文字: 使用编辑器配置")
                 
-                # 应用文字层
-                if text_content:
-                    from image_processor import TextLayer
-                    text_layer = None
-                    
-                    # 优先克隆当前图层 (保证样式完全一致)
-                    if hasattr(self, 'current_text_layer') and self.current_text_layer:
-                        # 使用 to_dict/from_dict 克隆
-                        layer_data = self.current_text_layer.to_dict()
-                        # 更新内容
-                        layer_data['content'] = text_content
-                        text_layer = TextLayer.from_dict(layer_data)
+                if manifest or use_cache:
+                    # 本项的配文也计入参数哈希
+                    if img_path:
+                        content_hash = manifest.content_hash(img_path, item.stat()) if manifest else batch_manifest.file_hash(img_path)
                     else:
-                        # Fallback: 使用 Config 创建 (可能样式不全)
-                        cfg = self.current_text_config
-                        text_layer = TextLayer(
-                            content=text_content,
-                            font_size=cfg.get('font_size', 48),
-                            color=cfg.get('color', '#FFFFFF'),
-                            font_family=cfg.get('font_family', 'yuanti'),
-                            align=cfg.get('align', 'center'),
-                            position=cfg.get('position', 'bottom'),
-                            margin=cfg.get('margin', 20),
-                            shadow=cfg.get('shadow'),
-                            stroke=cfg.get('stroke'),
-                            highlight=cfg.get('highlight'),
-                            bold=cfg.get('bold', False),
-                            italic=cfg.get('italic', False),
-                            underline=cfg.get('underline', False),
-                            indent=cfg.get('indent', False)
-                        )
-
-                    # [RANDOM FONT] 随机字体样式
-                    if self.batch_random_font_style.get():
-                        import random
-                        # 使用与 UI 下拉框一致的字体列表 (keys: pingfang, heiti, etc.)
-                        valid_fonts = list(text_layer.FONT_NAMES.keys())
-                        text_layer.font_family = random.choice(valid_fonts)
-                        text_layer.bold = random.choice([True, False])
-                        text_layer.italic = random.choice([True, False])
-                        # [RANDOM COLOR] 随机字体颜色
-                        # [RANDOM COLOR] 智能对比度配色
-                        from constants import MACARON_COLORS, DOPAMINE_COLORS
-                        all_colors = MACARON_COLORS + DOPAMINE_COLORS
-                        
-                        # 1. 计算背景亮度
-                        bg_brightness = 255 # 默认白背景
-                        try:
-                            # 尝试从 composite canvas 获取平均亮度 (简单采样)
-                            if composite and composite.canvas:
-                                # 缩略图采样
-                                thumb = composite.canvas.resize((50, 50))
-                                if thumb.mode != 'RGB':
-                                    thumb = thumb.convert('RGB')
-                                from PIL import ImageStat
-                                stat = ImageStat.Stat(thumb)
-                                r, g, b = stat.mean
-                                bg_brightness = (r * 299 + g * 587 + b * 114) / 1000
-                        except Exception as e:
-                            print(f"[DEBUG] Calc bg brightness failed: {e}")
-                            
-                        # 2. 根据背景亮度筛选文字颜色
-                        candidates = []
-                        if bg_brightness < 100: # 深色背景
-                            # 强制选亮色文字 (>150)
-                            for c in all_colors:
-                                try:
-                                    crgb = tuple(int(c.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-                                    cb = (crgb[0] * 299 + crgb[1] * 587 + crgb[2] * 114) / 1000
-                                    if cb > 150: candidates.append(c)
-                                except: pass
-                            if not candidates: candidates = ['#FFFFFF'] # Fallback
-                        elif bg_brightness > 180: # 浅色背景
-                             # 倾向选深色文字 (<120)
-                             for c in all_colors:
-                                try:
-                                    crgb = tuple(int(c.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-                                    cb = (crgb[0] * 299 + crgb[1] * 587 + crgb[2] * 114) / 1000
-                                    if cb < 120: candidates.append(c)
-                                except: pass
-                             # 如果没找到足够深的颜色，就随便选一个，但后面强制开描边
-                             if not candidates: candidates = all_colors
-                        else:
-                            # 中性背景，什么颜色都行，靠描边补救
-                            candidates = all_colors
-                            
-                        text_layer.color = random.choice(candidates)
-                        
-                        # 3. [RANDOM STROKE] 智能描边 (确保最终对比度)
-                        if text_layer.stroke and text_layer.stroke.get('enabled'):
-                             # 计算选中文字颜色的亮度
-                            try:
-                                c = str(text_layer.color).lstrip('#')
-                                if len(c) == 6:
-                                    rgb = tuple(int(c[i:i+2], 16) for i in (0, 2, 4))
-                                    txt_brightness = (rgb[0] * 299 + rgb[1] * 587 + rgb[2] * 114) / 1000
-                                else:
-                                    txt_brightness = 200
-                            except:
-                                txt_brightness = 200
-                            
-                            # 策略:
-                            # 如果背景亮 -> 需要深色元素 (文字深 或 描边深)
-                            # 如果背景暗 -> 需要亮色元素 (文字亮 或 描边亮)
-                            
-                            final_stroke_color = '#000000'
-                            
-                            if bg_brightness > 150: # 浅色背景
-                                if txt_brightness > 150: # 文字也亮 (对比度差)
-                                    # 强制深色描边
-                                    dark_strokes = ['#000000', '#333333', '#1A1A1A', '#2F4F4F', '#8B4513', '#800000', '#191970', '#006400']
-                                    final_stroke_color = random.choice(dark_strokes)
-                                else:
-                                    # 文字深，背景亮 -> 描边可以使用浅色(形成光晕)或对比色，这里选安全的白色或浅色
-                                    light_strokes = ['#FFFFFF', '#F0F8FF', '#F5F5F5']
-                                    final_stroke_color = random.choice(light_strokes)
-                            
-                            elif bg_brightness < 100: # 深色背景
-                                if txt_brightness < 100: # 文字也暗
-                                    # 强制亮色描边
-                                    light_strokes = ['#FFFFFF', '#F0F8FF', '#F5F5F5', '#FFFACD', '#E0FFFF', '#FFC0CB', '#98FB98']
-                                    final_stroke_color = random.choice(light_strokes)
-                                else:
-                                    # 文字亮，背景暗 -> 描边可以用深色增加点缀
-                                    dark_strokes = ['#000000', '#333333'] 
-                                    final_stroke_color = random.choice(dark_strokes)
-                            
-                            else: # 中性背景
-                                # 对比文字亮度即可
-                                if txt_brightness > 128:
-                                    final_stroke_color = '#333333'
-                                else:
-                                    final_stroke_color = '#FFFFFF'
-                                    
-                            text_layer.stroke['color'] = final_stroke_color
-                            
-                            # 确保描边宽度可见
-                            if text_layer.stroke.get('width', 0) < 3:
-                                text_layer.stroke['width'] = 4
-                        
-                    # [RANDOM HIGHLIGHT] 随机文字高亮 (配合 NLP)
-                    if self.batch_random_highlight.get():
-                         # 使用 'random' 字符串，让 image_processor 内部为每个关键词随机分配颜色 (彩虹效果)
-                         random_hl_color = 'random'
-                         
-                         # 1. 确保 highlight 结构存在
-                         if not text_layer.highlight or isinstance(text_layer.highlight, bool):
-                             text_layer.highlight = {'enabled': True, 'keywords': [], 'color': random_hl_color}
-                         else:
-                             text_layer.highlight['enabled'] = True
-                             text_layer.highlight['color'] = random_hl_color
-                         
-                             text_layer.highlight['enabled'] = True
-                             text_layer.highlight['color'] = random_hl_color
-                         
-                         # [NLP] always try NLP first
-                         try:
-                             import jieba.analyse
-                             curr_text = text_layer.content
-                             # 提取 Top 5
-                             extracted = jieba.analyse.extract_tags(curr_text, topK=5)
-                             if extracted:
-                                 text_layer.highlight['keywords'] = extracted
-                                 log_details.append(f"NLP关键词: {extracted}")
-                         except ImportError:
-                             pass
-                         except Exception as e:
-                             print(f"Jieba failed: {e}")
-                         
-                         current_keywords = text_layer.highlight.get('keywords', [])
-                         if not current_keywords:
-                             # 简单的正则: 提取长度 >= 2 的词 (中文或单词)
-                             import re
-                             # 匹配中文或英文单词
-                             words = re.findall(r'[\u4e00-\u9fa5]{2,}|[a-zA-Z]{4,}', text_content)
-                             if words:
-                                 # 随机选几个
-                                 import random
-                                 count = min(3, len(words))
-                                 fallback_keywords = random.sample(words, count)
-                                 text_layer.highlight['keywords'] = fallback_keywords
-                                 log_details.append(f"正则兜底: {fallback_keywords}")
-                         
-                         log_details.append(f"随机高亮: {random_hl_color}")
-                        
-                    # 计算有效边框宽度 (用于文字防遮挡)
-                    # [FIX] 使用 scaled_border_config 而非 border_config，确保边框宽度已缩放
-                    effective_border_width = 0
-                    if composite and composite.width and scaled_border_config and scaled_border_config.get('id') != 'none':
-                         effective_border_width = scaled_border_config.get('width', 0)
-                         # [FIX] Dynamic safety margin based on aspect ratio
-                         if preset_width > preset_height:
-                            effective_border_width += int(60 * preview_scale)
-                         else:
-                            effective_border_width += int(10 * preview_scale)
-
-                    # [FIX] 使用 scale=1.0，因为 text_layer.font_size 已经是适配预设尺寸的数值
-                    # 之前的 preview_scale 会导致字号被错误放大
-                    composite.add_text_layer(text_layer, scale=1.0, border_width=effective_border_width)
+                        content_hash = batch_manifest.text_hash(text_content)
+                    item_spec_hash = batch_manifest.spec_hash(base_spec, text_content)
+                
+                if manifest:
+                    item_key = item_id
+                    if self.batch_skip_unchanged.get():
+                        done_path = manifest.lookup_done(item_key, content_hash, item_spec_hash)
+                        if done_path:
+                            item_log(f"  └─ 跳过: 未变化 ({os.path.basename(done_path)})")
+                            for line in item_logs:
+                                self.batch_log(line)
+                            sink.record('item', item=item_id, stage='skipped', output=done_path)
+                            skipped_count += 1
+                            success_count += 1
+                            continue
+                    manifest.mark_running(item_key, content_hash, item_spec_hash, item.stat() if item else None)
                 
-                # 7. 保存
-                # [UNIQUE] 生成唯一文件名 (时间戳 + 随机数)防止覆盖
-                import time
-                import random
-                from datetime import datetime
-                name, ext = os.path.splitext(filename)
-                # 格式: 原文件名_年月日时分秒毫秒
-                time_str = datetime.now().strftime('%Y%m%d%H%M%S%f')[:-3]
-                unique_filename = f"{name}_{time_str}{ext}"
+                # [UNIQUE] 生成唯一文件名防止覆盖 (扩展名随输出格式，"自动"格式保存时才确定)
+                out_ext = image_encoder.output_extension(base_spec['output_format'], os.path.splitext(filename)[1])
+                save_path = os.path.join(item_output_dir, unique_output_name(filename))
+                if out_ext:
+                    save_path = os.path.splitext(save_path)[0] + out_ext
                 
-                save_path = os.path.join(output_dir, unique_filename)
-                if composite.save(save_path):
-                    self.batch_log(f"  └─ 成功: {unique_filename}")
-                    success_count += 1
-                    self.current_session_processed += 1
-                    
-                    # [AUTH] 扣除使用次数
-                    # [AUTH] 扣除使用次数
-                    allowed, msg = auth.increment_usage(1)
-                    if not allowed:
-                        self.batch_log(f"  [STOP] {msg}")
-                        messagebox.showwarning("限制提示", msg)
-                        break
-                else:
-                    self.batch_log(f"  └─ 失败: 保存出错")
+                # [CACHE] 渲染缓存命中时直接放入输出目录，不解码、不合成
+                if use_cache:
+                    cache_key = render_cache.make_key(content_hash, item_spec_hash, out_ext or '.auto')
+                    cached_path = None
+                    # 自动格式的缓存项扩展名取决于当时选中的格式，逐个尝试
+                    for ext in ([out_ext] if out_ext else image_encoder.AUTO_EXTENSIONS):
+                        candidate = os.path.splitext(save_path)[0] + ext
+                        if render_cache.fetch(cache_key, ext, candidate):
+                            cached_path = candidate
+                            break
+                    if cached_path:
+                        save_path = cached_path
+                        cached_bytes = os.path.getsize(save_path)
+                        encoded_bytes += cached_bytes
+                        item_log(f"  └─ 成功 (缓存): {os.path.basename(save_path)} ({image_encoder.format_bytes(cached_bytes)})")
+                        for line in item_logs:
+                            self.batch_log(line)
+                        sink.record('item', item=item_id, stage='cached', output=save_path, bytes=cached_bytes)
+                        success_count += 1
+                        cached_count += 1
+                        self.current_session_processed += 1
+                        if item_key:
+                            manifest.mark_done(item_key, save_path)
+                        allowed, msg = auth.increment_usage(1)
+                        if not allowed:
+                            self.batch_log(f"  [STOP] {msg}")
+                            messagebox.showwarning("限制提示", msg)
+                            break
+                        continue
+                
+                # 2-7. 解码、背景、主图、边框、贴纸、文字层、保存 (流水线中完成)
+                job = PipelineJob(img_path, text_content, save_path,
+                                  context={'item_id': item_id, 'item_key': item_key, 'cache_key': cache_key},
+                                  logs=item_logs)
+                while not pipeline.submit(job, timeout=0.05):
+                    # 队列已满：先处理已完成的项，保持界面响应
+                    drain()
+                    pump()
+                drain()
+                pump() # 刷新UI
             
             except Exception as e:
+                for line in item_logs:
+                    self.batch_log(line)
                 self.batch_log(f"  └─ 错误: {str(e)}")
+                sink.record('item', item=item_id, stage='failed', error=str(e))
+                if item_key:
+                    manifest.mark_failed(item_key, e)
                 import traceback
                 traceback.print_exc()
         
+        # 等待流水线中剩余的项完成
+        pipeline.close()
+        while pipeline.pending():
+            job = pipeline.wait_result(timeout=0.05)
+            if job:
+                finish(job)
+            pump()
+        pipeline.shutdown()
+        text_sequence.close()
+        keyword_service.release_batch()
+        diag_reports = diag_session.stop()
+        
+        if manifest:
+            manifest.close()
+        
+        stage_stats = None
+        if stage_timing:
+            stage_timer.disable()
+            stage_stats = stage_timer.summary()
+        
         self.batch_log(f"═══ 处理完成 ═══")
-        self.batch_log(f"成功: {success_count} / {len(images_to_process)}")
+        self.batch_log(f"成功: {success_count} / {processed_count}")
+        if skipped_count:
+            self.batch_log(f"其中跳过未变化: {skipped_count}")
+        if cached_count:
+            self.batch_log(f"其中渲染缓存命中: {cached_count}")
+        if encoded_bytes:
+            written = success_count - skipped_count
+            self.batch_log(f"输出大小: {image_encoder.format_bytes(encoded_bytes)} (平均 {image_encoder.format_bytes(encoded_bytes // max(1, written))}/张)")
+        if stage_stats:
+            self.batch_log("各阶段耗时 (ms):")
+            for line in stage_timer.format_summary(stage_stats):
+                self.batch_log(f"  {line}")
+            sink.record('timing', stages=stage_stats)
+            try:
+                timing_path = stage_timer.export_json(os.path.join(output_dir, stage_timer.TIMING_FILENAME), stage_stats)
+                self.batch_log(f"耗时统计: {timing_path}")
+            except Exception as e:
+                print(f"[ERROR] 导出耗时统计失败: {e}")
+        for path in diag_reports:
+            self.batch_log(f"诊断报告: {path}")
+        if sink.log_path:
+            self.batch_log(f"完整日志: {sink.log_path}")
+        sink.record('end', processed=processed_count, success=success_count, skipped=skipped_count,
+                    cached=cached_count, bytes=encoded_bytes, elapsed=round(time.perf_counter() - started_at, 3))
+        sink.close_file()
+        sink.flush()
         self.update_batch_status_text()
-        if messagebox.askyesno('完成', f'批量处理完成！\n成功: {success_count}\n失败: {len(images_to_process) - success_count}\n\n是否打开所在目录？'):
+        if messagebox.askyesno('完成', f'批量处理完成！\n成功: {success_count}\n失败: {processed_count - success_count}\n\n是否打开所在目录？'):
             self.open_directory(output_dir)
 
     def save_history(self, action_name="操作"):
@@ -4779,7 +4960,7 @@ class MainWindow(tk.Tk):
                     for item in items:
                         self.canvas_widget.canvas.itemconfigure(item, state=new_state)
             except Exception as e:
-                print(f"[DEBUG] Toggle background pattern error: {e}")
+                log.debug("Toggle background pattern error: %s", e)
             
         # 刷新列表显示状态
         self.update_layer_list()
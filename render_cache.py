@@ -0,0 +1,150 @@
+"""
+渲染结果缓存模块 - 按 (输入内容, 任务参数, 渲染器版本) 缓存编码后的输出文件
+"""
+
+import os
+import shutil
+import hashlib
+import threading
+
+from app_log import log
+
+# 渲染器版本：渲染结果发生变化 (合成逻辑、字体、编码参数) 时递增，使旧缓存失效
+RENDERER_VERSION = 3
+
+# 默认缓存目录和容量上限
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'renders')
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+def image_hash(image):
+    """内存中图片的内容哈希 (导出当前编辑的图片时使用)"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{image.mode}:{image.size}".encode('utf-8'))
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class RenderCache:
+    """内容寻址的渲染结果缓存
+
+    - 命中时复制到输出目录 (不用硬链接：之后原地修改输出文件会连带改掉缓存)
+    - 写入缓存时复制输出文件，缓存文件不与输出共享 inode
+    - 超出容量上限时按最近使用时间 (文件 mtime) 淘汰
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None  # 路径 -> [最近使用时间, 大小]，首次使用时扫描目录
+        self._total = 0
+
+    def make_key(self, content_hash, spec_hash, ext):
+        """缓存键：输入内容哈希 + 参数哈希 + 渲染器版本 + 输出格式"""
+        payload = f"{RENDERER_VERSION}|{content_hash}|{spec_hash}|{ext.lower()}"
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+    def _entry_path(self, key, ext):
+        return os.path.join(self.cache_dir, key[:2], key + ext.lower())
+
+    def _load_index(self):
+        """扫描缓存目录建立索引 (调用方持有锁)"""
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total = 0
+        if not os.path.isdir(self.cache_dir):
+            return
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.is_file():
+                    stat = entry.stat()
+                    self._index[entry.path] = [stat.st_mtime, stat.st_size]
+                    self._total += stat.st_size
+
+    def fetch(self, key, ext, dest_path):
+        """缓存命中时将结果放到 dest_path
+
+        Returns:
+            bool: 是否命中
+        """
+        entry_path = self._entry_path(key, ext)
+        with self._lock:
+            self._load_index()
+            if entry_path not in self._index:
+                return False
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                stat = None
+            if stat is None or stat.st_nlink > 1:
+                # 已删除，或是旧版本硬链接到输出目录的条目 (可能已被连带修改)，不再使用
+                self._drop(entry_path)
+                return False
+            try:
+                if os.path.exists(dest_path):
+                    os.remove(dest_path)
+                shutil.copyfile(entry_path, dest_path)
+                # 更新最近使用时间
+                os.utime(entry_path, None)
+                self._index[entry_path][0] = os.stat(entry_path).st_mtime
+                return True
+            except OSError as e:
+                log.debug("渲染缓存读取失败: %s", e)
+                return False
+
+    def _drop(self, entry_path):
+        """删除缓存条目 (调用方持有锁)"""
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+        self._total -= self._index.pop(entry_path)[1]
+
+    def store(self, key, ext, src_path):
+        """把已保存的输出文件写入缓存，必要时淘汰旧条目"""
+        entry_path = self._entry_path(key, ext)
+        with self._lock:
+            self._load_index()
+            try:
+                os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+                tmp_path = entry_path + '.tmp'
+                shutil.copyfile(src_path, tmp_path)
+                os.replace(tmp_path, entry_path)
+                stat = os.stat(entry_path)
+            except OSError as e:
+                log.debug("渲染缓存写入失败: %s", e)
+                return False
+            old = self._index.get(entry_path)
+            if old:
+                self._total -= old[1]
+            self._index[entry_path] = [stat.st_mtime, stat.st_size]
+            self._total += stat.st_size
+            self._evict()
+            return True
+
+    def _evict(self):
+        """按最近使用时间淘汰，直到总大小不超过上限 (调用方持有锁)"""
+        if self._total <= self.max_bytes:
+            return
+        for path, (_, size) in sorted(self._index.items(), key=lambda item: item[1][0]):
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            del self._index[path]
+            self._total -= size
+
+    def total_bytes(self):
+        with self._lock:
+            self._load_index()
+            return self._total
+
+
+# 单例
+render_cache = RenderCache()
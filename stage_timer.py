@@ -0,0 +1,148 @@
+"""
+阶段计时模块 - 统计批量处理中每个渲染阶段的耗时 (次数 / 总计 / p50 / p95 / 最大)
+
+未启用时不做任何包装，被计时的方法保持原样，没有额外开销；
+enable() 时才用计时包装替换 ImageProcessor / CompositeImage / TextLayer / LayerCompositor 的对应方法，
+disable() 时还原。
+
+替换的是类上的方法，对所有线程同时生效：监视模式等其他线程正在渲染时启用，
+这些线程之后的调用也会被计入 (已在执行中的调用不受影响)。enable() / disable() 用锁串行，
+不会重复包装或漏还原；替换单个类属性是原子的，其他线程只会调用到原方法或包装后的方法。
+
+同一阶段嵌套调用 (如 add_main_image_with_geometry 内部调用 add_main_image，
+load_image_from_bytes 与 load_image 同属 decode) 只计最外层一次，各阶段合计不会超过实际耗时。
+"""
+
+import json
+import time
+import functools
+import threading
+
+TIMING_FILENAME = '.batch_timing.json'
+
+_samples = {}   # 阶段 -> [耗时 (秒)]
+_lock = threading.Lock()
+_patched = []   # (类, 方法名, 原方法)
+_patch_lock = threading.Lock()
+_active = threading.local()  # 每个线程正在计时的阶段 (嵌套调用只计最外层)
+
+
+def _targets():
+    """(阶段名, 类, 方法名)"""
+    from image_processor import ImageProcessor, CompositeImage, TextLayer
+    from compositor import LayerCompositor
+    from batch_renderer import BatchRenderer
+    return [
+        ('decode', ImageProcessor, 'load_image'),
+        ('decode', ImageProcessor, 'load_image_from_bytes'),
+        ('resize_to_canvas', ImageProcessor, 'resize_to_canvas'),
+        ('draw_background_pattern', CompositeImage, 'draw_background_pattern'),
+        ('add_main_image', CompositeImage, 'add_main_image'),
+        ('add_main_image', CompositeImage, 'add_main_image_with_geometry'),
+        ('add_main_image', BatchRenderer, '_main_layer'),
+        ('add_border', CompositeImage, 'add_border'),
+        ('add_rounded_border', CompositeImage, 'add_rounded_border'),
+        ('add_sticker', CompositeImage, 'add_sticker'),
+        ('text_render', TextLayer, 'render'),
+        ('compose', LayerCompositor, 'compose'),
+        ('save', CompositeImage, 'save'),
+    ]
+
+
+def _wrap(stage, func):
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        stages = getattr(_active, 'stages', None)
+        if stages is None:
+            stages = _active.stages = set()
+        if stage in stages:
+            return func(*args, **kwargs)
+        stages.add(stage)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            add(stage, time.perf_counter() - start)
+            stages.discard(stage)
+    return timed
+
+
+def is_enabled():
+    return bool(_patched)
+
+
+def enable():
+    """开始计时 (替换被计时的方法，对所有线程生效)"""
+    with _patch_lock:
+        if _patched:
+            return
+        for stage, owner, name in _targets():
+            original = owner.__dict__.get(name)
+            if original is None:
+                continue
+            _patched.append((owner, name, original))
+            setattr(owner, name, _wrap(stage, original))
+
+
+def disable():
+    """停止计时 (还原被计时的方法，对所有线程生效)"""
+    with _patch_lock:
+        while _patched:
+            owner, name, original = _patched.pop()
+            setattr(owner, name, original)
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+
+
+def add(stage, seconds):
+    """记录一次耗时 (也可用于流水线的 read / composite / encode 等阶段)"""
+    with _lock:
+        _samples.setdefault(stage, []).append(seconds)
+
+
+def _percentile(sorted_values, pct):
+    """最近秩百分位"""
+    index = max(0, -(-len(sorted_values) * pct // 100) - 1)
+    return sorted_values[int(index)]
+
+
+def summary():
+    """各阶段统计 (毫秒)
+
+    Returns:
+        {阶段: {'count', 'total_ms', 'p50_ms', 'p95_ms', 'max_ms'}}，按总耗时从高到低
+    """
+    with _lock:
+        snapshot = {stage: sorted(values) for stage, values in _samples.items() if values}
+    stats = {}
+    for stage, values in sorted(snapshot.items(), key=lambda kv: -sum(kv[1])):
+        stats[stage] = {
+            'count': len(values),
+            'total_ms': round(sum(values) * 1000, 2),
+            'p50_ms': round(_percentile(values, 50) * 1000, 2),
+            'p95_ms': round(_percentile(values, 95) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2),
+        }
+    return stats
+
+
+def format_summary(stats=None):
+    """统计结果 -> 日志行"""
+    stats = stats if stats is not None else summary()
+    lines = [f"{'阶段':<24}{'次数':>6}{'总计ms':>10}{'p50':>8}{'p95':>8}{'最大':>8}"]
+    for stage, s in stats.items():
+        lines.append(f"{stage:<24}{s['count']:>6}{s['total_ms']:>10.0f}"
+                     f"{s['p50_ms']:>8.1f}{s['p95_ms']:>8.1f}{s['max_ms']:>8.1f}")
+    return lines
+
+
+def export_json(path, stats=None):
+    """导出统计结果为 JSON"""
+    stats = stats if stats is not None else summary()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'stages': stats},
+                  f, ensure_ascii=False, indent=2)
+    return path
@@ -0,0 +1,271 @@
+"""
+批量配文数据源模块 - 流式读取文字映射 (Excel / CSV / JSONL)
+"""
+
+import os
+import csv
+import json
+from datetime import datetime
+from types import MappingProxyType
+
+# 支持的配文文件类型 (其余按 Excel 处理)
+CSV_EXTENSIONS = ('.csv', '.tsv')
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson')
+
+# JSONL 中可识别的字段名
+JSONL_FILENAME_KEYS = ('filename', 'file', 'image', '文件名')
+JSONL_TEXT_KEYS = ('text', 'content', 'caption', '内容')
+
+# 读取记录文件后缀 (与数据表放在同一目录，不再回写数据表本身)
+JOURNAL_SUFFIX = '.readlog.jsonl'
+
+# 顺序配文总字数不超过此值时在解析时一并保存 (之后的预提取、逐项读取不再解析文件)，
+# 超过时只记录条数，使用时从文件流式读取
+SEQUENCE_CACHE_CHARS = 8_000_000
+
+# 解析结果缓存: 只保留最近一个数据源 (path, mtime, size, TextSource)
+_source_cache = None
+
+
+def _cell_text(value):
+    """单元格值转字符串"""
+    return str(value).strip() if value is not None else ""
+
+
+def _is_header(col1, col2):
+    """检查是否是标题行 (简单的关键词检查)"""
+    return '文件名' in col1 or '内容' in col2 or 'Filename' in col1
+
+
+def _classify_row(col1, col2):
+    """解析一行数据
+
+    Returns:
+        (filename, content): 第一列像文件名时为映射模式，否则 filename 为 None (顺序模式)
+    """
+    if '.' in col1 and len(col1) > 3:
+        # A=Filename, B=Content
+        return col1, col2
+    # Sequence
+    return None, (col2 if col2 else col1)
+
+
+def iter_excel_rows(source_path):
+    """流式读取 Excel，逐行产出 (filename, text)
+
+    使用只读模式打开，不会把整个工作簿载入内存。
+    公式单元格读取 Excel 上次保存时的计算结果 (data_only)，而不是公式文本；
+    从未在 Excel 中保存过的公式 (如由脚本生成的表格) 没有计算结果，读出为空。
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(source_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        for row_idx, row in enumerate(ws.iter_rows(min_row=1, max_col=2, values_only=True)):
+            col1 = _cell_text(row[0]) if len(row) > 0 else ""
+            col2 = _cell_text(row[1]) if len(row) > 1 else ""
+
+            # 跳过空行
+            if not col1 and not col2:
+                continue
+            # 第一行可能是标题行
+            if row_idx == 0 and _is_header(col1, col2):
+                continue
+
+            filename, content = _classify_row(col1, col2)
+            if filename is not None:
+                yield filename, content
+            elif content:
+                yield None, content
+    finally:
+        wb.close()
+
+
+def iter_csv_rows(source_path):
+    """流式读取 CSV/TSV (前两列，与 Excel 模板规则一致)，逐行产出 (filename, text)"""
+    delimiter = '\t' if source_path.lower().endswith('.tsv') else ','
+    # utf-8-sig: 兼容 Excel 导出的带 BOM 的 CSV
+    with open(source_path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row_idx, row in enumerate(csv.reader(f, delimiter=delimiter)):
+            col1 = row[0].strip() if len(row) > 0 else ""
+            col2 = row[1].strip() if len(row) > 1 else ""
+
+            if not col1 and not col2:
+                continue
+            if row_idx == 0 and _is_header(col1, col2):
+                continue
+
+            filename, content = _classify_row(col1, col2)
+            if filename is not None:
+                yield filename, content
+            elif content:
+                yield None, content
+
+
+def iter_jsonl_rows(source_path):
+    """流式读取 JSONL，逐行产出 (filename, text)
+
+    每行可以是字符串 (顺序模式)，或对象 {"filename": "...", "text": "..."}；
+    对象没有文件名字段时按顺序模式处理。
+    """
+    with open(source_path, 'r', encoding='utf-8-sig') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                print(f"[WARN] 跳过无效 JSONL 行 {line_no}: {e}")
+                continue
+
+            if isinstance(item, str):
+                if item.strip():
+                    yield None, item.strip()
+                continue
+            if not isinstance(item, dict):
+                continue
+
+            filename = next((_cell_text(item[k]) for k in JSONL_FILENAME_KEYS if item.get(k)), "")
+            content = next((_cell_text(item[k]) for k in JSONL_TEXT_KEYS if item.get(k) is not None), "")
+            if filename:
+                yield filename, content
+            elif content:
+                yield None, content
+
+
+def iter_text_rows(source_path):
+    """根据文件类型流式读取配文，逐行产出 (filename, text)"""
+    ext = os.path.splitext(source_path)[1].lower()
+    if ext in CSV_EXTENSIONS:
+        return iter_csv_rows(source_path)
+    if ext in JSONL_EXTENSIONS:
+        return iter_jsonl_rows(source_path)
+    return iter_excel_rows(source_path)
+
+
+class TextSource:
+    """配文数据源
+
+    按文件名匹配的映射需要随机查找，解析后常驻内存 (只读视图，多处共用同一份缓存)；
+    顺序配文不多时解析时一并保存为元组，过大时只记录条数，使用时从文件流式读取。
+
+    Attributes:
+        mapping: 文件名 -> 文字 (只读)
+        sequence_count: 顺序配文条数
+    """
+
+    def __init__(self, path=None, mapping=None, sequence_count=0, sequence=None):
+        self.path = path
+        self.mapping = MappingProxyType(mapping or {})
+        self.sequence_count = sequence_count
+        self._sequence = sequence
+
+    def __bool__(self):
+        return bool(self.mapping) or self.sequence_count > 0
+
+    def iter_sequence(self):
+        """依次产出顺序配文 (已保存时不再读取文件)"""
+        if self._sequence is not None:
+            yield from self._sequence
+            return
+        if not self.path:
+            return
+        for filename, content in iter_text_rows(self.path):
+            if filename is None:
+                yield content
+
+    def sequence_cursor(self):
+        """按递增序号读取顺序配文的游标"""
+        return SequenceCursor(self.iter_sequence())
+
+
+class SequenceCursor:
+    """按递增序号读取顺序配文 (只向前读，读过的行不保留)"""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._index = -1
+        self._current = None
+
+    def get(self, index):
+        """第 index 条 (从 0 开始) 顺序配文，超出范围返回 None
+
+        Raises:
+            ValueError: index 小于上一次读取的序号
+        """
+        if index < self._index:
+            raise ValueError(f"顺序配文只能按递增序号读取 ({index} < {self._index})")
+        while self._index < index and self._rows is not None:
+            self._current = next(self._rows, None)
+            if self._current is None:
+                self._rows = None
+            self._index += 1
+        return self._current if self._index == index else None
+
+    def close(self):
+        """提前结束读取 (关闭打开的数据文件)"""
+        if self._rows is not None:
+            self._rows.close()
+            self._rows = None
+
+
+def load_text_source(source_path):
+    """加载配文数据源 (只读取一遍文件；最近一个数据源按修改时间和大小缓存)
+
+    Returns:
+        TextSource
+    """
+    global _source_cache
+    stat = os.stat(source_path)
+    cached = _source_cache
+    if cached and cached[:3] == (source_path, stat.st_mtime, stat.st_size):
+        return cached[3]
+
+    mapping = {}
+    sequence = []
+    sequence_chars = 0
+    sequence_count = 0
+    for filename, content in iter_text_rows(source_path):
+        if filename is not None:
+            mapping[filename] = content
+            continue
+        sequence_count += 1
+        if sequence is not None:
+            sequence_chars += len(content)
+            if sequence_chars > SEQUENCE_CACHE_CHARS:
+                sequence = None  # 过大，改为使用时流式读取
+            else:
+                sequence.append(content)
+
+    source = TextSource(source_path, mapping, sequence_count, tuple(sequence) if sequence is not None else None)
+    _source_cache = (source_path, stat.st_mtime, stat.st_size, source)
+    return source
+
+
+def journal_path(source_path):
+    """读取记录文件路径"""
+    return source_path + JOURNAL_SUFFIX
+
+
+def record_read(source_path, mapping_count, sequential_count):
+    """追加一条读取记录 (替代回写 Excel 的"最后读取时间"列)
+
+    Returns:
+        bool: 是否写入成功
+    """
+    entry = {
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'source': os.path.basename(source_path),
+        'mapped': mapping_count,
+        'sequential': sequential_count,
+    }
+    try:
+        with open(journal_path(source_path), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return True
+    except Exception as e:
+        print(f"[ERROR] 无法写入读取记录: {e}")
+        return False
+
@@ -0,0 +1,268 @@
+"""
+分块缩放预览 - 在画布上按任意缩放比例 (包括 1:1) 查看导出尺寸的合成结果
+
+只渲染可见区域：视口按 TILE_SIZE 切成分块，每块通过 render_region(box) 只合成对应的
+场景区域；分块按 (缩放, 列, 行, 场景版本) 缓存，平移回来或切换缩放时直接复用。
+缺失的分块从视口中心向外逐块渲染，每次只占用一小段时间，界面保持响应。
+
+操作: 滚轮缩放 (以鼠标位置为中心)，拖拽平移，双击在 100% 和适应窗口之间切换，Esc 退出。
+"""
+
+import math
+import time
+from collections import OrderedDict
+
+from PIL import Image, ImageTk
+
+from app_log import log
+
+TILE_SIZE = 256
+ZOOM_STEPS = (0.125, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0)
+MAX_CACHED_TILES = 128
+RENDER_BUDGET_MS = 12  # 每次空闲回调中渲染分块的时间上限
+
+_TAG = 'zoom_preview'
+
+
+class TiledPreview:
+    """画布上的分块缩放预览 (覆盖在编辑内容之上)
+
+    Args:
+        canvas: tk.Canvas
+        scene_size: 场景 (导出) 尺寸 (width, height)
+        render_region: 渲染场景区域的函数，参数为 (x0, y0, x1, y1)，返回该区域的 PIL 图片
+        version: 场景版本，变化后旧分块失效
+    """
+
+    def __init__(self, canvas, scene_size, render_region, version=0):
+        self.canvas = canvas
+        self.scene_size = scene_size
+        self.render_region = render_region
+        self.version = version
+        self.zoom = 1.0
+        self.view_x = 0  # 视口左上角在缩放后场景中的位置 (像素)
+        self.view_y = 0
+        self._tiles = OrderedDict()  # (zoom, tx, ty, version) -> PhotoImage
+        self._items = {}             # 当前显示的 (tx, ty) -> 画布对象 ID
+        self._pending = []
+        self._failed = set()         # 渲染出错的分块 key (不再重试，场景或缩放变化后 key 不同)
+        self._job = None
+        self._drag_from = None
+        self._create_overlay()
+        self.zoom_to(self.fit_zoom())
+
+    # ---- 视口 ----
+
+    def _viewport(self):
+        return int(self.canvas.cget('width')), int(self.canvas.cget('height'))
+
+    def fit_zoom(self):
+        """完整显示场景的缩放比例"""
+        view_w, view_h = self._viewport()
+        scene_w, scene_h = self.scene_size
+        return min(view_w / scene_w, view_h / scene_h) if scene_w and scene_h else 1.0
+
+    def set_scene(self, scene_size, render_region, version):
+        """场景变化 (如编辑后重新进入预览)，保留当前缩放"""
+        self.render_region = render_region
+        if scene_size != self.scene_size or version != self.version:
+            self.scene_size = scene_size
+            self.version = version
+            self._clear_items()
+            self._clamp()
+            self.refresh()
+
+    def zoom_to(self, zoom, anchor=None):
+        """缩放到 zoom，anchor 为保持不动的画布坐标 (默认为视口中心)"""
+        view_w, view_h = self._viewport()
+        zoom = max(min(self.fit_zoom(), ZOOM_STEPS[0]), min(ZOOM_STEPS[-1], zoom))
+        ax, ay = anchor if anchor else (view_w / 2, view_h / 2)
+        scene_x = (self.view_x + ax) / self.zoom
+        scene_y = (self.view_y + ay) / self.zoom
+        if zoom != self.zoom:
+            self._clear_items()
+        self.zoom = zoom
+        self.view_x = int(round(scene_x * zoom - ax))
+        self.view_y = int(round(scene_y * zoom - ay))
+        self._clamp()
+        self.refresh()
+
+    def zoom_step(self, direction, anchor=None):
+        """按 ZOOM_STEPS 放大 (direction > 0) 或缩小一级，最小为适应窗口"""
+        fit = self.fit_zoom()
+        steps = sorted(set(ZOOM_STEPS) | {fit})
+        if direction > 0:
+            larger = [z for z in steps if z > self.zoom * 1.001]
+            target = larger[0] if larger else self.zoom
+        else:
+            smaller = [z for z in steps if z < self.zoom * 0.999 and z >= fit * 0.999]
+            target = smaller[-1] if smaller else self.zoom
+        self.zoom_to(target, anchor)
+
+    def pan(self, dx, dy):
+        """平移视口 (画布像素)"""
+        old_x, old_y = self.view_x, self.view_y
+        self.view_x -= dx
+        self.view_y -= dy
+        self._clamp()
+        moved_x, moved_y = old_x - self.view_x, old_y - self.view_y
+        if moved_x or moved_y:
+            self.canvas.move('zoom_tile', moved_x, moved_y)
+            self.refresh()
+
+    def _clamp(self):
+        """场景比视口小时居中，否则不超出场景边缘"""
+        view_w, view_h = self._viewport()
+        zoomed_w = math.ceil(self.scene_size[0] * self.zoom)
+        zoomed_h = math.ceil(self.scene_size[1] * self.zoom)
+        if zoomed_w <= view_w:
+            self.view_x = -((view_w - zoomed_w) // 2)
+        else:
+            self.view_x = max(0, min(zoomed_w - view_w, self.view_x))
+        if zoomed_h <= view_h:
+            self.view_y = -((view_h - zoomed_h) // 2)
+        else:
+            self.view_y = max(0, min(zoomed_h - view_h, self.view_y))
+
+    # ---- 分块 ----
+
+    def refresh(self):
+        """显示可见分块：已缓存的立即显示，其余排队渐进渲染"""
+        view_w, view_h = self._viewport()
+        zoomed_w = math.ceil(self.scene_size[0] * self.zoom)
+        zoomed_h = math.ceil(self.scene_size[1] * self.zoom)
+        tx0 = max(0, self.view_x // TILE_SIZE)
+        ty0 = max(0, self.view_y // TILE_SIZE)
+        tx1 = min((zoomed_w - 1) // TILE_SIZE, (self.view_x + view_w - 1) // TILE_SIZE)
+        ty1 = min((zoomed_h - 1) // TILE_SIZE, (self.view_y + view_h - 1) // TILE_SIZE)
+        visible = {(tx, ty) for tx in range(tx0, tx1 + 1) for ty in range(ty0, ty1 + 1)}
+
+        for pos in [p for p in self._items if p not in visible]:
+            self.canvas.delete(self._items.pop(pos))
+
+        missing = []
+        for pos in visible:
+            if pos in self._items:
+                continue
+            photo = self._cached(pos)
+            if photo is not None:
+                self._show(pos, photo)
+            elif self._key(pos) not in self._failed:
+                missing.append(pos)
+
+        # 从视口中心向外渲染
+        center_x = (self.view_x + view_w / 2) / TILE_SIZE - 0.5
+        center_y = (self.view_y + view_h / 2) / TILE_SIZE - 0.5
+        missing.sort(key=lambda p: (p[0] - center_x) ** 2 + (p[1] - center_y) ** 2)
+        self._pending = missing
+        self._update_label()
+        if missing and self._job is None:
+            self._job = self.canvas.after_idle(self._render_pending)
+
+    def _key(self, pos):
+        return (self.zoom, pos[0], pos[1], self.version)
+
+    def _cached(self, pos):
+        photo = self._tiles.get(self._key(pos))
+        if photo is not None:
+            self._tiles.move_to_end(self._key(pos))
+        return photo
+
+    def _render_pending(self):
+        self._job = None
+        deadline = time.perf_counter() + RENDER_BUDGET_MS / 1000
+        while self._pending:
+            pos = self._pending.pop(0)
+            if pos in self._items:
+                continue
+            try:
+                photo = ImageTk.PhotoImage(self._render_tile(*pos))
+            except Exception as e:
+                # 单个分块失败不影响其余分块，该块留空
+                log.debug("预览分块 %s 渲染失败: %s", pos, e)
+                self._failed.add(self._key(pos))
+                continue
+            self._tiles[self._key(pos)] = photo
+            while len(self._tiles) > MAX_CACHED_TILES:
+                self._tiles.popitem(last=False)
+            self._show(pos, photo)
+            if time.perf_counter() >= deadline:
+                break
+        if self._pending:
+            self._job = self.canvas.after(1, self._render_pending)
+        self._update_label()
+
+    def _render_tile(self, tx, ty):
+        """渲染分块：取对应的场景区域 (只合成该区域)，按缩放比例缩放到分块大小"""
+        zoom = self.zoom
+        scene_w, scene_h = self.scene_size
+        zx0, zy0 = tx * TILE_SIZE, ty * TILE_SIZE
+        zx1 = min(zx0 + TILE_SIZE, math.ceil(scene_w * zoom))
+        zy1 = min(zy0 + TILE_SIZE, math.ceil(scene_h * zoom))
+        fx0, fy0 = zx0 / zoom, zy0 / zoom
+        fx1, fy1 = min(scene_w, zx1 / zoom), min(scene_h, zy1 / zoom)
+        box = (int(fx0), int(fy0), min(scene_w, math.ceil(fx1)), min(scene_h, math.ceil(fy1)))
+        region = self.render_region(box)
+        size = (zx1 - zx0, zy1 - zy0)
+        if region.size == size:
+            return region
+        # 放大时用最近邻，便于看清像素细节
+        resample = Image.Resampling.NEAREST if zoom > 1 else Image.Resampling.BILINEAR
+        return region.resize(size, resample, box=(fx0 - box[0], fy0 - box[1], fx1 - box[0], fy1 - box[1]))
+
+    def _show(self, pos, photo):
+        item = self.canvas.create_image(pos[0] * TILE_SIZE - self.view_x, pos[1] * TILE_SIZE - self.view_y,
+                                        image=photo, anchor='nw', tags=(_TAG, 'zoom_tile'))
+        self._items[pos] = item
+        self.canvas.tag_raise('zoom_label')
+
+    def _clear_items(self):
+        self.canvas.delete('zoom_tile')
+        self._items.clear()
+
+    # ---- 画布上的覆盖层 ----
+
+    def _create_overlay(self):
+        view_w, view_h = self._viewport()
+        self.canvas.create_rectangle(0, 0, view_w, view_h, fill='#808080', outline='', tags=(_TAG, 'zoom_bg'))
+        self.canvas.create_text(8, 8, anchor='nw', fill='white', font=('Arial', 11, 'bold'),
+                                tags=(_TAG, 'zoom_label'))
+        self.canvas.tag_raise(_TAG)
+
+    def _update_label(self):
+        status = f'  渲染中 {len(self._pending)} 块' if self._pending else ''
+        failed = sum(1 for key in self._failed if key[0] == self.zoom and key[3] == self.version)
+        if failed:
+            status += f'  {failed} 块渲染失败'
+        self.canvas.itemconfigure('zoom_label', text=f'{self.zoom * 100:.0f}%  (Esc 退出){status}')
+
+    def close(self):
+        if self._job is not None:
+            self.canvas.after_cancel(self._job)
+            self._job = None
+        self.canvas.delete(_TAG)
+        self._items.clear()
+        self._tiles.clear()
+        self._failed.clear()
+
+    # ---- 鼠标 ----
+
+    def on_press(self, event):
+        self._drag_from = (event.x, event.y)
+
+    def on_drag(self, event):
+        if self._drag_from is not None:
+            self.pan(event.x - self._drag_from[0], event.y - self._drag_from[1])
+            self._drag_from = (event.x, event.y)
+
+    def on_release(self, event):
+        self._drag_from = None
+
+    def on_wheel(self, event):
+        # Windows/macOS 为 <MouseWheel> (delta 正负)，Linux 为 Button-4 / Button-5
+        direction = 1 if getattr(event, 'num', None) == 4 or getattr(event, 'delta', 0) > 0 else -1
+        self.zoom_step(direction, (event.x, event.y))
+
+    def on_double_click(self, event):
+        target = self.fit_zoom() if abs(self.zoom - 1.0) < 1e-6 else 1.0
+        self.zoom_to(target, (event.x, event.y))
@@ -0,0 +1,306 @@
+"""
+分块渲染模块 - 大尺寸打印输出 (如 7000x10000 的海报) 的低内存合成与保存
+
+LayerCompositor 按整幅尺寸缓存各图层 (背景、主图片、贴纸、边框各一幅 RGBA，外加遮罩和合成结果)，
+输出几千万像素时内存可达数 GB。TiledScene 只按区域合成：背景图案、边框和遮罩按整幅坐标
+平移后绘制到区域大小的图片上 (区域外的图形直接跳过)，主图片从金字塔中取对应的源区域缩放，
+文字层只渲染一次后裁剪粘贴。图层顺序和合成方式与 LayerCompositor 相同。
+背景、边框、贴纸和文字与整幅合成逐像素相同；主图片按条带缩放，与整幅缩放相比少量像素有 ±1~2 的舍入差异。
+
+导出时按水平条带自上而下合成：PNG 边合成边压缩写入文件，整幅图片不在内存中出现；
+JPEG / WebP 编码器需要完整图片，条带依次拼入一幅输出图片后编码。DPI 写入文件元数据。
+放大预览 (tiled_preview) 也可以直接用 render_region 渲染可见分块；批量渲染 (batch_renderer) 在大尺寸预设下
+每项合成为 TiledScene，同样按条带保存。
+"""
+
+import math
+import os
+
+from PIL import Image, ImageChops, ImageDraw
+
+import image_encoder
+from compositor import has_border, is_rounded_border, paste_region
+from image_processor import (CompositeImage, alpha_paste, border_params, draw_solid_border, image_pyramid,
+                             make_border_mask, make_pattern_layer)
+
+# 超过此像素数 (约 24MP，如 300dpi 的 A2 / A1 海报) 的导出按条带渲染
+TILED_RENDER_PIXELS = 24_000_000
+# 每个条带的像素数 (RGBA 条带约 16MB)
+STRIP_PIXELS = 1 << 22
+MIN_STRIP_ROWS = 16
+
+
+def should_tile(width, height):
+    """输出尺寸是否需要分块渲染"""
+    return width * height > TILED_RENDER_PIXELS
+
+
+class _OffsetDraw:
+    """按整幅坐标绘制到区域图片上的 ImageDraw 包装 (坐标减去区域左上角，区域外的图形跳过)"""
+
+    def __init__(self, draw, x0, y0, size):
+        self._draw = draw
+        self._x0, self._y0 = x0, y0
+        self._width, self._height = size
+
+    def _shift(self, xy):
+        if isinstance(xy[0], (tuple, list)):
+            return [(x - self._x0, y - self._y0) for x, y in xy]
+        return [v - (self._y0 if i % 2 else self._x0) for i, v in enumerate(xy)]
+
+    def _outside(self, xy, margin):
+        if isinstance(xy[0], (tuple, list)):
+            xs = [p[0] for p in xy]
+            ys = [p[1] for p in xy]
+        else:
+            xs, ys = xy[0::2], xy[1::2]
+        return (max(xs) < -margin or min(xs) >= self._width + margin
+                or max(ys) < -margin or min(ys) >= self._height + margin)
+
+    def _shape(self, method, xy, kwargs):
+        shifted = self._shift(xy)
+        if not self._outside(shifted, kwargs.get('width', 1) + 1):
+            getattr(self._draw, method)(shifted, **kwargs)
+
+    def line(self, xy, **kwargs):
+        self._shape('line', xy, kwargs)
+
+    def ellipse(self, xy, **kwargs):
+        self._shape('ellipse', xy, kwargs)
+
+    def polygon(self, xy, **kwargs):
+        self._shape('polygon', xy, kwargs)
+
+    def rectangle(self, xy, **kwargs):
+        # 边框的矩形覆盖整幅，始终绘制 (区域外的部分由 ImageDraw 裁掉)
+        self._draw.rectangle(self._shift(xy), **kwargs)
+
+    def rounded_rectangle(self, xy, **kwargs):
+        self._draw.rounded_rectangle(self._shift(xy), **kwargs)
+
+
+class TiledScene:
+    """按区域合成的场景 (各参数均为输出分辨率)
+
+    Args:
+        width, height: 输出尺寸
+        background: (底色, 图案, 图案颜色, 图案大小)
+        main: (原图, (宽, 高), (x, y))，主图片缩放后的尺寸和左上角位置，None 为没有主图片
+        stickers: [(emoji, x, y, size)]
+        border: 已按输出分辨率缩放的边框配置
+        text: (渲染好的文字图片, (x, y))，None 为没有文字
+    """
+
+    def __init__(self, width, height, background, main=None, stickers=(), border=None, text=None):
+        self.width = width
+        self.height = height
+        self.background = background
+        self.main = main
+        self.stickers = tuple(stickers)
+        self.border = border if has_border(border) else None
+        self.rounded = self.border is not None and is_rounded_border(self.border)
+        self.text = text if text and text[0] is not None else None
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def mode(self):
+        """合成结果的模式 (圆角边框裁掉四角后带透明区域)"""
+        return 'RGBA' if self.rounded else 'RGB'
+
+    # ---- 各图层的区域渲染 ----
+
+    @staticmethod
+    def _padded_box(box, pattern_size):
+        """绘制图案用的区域：向左上多留几个图案大小
+
+        ImageDraw 对负的小数坐标取整方向与正坐标不同，跨过区域左/上边缘的多边形、椭圆直接平移后
+        会差一个像素；多留的部分让与区域相交的图形坐标都不为负，画完再裁掉。
+        """
+        pad = 4 * max(pattern_size, 10)
+        return max(0, box[0] - pad), max(0, box[1] - pad), box[2], box[3]
+
+    def _render_background(self, box):
+        color, pattern, pattern_color, pattern_size = self.background
+        padded = self._padded_box(box, pattern_size)
+        composite = CompositeImage(padded[2] - padded[0], padded[3] - padded[1], bg_color=color)
+        # 图案按整幅尺寸和坐标绘制
+        composite.width, composite.height = self.width, self.height
+        composite.draw = _OffsetDraw(composite.draw, padded[0], padded[1], composite.canvas.size)
+        composite.draw_background_pattern(pattern, pattern_color, pattern_size)
+        return _crop_to(composite.canvas, padded, box)
+
+    def _render_pattern(self, box, bg_color, pattern, color, pattern_size):
+        """边框图案层的区域 (与 _border_pattern_layer 一致)"""
+        padded = self._padded_box(box, pattern_size)
+        size = (padded[2] - padded[0], padded[3] - padded[1])
+        layer = make_pattern_layer(size, self.width, self.height, bg_color, pattern, color, pattern_size,
+                                   draw=lambda image: _OffsetDraw(ImageDraw.Draw(image), padded[0], padded[1], size))
+        return _crop_to(layer, padded, box)
+
+    def _render_main(self, box):
+        """主图片与区域相交的部分: (图片, (x, y))，x, y 相对区域左上角"""
+        if self.main is None:
+            return None
+        image, (w, h), (px, py) = self.main
+        c0, r0 = max(box[0], px), max(box[1], py)
+        c1, r1 = min(box[2], px + w), min(box[3], py + h)
+        if c0 >= c1 or r0 >= r1:
+            return None
+        source = image_pyramid(image).source_for(w, h)
+        if source.size == (w, h):
+            part = source.crop((c0 - px, r0 - py, c1 - px, r1 - py))
+        else:
+            # box 为浮点源区域，滤波仍会取到区域外的像素，各区域拼起来与整幅缩放基本一致：
+            # 浮点 box 的采样权重与整幅缩放的舍入略有不同，约 0.1% 的像素每通道相差 1
+            # (半透明主图片与背景混合后最多相差 2)，肉眼不可见
+            fx, fy = source.width / w, source.height / h
+            part = source.resize((c1 - c0, r1 - r0), Image.Resampling.LANCZOS,
+                                 box=((c0 - px) * fx, (r0 - py) * fy, (c1 - px) * fx, (r1 - py) * fy))
+        if part.mode != image.mode:
+            part = part.convert(image.mode)
+        return part, (c0 - box[0], r0 - box[1])
+
+    def _render_stickers(self, box, size):
+        composite = None
+        for emoji, x, y, sticker_size in self.stickers:
+            if (x + sticker_size <= box[0] or x - sticker_size >= box[2]
+                    or y + sticker_size <= box[1] or y - sticker_size >= box[3]):
+                continue
+            if composite is None:
+                composite = CompositeImage(*size, bg_color=(0, 0, 0, 0), mode='RGBA')
+            composite.add_sticker(emoji, x - box[0], y - box[1], sticker_size)
+        return composite.canvas if composite else None
+
+    def _render_border(self, box, size):
+        """边框层 (RGBA) 和圆角裁切遮罩 (L，非圆角边框为 None)，与 add_border / add_rounded_border 一致"""
+        border = self.border
+        if border is None:
+            return None, None
+        width, height = self.width, self.height
+        border_width, color, radius, fill = border_params(border, self.rounded)
+
+        def offset_draw(image):
+            return _OffsetDraw(ImageDraw.Draw(image), box[0], box[1], size)
+
+        layer = Image.new('RGBA', size, (0, 0, 0, 0))
+        if fill is None:
+            draw_solid_border(offset_draw(layer), width, height, border_width, color, radius)
+        else:
+            mask = make_border_mask('rounded' if self.rounded else 'rect', size, width, height, border_width,
+                                    radius, draw=offset_draw)
+            layer.paste(self._render_pattern(box, *fill), (0, 0), mask)
+        if not self.rounded:
+            return layer, None
+        clip = make_border_mask('rounded_content', size, width, height, border_width, radius, draw=offset_draw)
+        return layer, clip
+
+    # ---- 合成 ----
+
+    def render_region(self, box):
+        """合成 box (x0, y0, x1, y1) 区域 (新图片，模式为 self.mode)"""
+        box = (max(0, box[0]), max(0, box[1]), min(self.width, box[2]), min(self.height, box[3]))
+        size = (box[2] - box[0], box[3] - box[1])
+        base = self._render_background(box)
+        main = self._render_main(box)
+        if main is not None:
+            alpha_paste(base, main[0], *main[1])
+        stickers = self._render_stickers(box, size)
+        if stickers is not None:
+            alpha_paste(base, stickers, 0, 0)
+        border, clip = self._render_border(box, size)
+        if clip is not None:
+            base = base.convert('RGBA')
+            base.putalpha(ImageChops.multiply(base.getchannel('A'), clip))
+        if border is not None:
+            alpha_paste(base, border, 0, 0)
+        if self.text is not None:
+            paste_region(base, self.text[0], self.text[1], box)
+        return base
+
+    def sample(self, grid=16):
+        """grid x grid 的取样缩略图 (每格取中心一个像素)，用于估算整幅亮度等统计，不渲染整幅图片"""
+        thumb = Image.new(self.mode, (grid, grid))
+        for j in range(grid):
+            y = (2 * j + 1) * self.height // (2 * grid)
+            for i in range(grid):
+                x = (2 * i + 1) * self.width // (2 * grid)
+                thumb.paste(self.render_region((x, y, x + 1, y + 1)), (i, j))
+        return thumb
+
+    def save(self, file_path, profile=None, output_format=None, dpi=None):
+        """与 CompositeImage.save 相同的接口 (批量流水线中两种合成结果通用)
+
+        保存成功后 saved_path 为实际保存路径，saved_bytes 为编码后的字节数
+        """
+        try:
+            self.saved_path, self.saved_bytes = save_scene(self, file_path, profile, output_format, dpi)
+            return True
+        except Exception as e:
+            print(f"保存图片失败: {e}")
+            return False
+
+    def strip_rows(self):
+        return max(MIN_STRIP_ROWS, STRIP_PIXELS // max(1, self.width))
+
+    def strips(self, progress=None):
+        """自上而下依次产生 (y, 条带图片)
+
+        Args:
+            progress: progress(done, total)，每个条带开始前调用 (可抛出异常中止)
+        """
+        rows = self.strip_rows()
+        total = math.ceil(self.height / rows)
+        for i, y in enumerate(range(0, self.height, rows)):
+            if progress:
+                progress(i, total)
+            yield y, self.render_region((0, y, self.width, min(self.height, y + rows)))
+
+
+def _crop_to(image, image_box, box):
+    """image 覆盖 image_box，裁出 box 部分"""
+    if image_box == box:
+        return image
+    return image.crop((box[0] - image_box[0], box[1] - image_box[1], box[2] - image_box[0], box[3] - image_box[1]))
+
+
+def render_to_file(scene, file_path, profile=None, dpi=None, progress=None):
+    """按条带合成并保存 (PNG 逐条压缩写入，其他格式拼成一幅后编码)
+
+    Returns:
+        int: 编码后的字节数
+    """
+    fmt = image_encoder.format_for_path(file_path)
+    if fmt == 'png':
+        return image_encoder.write_png_strips(file_path, scene.size, scene.mode, scene.strips(progress),
+                                              profile, dpi)
+    # JPEG 不支持透明：逐条填充白底，不再为整幅图片另做一份转换
+    output = None
+    for y, strip in scene.strips(progress):
+        strip = image_encoder.prepare_image(strip, fmt)
+        if output is None:
+            output = Image.new(strip.mode, scene.size)
+        output.paste(strip, (0, y))
+    return image_encoder.encode_image(output, file_path, profile, dpi)
+
+
+def save_scene(scene, file_path, profile=None, output_format=None, dpi=None):
+    """按输出格式保存 (与 image_encoder.save_as 相同，扩展名随格式调整)
+
+    量化 PNG 和自动格式要比较整幅图片的编码结果，条带拼成一幅后交给 save_as；其他格式按条带保存。
+
+    Returns:
+        (path, size): 实际保存路径和字节数
+    """
+    if output_format in ('auto', 'png8'):
+        image = None
+        for y, strip in scene.strips():
+            if image is None:
+                image = Image.new(strip.mode, scene.size)
+            image.paste(strip, (0, y))
+        return image_encoder.save_as(image, file_path, profile, output_format, dpi=dpi)
+    if output_format not in (None, 'source'):
+        file_path = os.path.splitext(file_path)[0] + image_encoder.FORMAT_EXTENSIONS[output_format]
+    return file_path, render_to_file(scene, file_path, profile, dpi)